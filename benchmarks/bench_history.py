@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+'''
+Compares the single-pass history walk used by the indexer against the
+previous approach of running one path-limited Walker per page.
+
+Run with ``python -m benchmarks.bench_history``. Walking every page with
+the per-page approach takes hours on large repositories, so only a sample
+of the pages is walked and the total is extrapolated from it.
+'''
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from posixpath import dirname
+
+from dulwich.repo import Repo
+from dulwich.walk import Walker
+
+from gitpages.storage import git as git_storage
+from gitpages.util.compat import _text_to_bytes
+
+from .synthetic import RepositoryParameters, generate_repository
+
+
+def walk_per_page(repo, head, paths):
+
+    return dict(
+        (
+            path,
+            [
+                e.commit for e in Walker(
+                    store=repo.object_store,
+                    include=[head],
+                    paths=[_text_to_bytes(dirname(path))],
+                    follow=True,
+                )
+            ],
+        )
+        for path in paths
+    )
+
+
+def walk_single_pass(repo, head, paths):
+    return git_storage.find_page_revisions(repo, head, paths=set(paths))
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return time.perf_counter() - start, result
+
+
+def run(repo, sample, seed=0):
+
+    head = repo.refs[b'HEAD']
+    pages_tree = git_storage.get_pages_tree(repo)
+    paths = [p.path for p in git_storage.find_pages(repo, pages_tree)]
+
+    sampled = random.Random(seed).sample(paths, min(sample, len(paths)))
+
+    per_page_time, per_page = timed(walk_per_page, repo, head, sampled)
+    single_pass_time, single_pass = timed(walk_single_pass, repo, head, paths)
+
+    for path in sampled:
+        assert (
+            [c.id for c in per_page[path]] ==
+            [r.commit.id for r in single_pass.get(path, [])]
+        ), path
+
+    per_page_total = per_page_time * len(paths) / len(sampled)
+
+    print('pages:                      {:>10d}'.format(len(paths)))
+    print('sampled pages:              {:>10d}'.format(len(sampled)))
+    print('per-page walk, sample:      {:>10.2f} s'.format(per_page_time))
+    print('per-page walk, extrapolated:{:>10.2f} s'.format(per_page_total))
+    print('single-pass walk, all pages:{:>10.2f} s'.format(single_pass_time))
+    print('speedup:                    {:>10.1f} x'.format(
+        per_page_total / single_pass_time
+    ))
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--pages', type=int, default=1000)
+    parser.add_argument('--commits', type=int, default=10000)
+    parser.add_argument('--sample', type=int, default=10,
+                        help='number of pages to walk one at a time')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repository', metavar='PATH',
+                        help='reuse or create the repository at PATH')
+    args = parser.parse_args(argv)
+
+    parameters = RepositoryParameters(
+        pages=args.pages,
+        commits=args.commits,
+        seed=args.seed,
+    )
+
+    with tempfile.TemporaryDirectory() as temp:
+
+        path = args.repository or os.path.join(temp, 'repository')
+
+        if os.path.isdir(path):
+            repo = Repo(path)
+        else:
+            print('generating {} ...'.format(parameters))
+            generate_time, repo = timed(generate_repository, path, parameters)
+            print('generated in {:.2f} s'.format(generate_time))
+
+        try:
+            run(repo, args.sample, args.seed)
+        finally:
+            repo.close()
+
+
+if __name__ == '__main__':
+    main()
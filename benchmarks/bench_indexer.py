@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+
+'''
+Measures :func:`gitpages.indexer.build_hybrid_index` on a synthetic
+repository, end to end and broken down into the stages it goes through.
+
+Run with ``python -m benchmarks.bench_indexer``. Pass ``--save PATH`` to
+record the results as a baseline and ``--compare PATH`` to report the
+change against a baseline recorded earlier; the command exits with status
+1 when a timing regresses by more than ``--tolerance``.
+'''
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from cachelib import SimpleCache
+from dulwich.repo import Repo
+from whoosh.query import Every
+
+from gitpages import indexer
+from gitpages.schema import DateRevisionHybrid
+from gitpages.storage import git as git_storage
+
+from .synthetic import RepositoryParameters, generate_repository
+
+
+BASELINE_FORMAT = 1
+
+# stages in the order build_hybrid_index runs them
+STAGES = ('find pages', 'history', 'render', 'write')
+
+# results where a larger value is worse, compared against a baseline
+_COMPARED = ('build',) + STAGES + ('peak rss', 'index size')
+
+# timings shorter than this are too noisy to call a regression
+_MIN_SECONDS = 0.05
+
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    result = f(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def peak_rss() -> int:
+    '''
+    Returns the peak resident set size of this process in bytes.
+    '''
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes everywhere but macOS, which reports bytes
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _dirs, names in os.walk(path)
+        for name in names
+    )
+
+
+def new_index(path: str):
+    return indexer.get_index(path, 'index', schema=DateRevisionHybrid())
+
+
+def build(repo: Repo, path: str, jobs: int) -> float:
+    '''
+    Builds a fresh index at `path` with :func:`build_hybrid_index`.
+    '''
+
+    index = new_index(path)
+
+    try:
+        seconds, _result = timed(
+            indexer.build_hybrid_index,
+            index,
+            repo,
+            jobs=jobs,
+        )
+    finally:
+        index.close()
+
+    return seconds
+
+
+def build_by_stage(repo: Repo, path: str) -> Dict[str, float]:
+    '''
+    Builds a fresh index at `path` the way :func:`build_hybrid_index` does
+    serially, timing each stage separately. The documents are rendered
+    into a buffer first so that writing them to the index can be timed on
+    its own.
+    '''
+
+    stages = {}
+    head = repo.refs[b'HEAD']
+    render_cache = SimpleCache(threshold=1000, default_timeout=0)
+
+    def find_pages():
+        pages_tree = git_storage.get_pages_tree(repo)
+        return list(git_storage.find_pages(repo, pages_tree))
+
+    stages['find pages'], pages = timed(find_pages)
+
+    stages['history'], revisions = timed(
+        git_storage.find_page_revisions,
+        repo,
+        head,
+        paths=set(p.path for p in pages),
+    )
+
+    page_jobs = [
+        indexer.PageJob(
+            path=page.path,
+            page_blob_id=page.entry.sha,
+            page_tree_id=page.tree.id,
+            revisions=[
+                (r.commit.id, r.path) for r in revisions.get(page.path, ())
+            ],
+        )
+        for page in pages
+    ]
+
+    def render():
+        groups = []
+        for job in page_jobs:
+            buffer = indexer.DocumentBuffer()
+            indexer.write_page_group(buffer, repo, job, render_cache)
+            groups.append(buffer.documents)
+        return groups
+
+    stages['render'], groups = timed(render)
+
+    def write():
+        index = new_index(path)
+        try:
+            with index.writer() as index_writer:
+                # fits the documents to the layout of the index, as
+                # build_hybrid_index does
+                writer = indexer.LayoutWriter(
+                    index_writer,
+                    index_writer.schema,
+                )
+                writer.delete_by_query(Every())
+                for documents in groups:
+                    with writer.group():
+                        for document in documents:
+                            writer.add_document(**document)
+            indexer.set_indexed_commit(index, head)
+        finally:
+            index.close()
+
+    stages['write'], _result = timed(write)
+
+    return stages
+
+
+def run(repo: Repo, workdir: str, jobs: int=1) -> Dict:
+
+    pages_tree = git_storage.get_pages_tree(repo)
+    pages = sum(1 for _page in git_storage.find_pages(repo, pages_tree))
+
+    build_path = os.path.join(workdir, 'build')
+    stages_path = os.path.join(workdir, 'stages')
+
+    build_seconds = build(repo, build_path, jobs)
+    index_size = directory_size(build_path)
+    stages = build_by_stage(repo, stages_path)
+
+    return {
+        'pages': pages,
+        'jobs': jobs,
+        'build': build_seconds,
+        'pages/s': pages / build_seconds,
+        'stages': stages,
+        'peak rss': peak_rss(),
+        'index size': index_size,
+    }
+
+
+def _flatten(results: Dict) -> Dict[str, float]:
+
+    flat = dict(
+        (key, value) for key, value in results.items()
+        if not isinstance(value, dict)
+    )
+    flat.update(results.get('stages', {}))
+
+    return flat
+
+
+def _format_value(key: str, value: float) -> str:
+
+    if key in ('peak rss', 'index size'):
+        return '{:>10.1f} MiB'.format(value / (1 << 20))
+    if key == 'pages/s':
+        return '{:>10.1f}'.format(value)
+    if isinstance(value, int):
+        return '{:>10d}'.format(value)
+    return '{:>10.3f} s'.format(value)
+
+
+def report(results: Dict, baseline: Dict=None) -> List[str]:
+    '''
+    Prints `results`, along with the relative change from `baseline` when
+    one is given, and returns the keys that regressed by more than the
+    baseline's tolerance.
+    '''
+
+    flat = _flatten(results)
+    base = _flatten(baseline['results']) if baseline else {}
+    tolerance = baseline['tolerance'] if baseline else 0.0
+    regressions = []
+
+    for key in (
+            ('pages', 'jobs', 'build', 'pages/s') + STAGES +
+            ('peak rss', 'index size')
+    ):
+        line = '{:<12}{}'.format(key + ':', _format_value(key, flat[key]))
+        if key in base and base[key]:
+            change = (flat[key] - base[key]) / base[key]
+            line += '  {:>+7.1%}'.format(change)
+            if (
+                    key in _COMPARED and change > tolerance and
+                    not (key in ('build',) + STAGES and
+                         max(flat[key], base[key]) < _MIN_SECONDS)
+            ):
+                regressions.append(key)
+                line += '  REGRESSION'
+        print(line)
+
+    return regressions
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--commits', type=int, default=2000)
+    parser.add_argument('--paragraphs', type=int, default=4)
+    parser.add_argument('--attachments', type=int, default=2,
+                        help='attachments per page')
+    parser.add_argument('--attachment-size', type=int, default=16384,
+                        help='size of each attachment in bytes')
+    parser.add_argument('--rename-rate', type=float, default=0.02)
+    parser.add_argument('--status-rate', type=float, default=0.05)
+    parser.add_argument('--attachment-edit-rate', type=float, default=0.2,
+                        help='share of edits that only replace attachments')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--repository', metavar='PATH',
+                        help='reuse or create the repository at PATH')
+    parser.add_argument('--save', metavar='PATH',
+                        help='save the results as a baseline to PATH')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='compare the results with the baseline at PATH')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    parameters = RepositoryParameters(
+        pages=args.pages,
+        commits=args.commits,
+        paragraphs=args.paragraphs,
+        attachments=args.attachments,
+        attachment_size=args.attachment_size,
+        rename_rate=args.rename_rate,
+        status_rate=args.status_rate,
+        attachment_edit_rate=args.attachment_edit_rate,
+        seed=args.seed,
+    )
+
+    baseline = None
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('format') != BASELINE_FORMAT:
+            parser.error('unsupported baseline format in ' + args.compare)
+        if baseline['parameters'] != parameters._asdict():
+            print('warning: the baseline was recorded with {}'.format(
+                RepositoryParameters(**baseline['parameters'])
+            ))
+        baseline['tolerance'] = args.tolerance
+
+    with tempfile.TemporaryDirectory() as temp:
+
+        path = args.repository or os.path.join(temp, 'repository')
+
+        if os.path.isdir(path):
+            repo = Repo(path)
+        else:
+            print('generating {} ...'.format(parameters))
+            generate_time, repo = timed(generate_repository, path, parameters)
+            print('generated in {:.2f} s'.format(generate_time))
+
+        try:
+            results = run(repo, temp, args.jobs)
+        finally:
+            repo.close()
+
+    regressions = report(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(
+                {
+                    'format': BASELINE_FORMAT,
+                    'parameters': parameters._asdict(),
+                    'results': results,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        print('saved baseline to {}'.format(args.save))
+
+    if regressions:
+        print('regressed: {}'.format(', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+'''
+Compares the hybrid index layout, which nests the revisions and
+attachments of a page in its writer group and joins them with
+``NestedChildren``, against the tables layout, which links them to their
+page by keys. Both indexes are built from the same synthetic repository,
+then the queries that serve a page view are timed on each.
+
+Run with ``python -m benchmarks.bench_layout``.
+'''
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from cachelib import SimpleCache
+from dulwich.repo import Repo
+
+from gitpages import indexer
+from gitpages.schema import INDEX_LAYOUTS
+from gitpages.web.api import GitPages
+
+from .bench_indexer import directory_size, timed
+from .synthetic import RepositoryParameters, generate_repository
+
+
+STATUSES = frozenset(('published', 'draft'))
+
+
+def build(repo: Repo, path: str, layout: str, render_cache, jobs: int):
+
+    index = indexer.get_index(path, 'index', INDEX_LAYOUTS[layout]())
+
+    seconds, _result = timed(
+        indexer.build_hybrid_index,
+        index,
+        repo,
+        render_cache=render_cache,
+        jobs=jobs,
+    )
+
+    return index, seconds
+
+
+def page_queries(gitpages: GitPages, page: Dict) -> Dict[str, Callable]:
+    '''
+    Returns the queries made to serve `page` and its oldest revision.
+    '''
+
+    date = page['page_date']
+    slug = page['page_slug']
+    path = page['page_path']
+    tree_id = page['page_history'][-1]['revision_tree_id']
+    # the page may have been renamed since
+    revision_path = gitpages.page(date, slug, tree_id, STATUSES).info.path
+
+    def history():
+        info = gitpages.page(date, slug, statuses=STATUSES)
+        return len(gitpages.history(info, 1, statuses=STATUSES))
+
+    return {
+        'page': lambda: gitpages.page(date, slug, statuses=STATUSES),
+        'revision': lambda: gitpages.page(date, slug, tree_id, STATUSES),
+        'history': history,
+        'attachments': lambda: list(
+            gitpages.attachments(date, slug, statuses=STATUSES)
+        ),
+        'revision attachments': lambda: list(
+            gitpages.attachments_by_path(revision_path, tree_id)
+        ),
+        'attachments by path': lambda: list(
+            gitpages.attachments_by_path(path)
+        ),
+    }
+
+
+def time_queries(
+        repo: Repo,
+        index,
+        pages: List[Dict],
+        repeat: int,
+) -> Dict[str, List[float]]:
+
+    timings: Dict[str, List[float]] = {}
+
+    with index.searcher() as searcher:
+
+        gitpages = GitPages(repo, searcher)
+
+        for page in pages:
+            for name, query in page_queries(gitpages, page).items():
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    query()
+                    timings.setdefault(name, []).append(
+                        time.perf_counter() - start
+                    )
+
+    return timings
+
+
+def run(repo: Repo, workdir: str, sample: int, repeat: int, jobs: int,
+        seed: int=0):
+
+    render_cache = SimpleCache(threshold=1 << 20, default_timeout=0)
+    indexes = {}
+
+    for layout in sorted(INDEX_LAYOUTS):
+        path = os.path.join(workdir, layout)
+        index, seconds = build(repo, path, layout, render_cache, jobs)
+        indexes[layout] = index
+        print('{:<8} build {:>8.2f} s, {:>6.1f} MiB, {:>8d} docs'.format(
+            layout,
+            seconds,
+            directory_size(path) / (1 << 20),
+            index.doc_count(),
+        ))
+
+    with indexes['hybrid'].searcher() as searcher:
+        pages = [
+            fields for fields in searcher.documents(kind='page')
+            if fields['page_history']
+        ]
+
+    pages = random.Random(seed).sample(pages, min(sample, len(pages)))
+
+    results = dict(
+        (layout, time_queries(repo, index, pages, repeat))
+        for layout, index in indexes.items()
+    )
+
+    for index in indexes.values():
+        index.close()
+
+    print('')
+    print('{:<22}{:>14}{:>14}{:>10}'.format(
+        'median latency', 'hybrid ms', 'tables ms', 'speedup',
+    ))
+
+    for name in results['hybrid']:
+        hybrid = statistics.median(results['hybrid'][name]) * 1000
+        tables = statistics.median(results['tables'][name]) * 1000
+        print('{:<22}{:>14.3f}{:>14.3f}{:>9.2f}x'.format(
+            name, hybrid, tables, hybrid / tables,
+        ))
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--commits', type=int, default=2000)
+    parser.add_argument('--attachments', type=int, default=2,
+                        help='attachments per page')
+    parser.add_argument('--sample', type=int, default=50,
+                        help='number of pages whose queries are timed')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='times each query is repeated')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--repository', metavar='PATH',
+                        help='reuse or create the repository at PATH')
+    args = parser.parse_args(argv)
+
+    parameters = RepositoryParameters(
+        pages=args.pages,
+        commits=args.commits,
+        attachments=args.attachments,
+        seed=args.seed,
+    )
+
+    with tempfile.TemporaryDirectory() as temp:
+
+        path = args.repository or os.path.join(temp, 'repository')
+
+        if os.path.isdir(path):
+            repo = Repo(path)
+        else:
+            print('generating {} ...'.format(parameters))
+            generate_time, repo = timed(generate_repository, path, parameters)
+            print('generated in {:.2f} s'.format(generate_time))
+
+        try:
+            run(repo, temp, args.sample, args.repeat, args.jobs, args.seed)
+        finally:
+            repo.close()
+
+
+if __name__ == '__main__':
+    main()
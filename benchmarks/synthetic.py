@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+'''
+Generates synthetic GitPages repositories laid out the way
+:mod:`gitpages.storage.git` expects them, for use by the benchmarks.
+'''
+
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from dulwich.objects import Blob, Commit, Tree, ShaFile
+from dulwich.repo import Repo
+
+from gitpages.storage.git import (
+    ATTACHMENTS_TREE,
+    ATTACHMENT_DATA,
+    ATTACHMENT_METADATA_RST,
+    PAGES_TREE_BYTES,
+    PAGE_RST_BYTES,
+)
+
+
+_TREE_MODE, _BLOB_MODE = 0o040000, 0o100644
+
+_EPOCH = datetime(2010, 1, 1)
+
+_PAGE_RST = u'''\
+{title}
+{underline}
+
+:Author: Benchmark Author
+:date: {date}
+:status: {status}
+
+Revision {revision} of a synthetic page.
+
+{body}
+'''
+
+_ATTACHMENT_METADATA_RST = u'''\
+:content-disposition: attachment; filename={filename}
+:content-type: application/octet-stream
+'''
+
+_STATUSES = (u'published', u'draft')
+
+_BODY_PARAGRAPH = (
+    u'Lorem ipsum dolor sit amet, *consectetur* adipiscing elit, sed do '
+    u'eiusmod tempor incididunt ut ``labore`` et dolore magna aliqua.\n\n'
+)
+
+
+class RepositoryParameters(NamedTuple):
+
+    pages: int
+    commits: int
+    paragraphs: int = 4
+    attachments: int = 0
+    attachment_size: int = 4096
+    rename_rate: float = 0.0
+    status_rate: float = 0.0
+    attachment_edit_rate: float = 0.0
+    seed: int = 0
+
+
+def page_rst(
+        number: int,
+        revision: int,
+        paragraphs: int,
+        status: str=u'published',
+) -> bytes:
+
+    title = u'Synthetic Page {}'.format(number)
+    date = _EPOCH + timedelta(hours=number)
+
+    return _PAGE_RST.format(
+        title=title,
+        underline=u'=' * len(title),
+        date=date.isoformat(),
+        status=status,
+        revision=revision,
+        body=_BODY_PARAGRAPH * paragraphs,
+    ).encode('utf-8')
+
+
+def page_name(number: int, generation: int=0) -> bytes:
+
+    name = u'synthetic-page-{:06d}'.format(number)
+
+    if generation:
+        name += u'-{}'.format(generation)
+
+    return name.encode('ascii')
+
+
+def attachment_name(number: int) -> bytes:
+    return u'attachment-{:03d}.bin'.format(number).encode('ascii')
+
+
+def generate_repository(
+        path: str,
+        parameters: RepositoryParameters,
+        batch_size: int=500,
+) -> Repo:
+    '''
+    Creates a repository at `path` whose history consists of
+    `parameters.commits` commits. The pages are created evenly across the
+    history and every commit that does not create a page edits a randomly
+    chosen existing one. Instead of being edited, a page is renamed with
+    probability `parameters.rename_rate`, and an edit toggles the page
+    between published and draft with probability `parameters.status_rate`.
+    Each page is created with `parameters.attachments` attachments of random
+    data, which an edit replaces instead of changing the page text with
+    probability `parameters.attachment_edit_rate`. Objects are written in
+    packs of `batch_size` commits.
+    '''
+
+    rng = random.Random(parameters.seed)
+    repo = Repo.init(path, mkdir=True)
+
+    pending: List[Tuple[ShaFile, Optional[str]]] = []
+    page_trees: Dict[bytes, bytes] = {}
+    names: Dict[int, bytes] = {}
+    renames: Dict[int, int] = {}
+    revisions: Dict[int, int] = {}
+    statuses: Dict[int, int] = {}
+    attachment_trees: Dict[int, bytes] = {}
+    page_blobs: Dict[int, bytes] = {}
+
+    parent = None
+
+    def add(obj):
+        pending.append((obj, None))
+        return obj
+
+    def flush():
+        if pending:
+            repo.object_store.add_objects(pending)
+            del pending[:]
+
+    def write_attachments(number):
+
+        attachments_tree = Tree()
+
+        for i in range(parameters.attachments):
+
+            filename = attachment_name(i)
+
+            metadata = add(Blob.from_string(
+                _ATTACHMENT_METADATA_RST.format(
+                    filename=filename.decode('ascii'),
+                ).encode('utf-8')
+            ))
+            data = add(Blob.from_string(
+                rng.getrandbits(8 * parameters.attachment_size).to_bytes(
+                    parameters.attachment_size,
+                    'little',
+                )
+            ))
+
+            attachment_tree = Tree()
+            attachment_tree.add(ATTACHMENT_METADATA_RST, _BLOB_MODE, metadata.id)
+            attachment_tree.add(ATTACHMENT_DATA, _BLOB_MODE, data.id)
+
+            attachments_tree.add(filename, _TREE_MODE, add(attachment_tree).id)
+
+        attachment_trees[number] = add(attachments_tree).id
+
+    def write_page(number, revise=True):
+
+        if revise:
+            revision = revisions[number] = revisions.get(number, 0) + 1
+            status = _STATUSES[statuses.get(number, 0)]
+            page_blobs[number] = add(Blob.from_string(
+                page_rst(number, revision, parameters.paragraphs, status)
+            )).id
+
+        page_tree = Tree()
+        page_tree.add(PAGE_RST_BYTES, _BLOB_MODE, page_blobs[number])
+
+        if parameters.attachments:
+            page_tree.add(
+                ATTACHMENTS_TREE,
+                _TREE_MODE,
+                attachment_trees[number],
+            )
+
+        page_trees[names[number]] = add(page_tree).id
+
+    created = 0
+
+    for i in range(parameters.commits):
+
+        due = -(-(i + 1) * parameters.pages // parameters.commits)
+
+        if created < due:
+            while created < due:
+                names[created] = page_name(created)
+                if parameters.attachments:
+                    write_attachments(created)
+                write_page(created)
+                created += 1
+            message = u'create pages up to {}'.format(created)
+        else:
+            number = rng.randrange(created)
+            message = u'edit page {}'.format(number)
+            if rng.random() < parameters.rename_rate:
+                # a rename keeps the page tree as it is so that the history
+                # walk can follow it
+                renames[number] = renames.get(number, 0) + 1
+                old_name = names[number]
+                names[number] = page_name(number, renames[number])
+                page_trees[names[number]] = page_trees.pop(old_name)
+                message = u'rename page {}'.format(number)
+            elif (
+                    parameters.attachments and
+                    rng.random() < parameters.attachment_edit_rate
+            ):
+                write_attachments(number)
+                write_page(number, revise=False)
+                message = u'replace attachments of page {}'.format(number)
+            else:
+                if rng.random() < parameters.status_rate:
+                    statuses[number] = 1 - statuses.get(number, 0)
+                    message = u'change status of page {}'.format(number)
+                write_page(number)
+
+        pages_tree = Tree()
+        for name, tree_id in page_trees.items():
+            pages_tree.add(name, _TREE_MODE, tree_id)
+
+        root_tree = Tree()
+        root_tree.add(PAGES_TREE_BYTES, _TREE_MODE, add(pages_tree).id)
+
+        timestamp = int((_EPOCH + timedelta(minutes=i)).timestamp())
+
+        commit = Commit()
+        commit.tree = add(root_tree).id
+        commit.parents = [] if parent is None else [parent]
+        commit.author = commit.committer = b'Benchmark <bench@example.com>'
+        commit.author_time = commit.commit_time = timestamp
+        commit.author_timezone = commit.commit_timezone = 0
+        commit.message = message.encode('utf-8')
+        parent = add(commit).id
+
+        if (i + 1) % batch_size == 0:
+            flush()
+
+    flush()
+
+    repo.refs[b'refs/heads/master'] = parent
+
+    return repo
@@ -2,15 +2,80 @@ import click
 
 from functools import partial
 
-from whoosh.query import Every
-
 
 @click.command('build-index')
+@click.option(
+    '--full/--incremental',
+    default=False,
+    help='Rebuild every page instead of only the pages changed since the '
+    'last build',
+)
+@click.option(
+    '-j', '--jobs',
+    envvar='GITPAGES_BUILD_JOBS', metavar='<N>',
+    type=click.IntRange(min=0),
+    default=1,
+    help='Read and render pages in <N> processes, 0 for one per CPU',
+)
+@click.option(
+    '--stats/--no-stats',
+    default=True,
+    help='Print the time spent in each stage of the build',
+)
+@click.option(
+    '--report', metavar='<PATH>',
+    type=click.Path(dir_okay=False, writable=True),
+    help='Write the build statistics to <PATH> as JSON',
+)
+@click.option(
+    '--profile', metavar='<PATH>',
+    type=click.Path(dir_okay=False, writable=True),
+    help='Profile the build and write the pstats dump to <PATH>',
+)
 @click.pass_obj
-def build_index(app):
+def build_index(app, full, jobs, stats, report, profile):
     """(re)build GitPages index"""
 
-    from .indexer import build_hybrid_index
+    import json
+    import time
+    from .util.stats import BuildStats
+
+    build_stats = BuildStats()
+    start = time.perf_counter()
+
+    if profile:
+        from cProfile import Profile
+        profiler = Profile()
+        profiler.enable()
+
+    try:
+        _build_index(app, full, jobs, build_stats)
+    finally:
+        if profile:
+            profiler.disable()
+            profiler.dump_stats(profile)
+
+    build_stats.add_time('total', time.perf_counter() - start)
+
+    if stats:
+        for line in build_stats.format_table():
+            click.echo(line, err=True)
+
+    if report:
+        with open(report, 'w') as f:
+            json.dump(build_stats.as_dict(), f, indent=2)
+
+
+def _build_index(app, full, jobs, stats):
+
+    from os import cpu_count
+    from .indexer import (
+        IndexGenerations,
+        build_hybrid_index,
+        build_index_generation,
+        cache_attachments,
+        get_indexed_commit,
+    )
     from .web import ui
     from flask import g
 
@@ -18,16 +83,99 @@ def build_index(app):
 
         ui.setup_gitpages()
 
-        index = g.index
+        config = ui.GitPagesConfig()
+        generations = config.index_factory
 
-        index.delete_by_query(Every())
+        build_options = dict(
+            render_cache=config.render_cache,
+            jobs=jobs or cpu_count() or 1,
+            stats=stats,
+            summary_statuses=[config.allowed_statuses],
+        )
 
-        build_hybrid_index(
-            index=index,
-            repo=g.repo,
-            ref=g.default_ref,
+        incremental = (
+            not full and
+            get_indexed_commit(g.index, g.repo) is not None
         )
 
+        if isinstance(generations, IndexGenerations) and not incremental:
+
+            generation = build_index_generation(
+                generations,
+                config.schema,
+                repo=g.repo,
+                ref=g.default_ref,
+                **build_options
+            )
+
+            click.echo('published index generation %d' % generation)
+
+        else:
+
+            build_hybrid_index(
+                index=g.index,
+                repo=g.repo,
+                ref=g.default_ref,
+                incremental=incremental,
+                **build_options
+            )
+
+        attachment_cache = config.attachment_cache
+
+        if attachment_cache is not None:
+
+            # the index factory opens the generation that was just published
+            index = config.index
+
+            try:
+                cache_attachments(index, g.repo, attachment_cache, stats)
+            finally:
+                index.close()
+
+
+@click.command('export-static')
+@click.argument(
+    'destination', metavar='<DIRECTORY>',
+    type=click.Path(file_okay=False, writable=True),
+)
+@click.option(
+    '--full/--incremental',
+    default=False,
+    help='Export every URL instead of only those changed since the last '
+    'export to <DIRECTORY>',
+)
+@click.option(
+    '-j', '--jobs',
+    envvar='GITPAGES_EXPORT_JOBS', metavar='<N>',
+    type=click.IntRange(min=0),
+    default=1,
+    help='Render URLs in <N> processes, 0 for one per CPU',
+)
+@click.option(
+    '--base-url', metavar='<URL>',
+    envvar='GITPAGES_BASE_URL',
+    default='http://localhost/',
+    help='Render absolute links, such as those in feeds, against <URL>',
+)
+@click.pass_obj
+def export_static(app, destination, full, jobs, base_url):
+    """ export the site as static files """
+
+    from os import cpu_count
+    from .exporter import export_static
+
+    result = export_static(
+        app,
+        destination,
+        base_url=base_url,
+        incremental=not full,
+        jobs=jobs or cpu_count() or 1,
+    )
+
+    click.echo(
+        'exported %d, unchanged %d, removed %d, failed %d' % result
+    )
+
 
 @click.command('run-server')
 @click.option(
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import multiprocessing
+import os
+from os.path import dirname, exists, join
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from dulwich.repo import Repo
+from flask import Flask, g, url_for
+from whoosh.query import And, NestedChildren, NullQuery, Or, Term
+from whoosh.searching import Searcher
+
+from .indexer import makedirs_quiet
+from .schema import has_keys
+from .web import ui
+from .web.api import GitPages, ListingCursor, listing_key, statuses_query
+
+
+_log = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = '.gitpages-export.json'
+MANIFEST_FORMAT = 1
+
+
+class ExportUrl(NamedTuple):
+    """
+    A URL served by the blueprint. Immutable URLs, those of attachments,
+    which are addressed by their tree id, never need to be exported twice.
+    """
+
+    url: str
+    immutable: bool = False
+
+
+class ExportResult(NamedTuple):
+
+    written: int
+    unchanged: int
+    removed: int
+    failed: int
+
+
+def url_to_path(url: str) -> str:
+    """
+    Returns the path, relative to the export directory, that `url` is
+    written to. URLs ending in a slash are written to an ``index.html``.
+    """
+
+    path = url.lstrip('/')
+
+    if not path or path.endswith('/'):
+        path += 'index.html'
+
+    return path
+
+
+def find_urls(app: Flask) -> List[ExportUrl]:
+    """
+    Returns every URL that the blueprint of `app` serves for the pages
+    visible with its configured statuses.
+    """
+
+    with app.test_request_context():
+
+        ui.setup_gitpages()
+
+        try:
+            return list(_find_urls(g.searcher, g.allowed_statuses))
+        finally:
+            ui.teardown_gitpages()
+
+
+def _find_urls(searcher: Searcher, statuses: Iterable[str]):
+
+    statuses = set(statuses)
+    visible_pages = Term('kind', 'page') & statuses_query('page', statuses)
+
+    pages = searcher.search(visible_pages, limit=None)
+
+    yield from _listing_urls('.index_view', pages)
+
+    yield ExportUrl(url_for('.atom_feed'))
+
+    archives: Dict[Tuple[str, Tuple[int, ...]], List] = {}
+    revision_tree_ids = set()
+
+    for page in pages:
+
+        info = GitPages._load_page_info(page)
+        date = info.date
+
+        for archive in [
+            ('.yearly_archive', (date.year,)),
+            ('.monthly_archive', (date.year, date.month)),
+            ('.daily_archive', (date.year, date.month, date.day)),
+        ]:
+            archives.setdefault(archive, []).append(page)
+
+        yield ExportUrl(info.to_url())
+
+        for revision in page.get('page_history', ()):
+            if revision['revision_status'] in statuses:
+                tree_id = revision['revision_tree_id']
+                revision_tree_ids.add(tree_id)
+                yield ExportUrl(info.to_url_tree(tree_id))
+
+    for (endpoint, date_parts), archive_pages in sorted(archives.items()):
+        values = dict(zip(('year', 'month', 'day'), date_parts))
+        yield from _listing_urls(endpoint, archive_pages, **values)
+
+    # only the attachments of the revisions exported above, the others
+    # belong to revisions with statuses that are not visible
+    revision_tree_ids = sorted(revision_tree_ids)
+
+    if has_keys(searcher.schema):
+        page_owners = Or([
+            Term('owner_path', page['page_path']) for page in pages
+        ])
+        revision_owners = Or([
+            Term('attachment_tree_id', tree_id)
+            for tree_id in revision_tree_ids
+        ])
+    else:
+        page_owners = NestedChildren(Term('kind', 'page'), visible_pages)
+        revision_owners = NestedChildren(
+            Term('kind', 'revision'),
+            Term('kind', 'revision') & Or([
+                Term('revision_tree_id', tree_id)
+                for tree_id in revision_tree_ids
+            ]),
+        )
+
+    attachments = searcher.search(
+        Or([
+            And([page_owners, Term('kind', 'page-attachment')])
+            if len(pages) else NullQuery,
+            And([revision_owners, Term('kind', 'revision-attachment')])
+            if revision_tree_ids else NullQuery,
+        ]),
+        limit=None,
+    )
+
+    attachment_ids = set(a['attachment_id'] for a in attachments)
+
+    for attachment_id in sorted(attachment_ids):
+        yield ExportUrl(
+            url_for('.attachment', tree_id=attachment_id),
+            immutable=True,
+        )
+
+
+def _listing_urls(endpoint: str, pages: List, **values):
+    """
+    Yields the URLs of every page of the listing served by `endpoint` with
+    `values`, which lists `pages`: the newest ones, then those after the
+    last page of each previous listing page.
+    """
+
+    yield ExportUrl(url_for(endpoint, **values))
+
+    listed = sorted(pages, key=listing_key, reverse=True)
+    page_length = ui.INDEX_PAGE_LENGTH
+
+    for end in range(page_length, len(listed), page_length):
+        cursor = ListingCursor.from_info(
+            GitPages._load_page_info(listed[end - 1])
+        )
+        yield ExportUrl(url_for(endpoint, after=cursor, **values))
+
+
+def read_manifest(destination: str) -> Dict[str, Dict]:
+
+    try:
+        with open(join(destination, MANIFEST_FILENAME)) as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+    if manifest.get('format') != MANIFEST_FORMAT:
+        return {}
+
+    return manifest['urls']
+
+
+def write_manifest(destination: str, urls: Dict[str, Dict]):
+    _write_file(
+        destination,
+        MANIFEST_FILENAME,
+        json.dumps(
+            dict(format=MANIFEST_FORMAT, urls=urls),
+            indent=2,
+            sort_keys=True,
+        ).encode('utf-8'),
+    )
+
+
+def _write_file(destination: str, path: str, data: bytes):
+
+    filename = join(destination, path)
+    temporary = filename + '.tmp'
+
+    makedirs_quiet(dirname(filename))
+
+    with open(temporary, 'wb') as f:
+        f.write(data)
+
+    os.replace(temporary, filename)
+
+
+def export_static(
+        app: Flask,
+        destination: str,
+        base_url: str='http://localhost/',
+        incremental: bool=True,
+        jobs: int=1,
+) -> ExportResult:
+    """
+    Writes every URL served by the blueprint of `app` to `destination`,
+    along with a manifest of their paths, content types and ETags.
+
+    When `incremental` is set, the URLs written by a previous export are
+    requested with the ETag they had then, which is derived from the blob
+    and tree ids they were rendered from, so only those affected by a new
+    commit are rendered and written again. Attachments are only written
+    once. Files of URLs that are no longer served are removed.
+
+    Pages are rendered without the search form, since a static site cannot
+    answer searches.
+
+    With more than one of `jobs`, the URLs are rendered by a pool of that
+    many processes.
+    """
+
+    previous = read_manifest(destination) if incremental else {}
+    urls = find_urls(app)
+
+    tasks = [
+        (url, previous.get(url.url))
+        for url in urls
+    ]
+
+    if jobs > 1 and len(tasks) > 1:
+        results = _export_urls_parallel(
+            app,
+            destination,
+            base_url,
+            tasks,
+            jobs,
+        )
+    else:
+        results = [
+            _export_url(app, destination, base_url, url, entry)
+            for url, entry in tasks
+        ]
+
+    manifest = {}
+    written = unchanged = failed = 0
+
+    for (url, _entry), (entry, was_written) in zip(tasks, results):
+
+        if entry is None:
+            failed += 1
+            continue
+
+        manifest[url.url] = entry
+
+        if was_written:
+            written += 1
+        else:
+            unchanged += 1
+
+    removed = 0
+
+    kept_paths = set(entry['path'] for entry in manifest.values())
+
+    for url, entry in previous.items():
+        if url not in manifest and entry['path'] not in kept_paths:
+            try:
+                os.remove(join(destination, entry['path']))
+                removed += 1
+            except OSError:
+                pass
+
+    write_manifest(destination, manifest)
+
+    return ExportResult(written, unchanged, removed, failed)
+
+
+def _export_url(
+        app: Flask,
+        destination: str,
+        base_url: str,
+        url: ExportUrl,
+        entry: Optional[Dict],
+) -> Tuple[Optional[Dict], bool]:
+    """
+    Exports `url` unless the previous export `entry` is still current and
+    returns the entry for it along with whether it was written.
+    """
+
+    path = url_to_path(url.url)
+    headers = {}
+
+    if entry is not None and exists(join(destination, path)):
+
+        if url.immutable:
+            return entry, False
+
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+
+    try:
+        response = app.test_client().get(
+            url.url,
+            base_url=base_url,
+            headers=headers,
+            environ_overrides={ui.STATIC_EXPORT_ENVIRON_KEY: True},
+        )
+    except Exception:
+        _log.exception('not exporting %s', url.url)
+        return None, False
+
+    if response.status_code == 304:
+        return entry, False
+
+    if response.status_code != 200:
+        _log.warning('not exporting %s: %s', url.url, response.status)
+        return None, False
+
+    _write_file(destination, path, response.get_data())
+
+    entry = dict(
+        path=path,
+        etag=response.headers.get('ETag'),
+        content_type=response.headers.get('Content-Type'),
+    )
+
+    if 'Content-Disposition' in response.headers:
+        entry['content_disposition'] = response.headers['Content-Disposition']
+
+    return entry, True
+
+
+def _export_urls_parallel(
+        app: Flask,
+        destination: str,
+        base_url: str,
+        tasks: List[Tuple[ExportUrl, Optional[Dict]]],
+        jobs: int,
+) -> List[Tuple[Optional[Dict], bool]]:
+
+    # forked workers inherit the application along with its configuration
+    context = multiprocessing.get_context('fork')
+    chunksize = max(1, min(16, len(tasks) // (jobs * 4)))
+
+    with context.Pool(
+            jobs,
+            initializer=_init_worker,
+            initargs=(app, destination, base_url),
+    ) as pool:
+        return pool.map(_export_task, tasks, chunksize)
+
+
+_worker_app: Optional[Flask] = None
+_worker_destination: Optional[str] = None
+_worker_base_url: Optional[str] = None
+
+
+def _init_worker(app: Flask, destination: str, base_url: str):
+
+    global _worker_app, _worker_destination, _worker_base_url
+
+    # open pack files afresh rather than sharing file offsets with the
+    # parent process
+    repo = app.config.get('GITPAGES_REPOSITORY')
+    if isinstance(repo, Repo):
+        app.config['GITPAGES_REPOSITORY'] = Repo(repo.path)
+
+    _worker_app = app
+    _worker_destination = destination
+    _worker_base_url = base_url
+
+
+def _export_task(task: Tuple[ExportUrl, Optional[Dict]]):
+
+    url, entry = task
+
+    return _export_url(
+        _worker_app,
+        _worker_destination,
+        _worker_base_url,
+        url,
+        entry,
+    )
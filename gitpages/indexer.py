@@ -1,32 +1,92 @@
 # -*- coding: utf-8 -*-
 
+import json
+import logging
+import multiprocessing
+import re
+import tempfile
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
 from datetime import datetime
 from posixpath import dirname
-from os import makedirs, error as OSError
-from os.path import isdir
+from os import fdopen, listdir, makedirs, mkdir, replace, error as OSError
+from os.path import isdir, join
+from shutil import rmtree
 
-from typing import Iterable
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 
+from cachelib import BaseCache
 from dateutil.parser import parse as parse_date
 from dateutil.tz import tzoffset
-from dulwich.walk import Walker
-from dulwich.repo import BaseRepo
+from dulwich.repo import BaseRepo, Repo
 from dulwich.objects import Blob, Commit
 
 from whoosh import index
 from whoosh.fields import Schema
+from whoosh.filedb.filestore import RamStorage
 from whoosh.index import Index
+from whoosh.query import Every, NestedChildren, Term
 from whoosh.writing import IndexWriter
 
-
+from .schema import DateRevisionHybrid, has_keys
 from .storage import git as git_storage
+from .storage.blobfiles import BlobFileCache
 from .storage.git import PageAttachment
+from .storage.objects import CachedRepo, ObjectCache
 from .util import slugify
+from .util.stats import BuildStats, NULL_STATS, TimedWriter
 from .util.compat import (
     _bytes_to_text as bytes_to_text,
     _text_to_bytes as text_to_bytes,
 )
 from .web import api
+from .web.attachments import write_attachment_map
+from .web.cache import LRUCache
+
+
+_log = logging.getLogger(__name__)
+
+# bump whenever the documents written by this module change shape so that
+# incremental builds against an older index fall back to a full rebuild
+INDEX_FORMAT = 6
+
+# the page fields copied into page summaries to stand for a page
+_SUMMARY_PAGE_FIELDS = (
+    'page_date',
+    'page_slug',
+    'page_title',
+    'page_status',
+    'page_path',
+    'page_blob_id',
+)
+
+SUMMARY_PAGE_LENGTH = 10
+
+# the fields that link documents to their page in indexes laid out as
+# tables, see :class:`~gitpages.schema.DateRevisionTables`
+_KEY_FIELDS = (
+    'owner_path',
+    'attachment_page_path',
+    'attachment_tree_id',
+)
+
+# the number of pages whose objects are read ahead together in pack order
+PRELOAD_BATCH = 256
+
+# parse_page caches the metadata, the text and the rendering of a blob
+_RENDER_CACHE_KEYS_PER_BLOB = 3
+
+# the doctree nodes directly under the document that are not part of the
+# searchable text of a page
+_NON_TEXT_NODES = frozenset((
+    'title',
+    'subtitle',
+    'docinfo',
+    'comment',
+    'substitution_definition',
+    'system_message',
+    'raw',
+))
 
 
 def makedirs_quiet(path):
@@ -55,23 +115,166 @@ def get_index(index_path: str, index_name: str, schema: Schema) -> Index:
     )
 
 
+class IndexGenerations(object):
+    """
+    Keeps successive full builds of an index in numbered generation
+    directories under `index_path`, plus a CURRENT file that names the
+    generation being served.
+
+    Instances can be used as the ``GITPAGES_INDEX`` factory: calling one
+    opens the current generation, so web workers pick up a newly published
+    generation on their next request. Only builds create and publish
+    generations; until one is published, calling an instance returns an
+    empty index held in memory.
+    """
+
+    _current_filename = 'CURRENT'
+    _generation_re = re.compile(r'^generation-([0-9]+)$')
+
+    def __init__(self, index_path: str, index_name: str='index', keep: int=2):
+        self.index_path = index_path
+        self.index_name = index_name
+        self.keep = keep
+
+    def __call__(self, schema: Schema) -> Index:
+
+        generation = self.current_generation()
+
+        if generation is None:
+            return RamStorage().create_index(schema)
+
+        return self.open(generation, schema)
+
+    def _generation_path(self, generation: int) -> str:
+        return join(self.index_path, 'generation-%d' % generation)
+
+    def generations(self) -> List[int]:
+
+        makedirs_quiet(self.index_path)
+
+        matches = (
+            self._generation_re.match(name)
+            for name in listdir(self.index_path)
+        )
+
+        return sorted(int(m.group(1)) for m in matches if m)
+
+    def current_generation(self) -> Optional[int]:
+
+        try:
+            with open(join(self.index_path, self._current_filename)) as f:
+                return int(f.read().strip())
+        except (IOError, ValueError):
+            return None
+
+    def open(self, generation: int, schema: Schema) -> Index:
+        return get_index(
+            self._generation_path(generation),
+            self.index_name,
+            schema,
+        )
+
+    def create(self, schema: Schema) -> Tuple[int, Index]:
+        """
+        Creates an empty index in a new generation, which is not served
+        until it is passed to :meth:`publish`.
+        """
+
+        generation = max(self.generations(), default=0) + 1
+
+        # the generation directory is claimed by creating it, so that builds
+        # running at the same time never share one
+        while True:
+            try:
+                mkdir(self._generation_path(generation))
+            except FileExistsError:
+                generation += 1
+            else:
+                return generation, self.open(generation, schema)
+
+    def publish(self, generation: int):
+        """
+        Atomically makes `generation` the one being served.
+        """
+
+        current = join(self.index_path, self._current_filename)
+        fd, temp = tempfile.mkstemp(
+            dir=self.index_path,
+            prefix='.%s-' % self._current_filename,
+        )
+
+        with fdopen(fd, 'w') as f:
+            f.write('%d\n' % generation)
+
+        replace(temp, current)
+
+    def discard(self, generation: int):
+        rmtree(self._generation_path(generation), ignore_errors=True)
+
+    def clean(self):
+        """
+        Removes all but the newest `keep` generations, never removing the
+        current one.
+        """
+
+        current = self.current_generation()
+        generations = self.generations()
+        stale = generations[:max(0, len(generations) - self.keep)]
+
+        for generation in stale:
+            if generation != current:
+                self.discard(generation)
+
+
+def build_index_generation(
+        generations: IndexGenerations,
+        schema: Schema,
+        repo: BaseRepo,
+        ref: bytes=b'HEAD',
+        **kwargs
+) -> int:
+    """
+    Fully builds a new generation of the index and publishes it once the
+    build succeeds, then removes stale generations. Readers keep using the
+    previous generation until then.
+    """
+
+    generation, new_index = generations.create(schema)
+
+    try:
+        build_hybrid_index(new_index, repo, ref, incremental=False, **kwargs)
+    except BaseException:
+        new_index.close()
+        generations.discard(generation)
+        raise
+
+    new_index.close()
+
+    generations.publish(generation)
+    generations.clean()
+
+    return generation
+
+
 def write_page(
         writer: IndexWriter,
         path: str,
         page: Blob,
         attachments: Iterable,
+        render_cache: Optional[BaseCache]=None,
+        stats: BuildStats=NULL_STATS,
+        history: Iterable[Dict]=(),
 ):
 
-    doctree = read_page_rst(page.data)
-    title = get_title(doctree)
-    docinfo = get_docinfo_as_dict(doctree)
+    title, docinfo, text, rendered = parse_page(page, render_cache, stats)
 
     slug = slugify(title)
-    date = parse_date(docinfo['date'])
+    with stats.timer('parse date'):
+        date = parse_date(docinfo['date'])
     status = docinfo['status']
     blob_id = bytes_to_text(page.id)
 
-    rendered = render_page(page)
+    stats.count('pages')
 
     writer.add_document(
         kind='page',
@@ -81,13 +284,16 @@ def write_page(
         page_status=status,
         page_path=path,
         page_blob_id=blob_id,
-        page_rendered=rendered,
+        # a plain tuple pickles smaller than the named one
+        page_rendered=tuple(rendered),
+        page_text=text,
+        page_history=list(history),
     )
 
     writer.add_document(kind='page-dummy-child')
 
     for attachment in attachments:
-        write_page_attachment(writer, attachment)
+        write_page_attachment(writer, attachment, stats, page_path=path)
 
 
 def write_revision(
@@ -95,16 +301,37 @@ def write_revision(
         writer: IndexWriter,
         commit: Commit,
         path: str,
+        render_cache: Optional[BaseCache]=None,
+        stats: BuildStats=NULL_STATS,
+        renderings: Optional[Dict[str, api.RenderedPage]]=None,
+        owner_path: Optional[str]=None,
 ):
+    """
+    Writes the revision of the page at `path` in `commit`, which belongs to
+    the page now at `owner_path`, by default `path`. Its rendering is not
+    stored with it but added to `renderings` under the blob id, so that
+    revisions sharing a blob share one rendering, see
+    :func:`write_renderings`.
+    """
 
     path_bytes = text_to_bytes(path)
+    page_tree_path = dirname(path)
+    page_tree_path_bytes = text_to_bytes(page_tree_path)
 
     tree_id = commit.tree
-    tree = repo[tree_id]
-    _mode, blob_id = tree.lookup_path(
-        repo.get_object,
-        path_bytes,
-    )
+
+    with stats.timer('tree lookup'):
+        tree = repo[tree_id]
+        _mode, blob_id = tree.lookup_path(
+            repo.get_object,
+            path_bytes,
+        )
+        _page_tree_mode, page_tree_id = tree.lookup_path(
+            repo.get_object,
+            page_tree_path_bytes,
+        )
+        page_blob = repo[blob_id]
+        page_tree = repo[page_tree_id]
 
     commit_time = datetime.fromtimestamp(
         commit.commit_time,
@@ -116,27 +343,22 @@ def write_revision(
         tzoffset(None, commit.author_timezone),
     )
 
-    page_blob = repo[blob_id]
-
-    doctree = read_page_rst(page_blob.data)
-    title = get_title(doctree)
+    title, docinfo, _text, rendered = parse_page(
+        page_blob,
+        render_cache,
+        stats,
+    )
     slug = slugify(title)
-    docinfo = get_docinfo_as_dict(doctree)
-    date = parse_date(docinfo['date'])
+    with stats.timer('parse date'):
+        date = parse_date(docinfo['date'])
     status = docinfo['status']
 
-    page_tree_path = dirname(path)
-    page_tree_path_bytes = text_to_bytes(page_tree_path)
-
-    _page_tree_mode, page_tree_id = tree.lookup_path(
-        repo.get_object,
-        page_tree_path_bytes,
-    )
-
-    page_tree = repo[page_tree_id]
     attachments = git_storage.load_page_attachments(repo, page_tree)
 
-    rendered = render_page(page_blob)
+    if renderings is not None:
+        renderings.setdefault(bytes_to_text(blob_id), rendered)
+
+    stats.count('revisions')
 
     with writer.group():
 
@@ -155,40 +377,84 @@ def write_revision(
             revision_author_time=author_time,
             revision_commit_time=commit_time,
             revision_message=bytes_to_text(commit.message),
-            revision_rendered=rendered,
+            owner_path=owner_path or path,
         )
 
         writer.add_document(kind='revision-dummy-child')
 
         for attachment in attachments:
-            write_revision_attachment(writer, attachment)
-
-
-def write_page_attachment(writer, attachment):
-    _write_attachment(writer, attachment, kind='page-attachment')
+            write_revision_attachment(
+                writer,
+                attachment,
+                stats,
+                page_path=path,
+                tree_id=bytes_to_text(tree_id),
+                owner_path=owner_path or path,
+            )
+
+
+def write_page_attachment(
+        writer,
+        attachment,
+        stats=NULL_STATS,
+        page_path: Optional[str]=None,
+):
+    _write_attachment(
+        writer,
+        attachment,
+        kind='page-attachment',
+        stats=stats,
+        keys=dict(
+            owner_path=page_path,
+            attachment_page_path=page_path,
+        ),
+    )
 
 
-def write_revision_attachment(writer, attachment):
-    _write_attachment(writer, attachment, kind='revision-attachment')
+def write_revision_attachment(
+        writer,
+        attachment,
+        stats=NULL_STATS,
+        page_path: Optional[str]=None,
+        tree_id: Optional[str]=None,
+        owner_path: Optional[str]=None,
+):
+    _write_attachment(
+        writer,
+        attachment,
+        kind='revision-attachment',
+        stats=stats,
+        keys=dict(
+            owner_path=owner_path or page_path,
+            attachment_page_path=page_path,
+            attachment_tree_id=tree_id,
+        ),
+    )
 
 
 def _write_attachment(
         writer: IndexWriter,
         attachment: PageAttachment,
         kind: str,
+        stats: BuildStats=NULL_STATS,
+        keys: Optional[Dict[str, Optional[str]]]=None,
 ):
 
     attachment_tree_id = attachment.tree_id_text
     metadata_blob_id = attachment.metadata_blob_id_text
     data_blob_id = attachment.blob_id_text
-    doctree = read_page_rst(attachment.metadata.data)
-    docinfo = get_docinfo_as_dict(doctree)
+
+    with stats.timer('attachment metadata'):
+        doctree = read_page_rst(attachment.metadata.data)
+        docinfo = get_docinfo_as_dict(doctree)
+        content_length = attachment.size
+
+    stats.count('attachments')
 
     content_disposition = docinfo.get(
         'content-disposition',
         'inline',
     )
-    content_length = attachment.data.raw_length()
     content_type = docinfo.get(
         'content-type',
         'application/octet-stream',
@@ -202,43 +468,735 @@ def _write_attachment(
         attachment_metadata_blob_id=metadata_blob_id,
         attachment_data_blob_id=data_blob_id,
         attachment_id=attachment_tree_id,
+        **dict(
+            (name, value)
+            for name, value in (keys or {}).items()
+            if value is not None
+        )
     )
 
 
-def build_hybrid_index(index: Index, repo: BaseRepo, ref: bytes=b'HEAD'):
+class PageJob(NamedTuple):
+    """
+    Everything needed to write the documents of one page group, as plain
+    object ids so that it can be handed to another process.
+    """
+
+    path: str
+    page_blob_id: bytes
+    page_tree_id: bytes
+    revisions: List[Tuple[bytes, str]]
+
+
+class DocumentBuffer(object):
+    """
+    Stands in for an :class:`IndexWriter` and collects the documents added
+    to it so that they can be written to the index later.
+    """
+
+    def __init__(self):
+        self.documents = []
+
+    def add_document(self, **fields):
+        self.documents.append(fields)
+
+    @contextmanager
+    def group(self):
+        yield self
+
+
+class LayoutWriter(object):
+    """
+    Wraps an index writer to fit the documents written by this module to
+    the layout of its index. Indexes laid out as tables get no dummy
+    children, which only mark the end of a parent in a writer group, and
+    other indexes get none of the keys that link documents in tables.
+    """
+
+    def __init__(self, writer, schema: Schema):
+        self._writer = writer
+        self._keys = has_keys(schema)
+
+    def add_document(self, **fields):
+
+        if self._keys:
+            if fields['kind'].endswith('-dummy-child'):
+                return
+        else:
+            for name in _KEY_FIELDS:
+                fields.pop(name, None)
+
+        self._writer.add_document(**fields)
+
+    def __getattr__(self, name):
+        return getattr(self._writer, name)
+
+
+def build_hybrid_index(
+        index: Index,
+        repo: BaseRepo,
+        ref: bytes=b'HEAD',
+        incremental: bool=False,
+        render_cache: Optional[BaseCache]=None,
+        jobs: int=1,
+        stats: BuildStats=NULL_STATS,
+        summary_statuses: Iterable[Iterable[str]]=(('published',),),
+        object_cache: Optional[ObjectCache]=None,
+):
+    """
+    Writes every page reachable from `ref` into `index`, replacing whatever
+    the index held before.
+
+    Afterwards, the summaries of the pages are rewritten for each set of
+    statuses in `summary_statuses`, see :func:`write_page_summaries`, and
+    the attachments are mapped by id, see :func:`write_attachment_map`.
+
+    When `incremental` is set and the index records the commit it was last
+    built from, only the page trees that changed since that commit are
+    deleted and rewritten.
+
+    Page renderings are looked up in and added to `render_cache`; without
+    one, they are kept for this build in a cache big enough for every page
+    blob, so that each distinct blob is still rendered only once.
+
+    Trees and blobs are read through `object_cache`, or a cache of the
+    default size kept for this build, since the trees of a page are read
+    again for each of its revisions.
+
+    With more than one of `jobs`, the pages are read and rendered by a pool
+    of that many processes while this process writes their documents.
+
+    The time spent in each stage of the build and the number of pages,
+    revisions, attachments and documents written are added to `stats`.
+    """
+
+    if isinstance(repo, CachedRepo):
+        object_cache = object_cache or repo.object_cache
+        repo = repo.repo
+
+    if object_cache is None:
+        object_cache = ObjectCache()
+
+    repo = CachedRepo(repo, object_cache)
+    object_cache_stats = object_cache.stats()
 
     head = repo.refs[ref]
 
-    def get_revisions(path) -> Walker:
+    since = get_indexed_commit(index, repo) if incremental else None
+
+    if since is None:
+        names = None
+    else:
+        with stats.timer('find changed pages'):
+            names = git_storage.find_changed_page_trees(repo, since, head)
+        _log.info(
+            'incremental build since %s: %d changed page trees',
+            bytes_to_text(since),
+            len(names),
+        )
 
-        from posixpath import dirname
+    with stats.timer('find pages'):
+        head_pages_tree = git_storage.get_pages_tree(repo, ref)
+        pages = list(
+            git_storage.find_pages(repo, head_pages_tree, names=names)
+        )
 
-        parent_path_bytes = text_to_bytes(dirname(path))
+    with stats.timer('history walk'):
+        revisions = git_storage.find_page_revisions(
+            repo,
+            head,
+            paths=set(p.path for p in pages),
+        )
 
-        return Walker(
-            store=repo.object_store,
-            include=[head],
-            paths=[parent_path_bytes],
-            follow=True,
+    page_jobs = [
+        PageJob(
+            path=page.path,
+            page_blob_id=page.entry.sha,
+            page_tree_id=page.tree.id,
+            revisions=[
+                (r.commit.id, r.path) for r in revisions.get(page.path, ())
+            ],
         )
+        for page in pages
+    ]
 
-    head_pages_tree = git_storage.get_pages_tree(repo, ref)
+    if render_cache is None:
+        render_cache = _build_render_cache(page_jobs)
+
+    index_writer = index.writer()
+    writer = LayoutWriter(
+        TimedWriter(index_writer, stats),
+        index_writer.schema,
+    )
 
-    pages = git_storage.find_pages(repo, head_pages_tree)
+    try:
 
-    pages_data = git_storage.load_pages_with_attachments(repo, pages)
+        _add_missing_fields(index_writer, upgrade=names is None)
+
+        with stats.timer('delete'):
+            if names is None:
+                writer.delete_by_query(Every())
+            else:
+                for name in names:
+                    delete_page(writer, git_storage.get_page_path(name))
+
+        if jobs > 1 and len(page_jobs) > 1:
+            _write_page_groups_parallel(
+                writer,
+                repo,
+                page_jobs,
+                render_cache,
+                jobs,
+                stats,
+            )
+        else:
+            for batch in _batches(page_jobs, PRELOAD_BATCH):
+                preload_page_jobs(repo, batch, stats)
+                for job in batch:
+                    with writer.group():
+                        write_page_group(
+                            writer,
+                            repo,
+                            job,
+                            render_cache,
+                            stats,
+                        )
+
+    except BaseException:
+        index_writer.cancel()
+        raise
+
+    count_object_cache(stats, object_cache, object_cache_stats)
+
+    with stats.timer('commit'):
+        index_writer.commit()
+
+    if names is None or names:
+        with stats.timer('summaries'):
+            write_page_summaries(index, summary_statuses)
+
+    # written last, for the generation that the build leaves the index at
+    with stats.timer('attachment map'):
+        write_attachment_map(index)
+
+    set_indexed_commit(index, head)
+
+
+def _add_missing_fields(writer: IndexWriter, upgrade: bool=False):
+    """
+    Adds the fields that an index created by an older version lacks, so
+    that it can be rebuilt in place. With `upgrade`, which is only safe when
+    every document is about to be rewritten, fields that have since become
+    sortable are replaced so that their column is written.
+    """
+
+    for name, field in DateRevisionHybrid().items():
+        if name not in writer.schema:
+            writer.add_field(name, field)
+        elif (
+                upgrade and
+                field.column_type is not None and
+                writer.schema[name].column_type is None
+        ):
+            writer.remove_field(name)
+            writer.add_field(name, field)
+
+
+def _build_render_cache(page_jobs: List[PageJob]) -> BaseCache:
+    """
+    Returns a cache that keeps what :func:`parse_page` stores for every
+    blob of `page_jobs`, those of the pages and of all their revisions.
+    """
+
+    blobs = sum(1 + len(job.revisions) for job in page_jobs)
+
+    return LRUCache(threshold=max(1, blobs * _RENDER_CACHE_KEYS_PER_BLOB))
+
+
+def write_page_summaries(
+        index: Index,
+        summary_statuses: Iterable[Iterable[str]],
+        page_length: int=SUMMARY_PAGE_LENGTH,
+):
+    """
+    Replaces the page summaries in `index` with new ones computed from the
+    pages it holds.
+
+    For each set of statuses, every page visible with them gets a
+    ``page-summary`` document holding its previous and next visible pages
+    by date, the most recent visible pages, the first `page_length` of its
+    visible revisions and their count. A page view then needs a single
+    lookup instead of one search for each of these.
+    """
+
+    summary_statuses = set(map(api.statuses_key, summary_statuses))
+
+    def summarized_page(page):
+
+        # only what summaries are made of is kept of each page, rather than
+        # its text and rendering, and of its history the revisions that
+        # the summary for each set of statuses holds, and their count
+        summarized = dict(
+            (name, page[name]) for name in _SUMMARY_PAGE_FIELDS
+        )
+        summarized['histories'] = {}
+
+        for statuses in summary_statuses:
+
+            visible_statuses = set(statuses.split(u','))
+            history = [
+                r for r in page.get('page_history', ())
+                if r['revision_status'] in visible_statuses
+            ]
+
+            summarized['histories'][statuses] = (
+                history[:page_length],
+                len(history),
+            )
+
+        return summarized
+
+    with index.searcher() as searcher:
+        pages = [
+            summarized_page(searcher.stored_fields(docnum))
+            for docnum in searcher.document_numbers(kind='page')
+        ]
+
+    pages.sort(key=lambda p: p['page_date'])
+
+    def page_info(page):
+        return dict((name, page[name]) for name in _SUMMARY_PAGE_FIELDS)
 
     with index.writer() as writer:
 
-        for path, page, attachments in pages_data:
+        # summaries are kept outside of page groups, but any that end up
+        # after the last page are deleted along with it, which is harmless
+        # since they are all rewritten here
+        writer.delete_by_term('kind', 'page-summary')
 
-            revisions = get_revisions(path)
+        for statuses in summary_statuses:
 
-            with writer.group():
+            visible_statuses = set(statuses.split(u','))
+            visible = [p for p in pages if p['page_status'] in visible_statuses]
+            dates = [p['page_date'] for p in visible]
 
-                write_page(writer, path, page, attachments)
-                for revision in revisions:
-                    write_revision(repo, writer, revision.commit, path)
+            recent_pages = [page_info(p) for p in visible[::-1][:page_length]]
+
+            for page in visible:
+
+                older = bisect_left(dates, page['page_date'])
+                newer = bisect_right(dates, page['page_date'])
+
+                history, revision_count = page['histories'][statuses]
+
+                writer.add_document(
+                    kind='page-summary',
+                    summary_path=page['page_path'],
+                    summary_statuses=statuses,
+                    summary_page_prev=(
+                        page_info(visible[older - 1]) if older else None
+                    ),
+                    summary_page_next=(
+                        page_info(visible[newer])
+                        if newer < len(visible) else None
+                    ),
+                    summary_recent_pages=recent_pages,
+                    summary_history=history,
+                    summary_revision_count=revision_count,
+                )
+
+
+def write_page_group(
+        writer: IndexWriter,
+        repo: BaseRepo,
+        job: PageJob,
+        render_cache: Optional[BaseCache]=None,
+        stats: BuildStats=NULL_STATS,
+):
+
+    with stats.timer('tree lookup'):
+        page = repo[job.page_blob_id]
+        attachments = git_storage.load_page_attachments(
+            repo,
+            repo[job.page_tree_id],
+        )
+
+    # the revisions are read first so that their history can be stored
+    # with the page, whose document has to precede theirs
+    revisions = DocumentBuffer()
+    renderings = {}
+
+    for commit_id, path in job.revisions:
+        write_revision(
+            repo,
+            revisions,
+            repo[commit_id],
+            path,
+            render_cache,
+            stats,
+            renderings,
+            owner_path=job.path,
+        )
+
+    write_page(
+        writer,
+        job.path,
+        page,
+        attachments,
+        render_cache,
+        stats,
+        history=get_page_history(revisions.documents),
+    )
+
+    # the page document already holds the rendering of the current blob
+    renderings.pop(bytes_to_text(page.id), None)
+
+    write_renderings(writer, renderings, stats, owner_path=job.path)
+
+    for document in revisions.documents:
+        writer.add_document(**document)
+
+
+def write_renderings(
+        writer: IndexWriter,
+        renderings: Dict[str, api.RenderedPage],
+        stats: BuildStats=NULL_STATS,
+        owner_path: Optional[str]=None,
+):
+    """
+    Writes a ``rendered`` document for each of `renderings` by blob id.
+    They are written into the group of the page at `owner_path`, after the
+    page and its attachments, so that they are deleted and rewritten along
+    with it.
+    """
+
+    keys = {} if owner_path is None else dict(owner_path=owner_path)
+
+    for blob_id, rendered in sorted(renderings.items()):
+
+        stats.count('renderings')
+
+        writer.add_document(
+            kind='rendered',
+            rendered_blob_id=blob_id,
+            rendered_page=tuple(rendered),
+            **keys
+        )
+
+
+def get_page_history(documents: Iterable[Dict]) -> List[Dict]:
+    """
+    Returns the summary of every revision among `documents`, newest first.
+    """
+
+    history = [
+        api.history_entry(d)
+        for d in documents
+        if d['kind'] == 'revision'
+    ]
+
+    history.sort(key=lambda r: r['revision_commit_time'], reverse=True)
+
+    return history
+
+
+def preload_page_jobs(
+        repo: BaseRepo,
+        page_jobs: List[PageJob],
+        stats: BuildStats=NULL_STATS,
+):
+    """
+    Reads the current objects of the pages of `page_jobs` into the object
+    cache of `repo` in the order they are stored, see
+    :func:`git_storage.preload_pages`.
+    """
+
+    with stats.timer('preload'):
+        loaded = git_storage.preload_pages(
+            repo,
+            [job.page_tree_id for job in page_jobs],
+        )
+
+    stats.count('preloaded objects', loaded)
+
+
+def _batches(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _write_page_groups_parallel(
+        writer: IndexWriter,
+        repo: BaseRepo,
+        page_jobs: List[PageJob],
+        render_cache: BaseCache,
+        jobs: int,
+        stats: BuildStats=NULL_STATS,
+):
+
+    # forked workers inherit the repository and cache, which also works for
+    # in-memory repositories that cannot be reopened by path
+    context = multiprocessing.get_context('fork')
+    batch_size = max(1, min(16, len(page_jobs) // (jobs * 4)))
+
+    with context.Pool(
+            jobs,
+            initializer=_init_worker,
+            initargs=(repo, render_cache),
+    ) as pool:
+
+        # each task is a batch of pages so that workers read ahead the
+        # objects of several pages at once
+        batches = pool.imap(
+            _page_groups_documents,
+            _batches(page_jobs, batch_size),
+        )
+
+        while True:
+
+            with stats.timer('wait for workers'):
+                batch = next(batches, None)
+
+            if batch is None:
+                break
+
+            groups, worker_stats = batch
+            stats.merge(worker_stats)
+
+            for documents in groups:
+                with writer.group():
+                    for document in documents:
+                        writer.add_document(**document)
+
+
+_worker_repo: Optional[BaseRepo] = None
+_worker_render_cache: Optional[BaseCache] = None
+
+
+def _init_worker(repo: BaseRepo, render_cache: BaseCache):
+
+    global _worker_repo, _worker_render_cache
+
+    # open pack files afresh rather than sharing file offsets with the
+    # parent process, keeping the objects it had cached
+    if isinstance(repo, CachedRepo) and isinstance(repo.repo, Repo):
+        repo = CachedRepo(Repo(repo.repo.path), repo.object_cache)
+    elif isinstance(repo, Repo):
+        repo = Repo(repo.path)
+
+    _worker_repo = repo
+    _worker_render_cache = render_cache
+
+
+def _page_groups_documents(
+        page_jobs: List[PageJob],
+) -> Tuple[List[List[Dict]], Dict]:
+
+    stats = BuildStats()
+    object_cache = getattr(_worker_repo, 'object_cache', None)
+    object_cache_stats = object_cache and object_cache.stats()
+
+    preload_page_jobs(_worker_repo, page_jobs, stats)
+
+    groups = []
+
+    for job in page_jobs:
+        buffer = DocumentBuffer()
+        write_page_group(
+            buffer,
+            _worker_repo,
+            job,
+            _worker_render_cache,
+            stats,
+        )
+        groups.append(buffer.documents)
+
+    if object_cache is not None:
+        count_object_cache(stats, object_cache, object_cache_stats)
+
+    return groups, stats.as_dict()
+
+
+def count_object_cache(
+        stats: BuildStats,
+        cache: ObjectCache,
+        since: Dict[str, int],
+):
+    """
+    Adds the hits, misses and evictions of `cache` since it had the
+    :meth:`ObjectCache.stats` `since` to `stats`.
+    """
+
+    current = cache.stats()
+
+    for name in ('hits', 'misses', 'evictions'):
+        stats.count('object cache %s' % name, current[name] - since[name])
+
+
+def delete_page(writer: IndexWriter, path: str):
+    """
+    Deletes the page at `path` along with every document in its group, or
+    every document that belongs to it when the index is laid out as tables.
+    """
+
+    pages = Term('kind', 'page')
+    page = pages & Term('page_path', path)
+
+    if has_keys(writer.schema):
+        writer.delete_by_query(Term('owner_path', path))
+    else:
+        writer.delete_by_query(NestedChildren(pages, page))
+
+    writer.delete_by_query(page)
+
+
+def cache_attachments(
+        index: Index,
+        repo: BaseRepo,
+        cache: BlobFileCache,
+        stats: BuildStats=NULL_STATS,
+):
+    """
+    Adds the data of the current attachments of every page in `index` to
+    `cache`, so that the first requests for them need not read the
+    repository. Attachments of older revisions are added on first request.
+    """
+
+    with index.searcher() as searcher:
+        blob_ids = set(
+            fields['attachment_data_blob_id']
+            for fields in searcher.documents(kind='page-attachment')
+        )
+
+    with stats.timer('cache attachments'):
+        for blob_id in sorted(blob_ids):
+            cache.add(repo, blob_id)
+            stats.count('cached attachments')
+
+
+def _build_state_filename(index: Index) -> str:
+    return '_%s_gitpages.json' % index.indexname
+
+
+def get_indexed_commit(index: Index, repo: BaseRepo) -> Optional[bytes]:
+    """
+    Returns the commit that `index` was last built from, or None when it is
+    unknown, unreachable in `repo` or was written in an older index format.
+    """
+
+    storage = index.storage
+    filename = _build_state_filename(index)
+
+    if not storage.file_exists(filename):
+        return None
+
+    with storage.open_file(filename) as f:
+        state = json.loads(bytes(f.read()))
+
+    if state.get('format') != INDEX_FORMAT:
+        return None
+
+    commit_id = text_to_bytes(state['commit'])
+
+    if commit_id not in repo.object_store:
+        return None
+
+    return commit_id
+
+
+def set_indexed_commit(index: Index, commit_id: bytes):
+
+    storage = index.storage
+    filename = _build_state_filename(index)
+    temp_filename = filename + '.tmp'
+
+    state = dict(
+        commit=bytes_to_text(commit_id),
+        format=INDEX_FORMAT,
+    )
+
+    with storage.create_file(temp_filename) as f:
+        f.write(text_to_bytes(json.dumps(state)))
+
+    storage.rename_file(temp_filename, filename)
+
+
+class ParsedPage(NamedTuple):
+
+    title: str
+    docinfo: Dict[str, str]
+    text: str
+    rendered: api.RenderedPage
+
+
+def parse_page(
+        blob: Blob,
+        cache: Optional[BaseCache]=None,
+        stats: BuildStats=NULL_STATS,
+) -> ParsedPage:
+    """
+    Parses the reST of a page once and derives its title, docinfo, plain
+    text and rendering from the same doctree.
+
+    When a `cache` is given, the metadata, the text and the rendering are
+    stored in it under the blob id, the rendering under the same key that
+    :func:`gitpages.web.api.render_page_content` uses.
+    """
+
+    if cache is None:
+        return _parse_page(blob, stats)
+
+    metadata_key = api.render_cache_key(blob.id, kind='metadata')
+    text_key = api.render_cache_key(blob.id, kind='text')
+    render_key = api.render_cache_key(blob.id)
+
+    with stats.timer('render cache'):
+        metadata, text, rendered = cache.get_many(
+            metadata_key,
+            text_key,
+            render_key,
+        )
+
+    if metadata is not None and text is not None and rendered is not None:
+        stats.count('render cache hits')
+        title, docinfo = metadata
+        return ParsedPage(title, docinfo, text, rendered)
+
+    stats.count('render cache misses')
+
+    parsed = _parse_page(blob, stats)
+
+    with stats.timer('render cache'):
+        cache.set_many(
+            {
+                metadata_key: (parsed.title, parsed.docinfo),
+                text_key: parsed.text,
+                render_key: parsed.rendered,
+            },
+            timeout=0,
+        )
+
+    return parsed
+
+
+def _parse_page(blob: Blob, stats: BuildStats=NULL_STATS) -> ParsedPage:
+
+    with stats.timer('parse rst'):
+        doctree = api.read_page_content(bytes_to_text(blob.data))
+        title = get_title(doctree)
+        docinfo = get_docinfo_as_dict(doctree)
+        # read before rendering, which applies smart quotes to the doctree
+        text = get_text(doctree)
+
+    with stats.timer('render'):
+        rendered = api.render_page_doctree(doctree)
+
+    return ParsedPage(
+        title=title,
+        docinfo=docinfo,
+        text=text,
+        rendered=rendered,
+    )
 
 
 def read_page_rst(page_rst):
@@ -256,6 +1214,18 @@ def get_title(doctree) -> str:
     ).astext()
 
 
+def get_text(doctree) -> str:
+    """
+    Returns the plain text of the body of a page, leaving out its title,
+    docinfo and anything that is not shown.
+    """
+
+    return u'\n\n'.join(
+        c.astext() for c in doctree.children
+        if c.tagname not in _NON_TEXT_NODES
+    )
+
+
 def get_docinfo_as_dict(doctree):
 
     def field_to_tuple(field):
@@ -288,6 +1258,3 @@ def get_docinfo_as_dict(doctree):
     )
 
     return docinfo_as_dict(docinfo)
-
-def render_page(blob: Blob):
-    return api.render_page_content(bytes_to_text(blob.data))
@@ -1,19 +1,29 @@
 # -*- coding: utf-8 -*-
 
-from whoosh.fields import SchemaClass, ID, DATETIME, TEXT, NUMERIC, STORED
+from whoosh.analysis import StemmingAnalyzer
+from whoosh.fields import (
+    SchemaClass, Schema, ID, DATETIME, TEXT, NUMERIC, STORED,
+)
 
 
 class DateRevisionHybrid(SchemaClass):
 
     kind = ID(stored=True)
 
-    page_date = DATETIME(stored=True)
+    # the fields that listings are sorted by keep a column of their values,
+    # so that sorting reads it instead of building sort keys from postings
+    page_date = DATETIME(stored=True, sortable=True)
     page_slug = ID(stored=True)
     page_title = TEXT(stored=True)
     page_status = ID(stored=True)
     page_path = ID(stored=True)
     page_blob_id = ID(stored=True)
     page_rendered = STORED()
+    # the plain text of the page body, stored along with the character
+    # offsets of its terms so that hits are highlighted without analyzing
+    # the text again
+    page_text = TEXT(analyzer=StemmingAnalyzer(), stored=True, chars=True)
+    page_history = STORED()
 
     revision_date = DATETIME(stored=True)
     revision_slug = ID(stored=True)
@@ -26,9 +36,13 @@ class DateRevisionHybrid(SchemaClass):
     revision_author = ID(stored=True)
     revision_committer = ID(stored=True)
     revision_author_time = DATETIME(stored=True)
-    revision_commit_time = DATETIME(stored=True)
+    revision_commit_time = DATETIME(stored=True, sortable=True)
     revision_message = TEXT(stored=True)
-    revision_rendered = STORED()
+
+    # renderings of the revisions of a page, one for each distinct blob
+    # other than the current one of the page, which its document holds
+    rendered_blob_id = ID(stored=True)
+    rendered_page = STORED()
 
     attachment_id = ID(stored=True)
     attachment_data_blob_id = ID(stored=True)
@@ -36,3 +50,43 @@ class DateRevisionHybrid(SchemaClass):
     attachment_content_type = ID(stored=True)
     attachment_content_disposition = ID(stored=True)
     attachment_content_length = NUMERIC(stored=True)
+
+    summary_path = ID(stored=True)
+    summary_statuses = ID(stored=True)
+    summary_page_prev = STORED()
+    summary_page_next = STORED()
+    summary_recent_pages = STORED()
+    summary_history = STORED()
+    summary_revision_count = STORED()
+
+
+class DateRevisionTables(DateRevisionHybrid):
+    """
+    Lays out the same documents as :class:`DateRevisionHybrid` as tables
+    of pages, revisions and attachments, told apart by their kind and
+    linked by explicit keys rather than by nesting them in writer groups.
+    """
+
+    # the path of the page that a revision, attachment or rendering
+    # belongs to, which its page path may differ from once it is renamed
+    owner_path = ID()
+
+    # the page or revision path and the revision tree that an attachment
+    # belongs to, the latter only for attachments of revisions
+    attachment_page_path = ID()
+    attachment_tree_id = ID()
+
+
+INDEX_LAYOUTS = {
+    'hybrid': DateRevisionHybrid,
+    'tables': DateRevisionTables,
+}
+
+
+def has_keys(schema: Schema) -> bool:
+    """
+    Returns whether `schema` links documents by keys, as
+    :class:`DateRevisionTables` does, rather than by writer groups.
+    """
+
+    return 'owner_path' in schema
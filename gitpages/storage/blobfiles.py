@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import tempfile
+import threading
+from os.path import join
+from typing import Iterator, List, Optional, Tuple
+
+from dulwich.repo import BaseRepo
+
+from .objects import CHUNK_SIZE, iter_object_data
+
+
+_log = logging.getLogger(__name__)
+
+
+class BlobFileCache(object):
+    """
+    Keeps the data of blobs as files in `directory`, named after their blob
+    ids, so that they can be sent by the operating system or a front-end
+    server without reading the repository.
+
+    Since blobs never change, a cached file is written once and never
+    rewritten. When `max_size` bytes are exceeded, the least recently used
+    files are removed until the cache is down to `low_water` of it. Files
+    are marked as used by their modification time.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            max_size: Optional[int]=None,
+            low_water: float=0.9,
+    ):
+        self.directory = directory
+        self.max_size = max_size
+        self.low_water = low_water
+
+        self._lock = threading.Lock()
+        # an estimate of the bytes in the cache, None until it is counted
+        self._size: Optional[int] = None
+
+    def path(self, blob_id: str) -> str:
+        """
+        Returns the path of the file of `blob_id` relative to the cache
+        directory.
+        """
+
+        return join(blob_id[:2], blob_id[2:])
+
+    def filename(self, blob_id: str) -> str:
+        return join(self.directory, self.path(blob_id))
+
+    def get(self, blob_id: str) -> Optional[str]:
+        """
+        Returns the file name of the cached data of `blob_id`, or None when
+        it is not cached.
+        """
+
+        filename = self.filename(blob_id)
+
+        try:
+            os.utime(filename)
+        except OSError:
+            return None
+
+        return filename
+
+    def add(self, repository: BaseRepo, blob_id: str) -> str:
+        """
+        Writes the data of `blob_id` from `repository` to the cache unless
+        it is already there and returns its file name.
+        """
+
+        filename = self.get(blob_id)
+
+        if filename is not None:
+            return filename
+
+        filename = self.filename(blob_id)
+        directory = os.path.dirname(filename)
+
+        os.makedirs(directory, exist_ok=True)
+
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter_object_data(
+                        repository,
+                        blob_id.encode('ascii'),
+                ):
+                    f.write(chunk)
+                size = f.tell()
+            os.replace(temporary, filename)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+        _log.debug('cached blob %s (%d bytes)', blob_id, size)
+
+        self._added(size)
+
+        return filename
+
+    def _added(self, size: int):
+
+        if self.max_size is None:
+            return
+
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+                if self._size <= self.max_size:
+                    return
+
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Removes the least recently used files while the cache holds more
+        than `max_size` bytes and returns the number of bytes removed.
+        """
+
+        files = self._files()
+        size = sum(file_size for _mtime, file_size, _filename in files)
+        removed = 0
+
+        if self.max_size is not None and size > self.max_size:
+
+            target = int(self.max_size * self.low_water)
+
+            for _mtime, file_size, filename in sorted(files):
+
+                if size - removed <= target:
+                    break
+
+                try:
+                    os.unlink(filename)
+                except OSError:
+                    continue
+
+                removed += file_size
+
+            _log.info('evicted %d bytes of cached blobs', removed)
+
+        with self._lock:
+            self._size = size - removed
+
+        return removed
+
+    def _files(self) -> List[Tuple[float, int, str]]:
+
+        files = []
+
+        for root, _directories, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith('.tmp-'):
+                    continue
+                filename = join(root, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, filename))
+
+        return files
+
+
+def iter_file_data(
+        filename: str,
+        start: int=0,
+        end: Optional[int]=None,
+        chunk_size: int=CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Yields the bytes of `filename` from offset `start` up to `end`, in
+    chunks of at most `chunk_size` bytes.
+    """
+
+    with open(filename, 'rb') as f:
+
+        f.seek(start)
+        remaining = (
+            os.fstat(f.fileno()).st_size if end is None else end
+        ) - start
+
+        while remaining > 0:
+
+            chunk = f.read(min(chunk_size, remaining))
+
+            if not chunk:
+                break
+
+            remaining -= len(chunk)
+
+            yield chunk
@@ -2,11 +2,23 @@
 
 import functools
 import posixpath
-from typing import Callable, Iterable, Generator, NamedTuple
+from typing import (
+    Callable,
+    Container,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+)
 
 from dulwich.repo import BaseRepo
-from dulwich.objects import Blob, Tree, TreeEntry
+from dulwich.objects import Blob, Commit, Tree, TreeEntry
+from dulwich.walk import Walker, ORDER_TOPO
 
+from .objects import get_object_size, preload_objects
 from ..util.compat import (
     _text_to_bytes as _to_bytes,
     _bytes_to_text as _from_bytes,
@@ -37,6 +49,7 @@ class PageAttachment(NamedTuple):
 
     data_callable: LazyBlob
     metadata_callable: Callable
+    size_callable: Callable[[], int]
 
     @property
     def tree_id_text(self) -> str:
@@ -58,6 +71,10 @@ class PageAttachment(NamedTuple):
     def metadata(self):
         return self.metadata_callable()
 
+    @property
+    def size(self) -> int:
+        return self.size_callable()
+
 
 class PageRef(NamedTuple):
     path: str
@@ -71,6 +88,11 @@ class Page(NamedTuple):
     attachments: Iterable[PageAttachment]
 
 
+class PageRevision(NamedTuple):
+    commit: Commit
+    path: str
+
+
 def get_pages_tree(
         repository: BaseRepo,
         ref: bytes=b'HEAD',
@@ -82,15 +104,205 @@ def get_pages_tree(
     return repository[root[PAGES_TREE_BYTES][1]]
 
 
+def get_pages_tree_id(
+        repository: BaseRepo,
+        commit_id: bytes,
+) -> Optional[bytes]:
+
+    root = repository[repository[commit_id].tree]
+
+    try:
+        _mode, pages_tree_id = root[PAGES_TREE_BYTES]
+    except KeyError:
+        return None
+
+    return pages_tree_id
+
+
+def find_changed_page_trees(
+        repository: BaseRepo,
+        since: bytes,
+        until: bytes,
+) -> Set[str]:
+    """
+    Returns the names of the page trees that differ between the commits
+    `since` and `until` or that were touched by any commit in between.
+    """
+
+    store = repository.object_store
+
+    def changed(old_commit_id, new_commit_id):
+
+        old_tree_id = (
+            None if old_commit_id is None
+            else get_pages_tree_id(repository, old_commit_id)
+        )
+        new_tree_id = get_pages_tree_id(repository, new_commit_id)
+
+        return _diff_pages_trees(
+            _tree_entries(repository, old_tree_id),
+            _tree_entries(repository, new_tree_id),
+        )
+
+    page_trees = changed(since, until)
+
+    for entry in Walker(store, include=[until], exclude=[since]):
+        commit = entry.commit
+        for parent in commit.parents or [None]:
+            page_trees.update(changed(parent, commit.id))
+
+    return set(map(_from_bytes, page_trees))
+
+
+def find_page_revisions(
+        repository: BaseRepo,
+        head: bytes,
+        paths: Optional[Container[str]]=None,
+) -> Dict[str, List[PageRevision]]:
+    """
+    Walks the history of `head` once and returns the commits that touched
+    each page tree, keyed by the page's path in `head`.
+
+    Each commit's pages tree is compared against its parents' a single time
+    and the revision is handed to every page tree that differs. For merges,
+    only the page trees that differ from every parent count, which matches
+    what a path-limited walk reports. A page tree that was removed while
+    another one with an identical page.rst appeared is treated as a rename,
+    so the older history is attributed to the page's current path.
+    """
+
+    store = repository.object_store
+
+    pages_tree_ids: Dict[bytes, Optional[bytes]] = {}
+
+    def pages_tree_id(commit_id: bytes) -> Optional[bytes]:
+        try:
+            return pages_tree_ids[commit_id]
+        except KeyError:
+            tree_id = get_pages_tree_id(repository, commit_id)
+            pages_tree_ids[commit_id] = tree_id
+            return tree_id
+
+    # a commit's pages tree is usually compared again right away as the
+    # parent of the next commit in the walk
+    @functools.lru_cache(maxsize=16)
+    def entries(tree_id: Optional[bytes]) -> Dict[bytes, bytes]:
+        return _tree_entries(repository, tree_id)
+
+    def page_rst_id(page_tree_id: bytes) -> Optional[bytes]:
+        page_tree = repository[page_tree_id]
+        try:
+            return page_tree[PAGE_RST_BYTES][1]
+        except KeyError:
+            return None
+
+    # maps the name a page tree had further back in history to its name
+    # in head
+    current_names: Dict[bytes, bytes] = {}
+
+    revisions: Dict[str, List[PageRevision]] = {}
+
+    for entry in Walker(store, include=[head], order=ORDER_TOPO):
+
+        commit = entry.commit
+        tree_id = pages_tree_id(commit.id)
+
+        if tree_id is None:
+            continue
+
+        new_entries = entries(tree_id)
+        parents_entries = [
+            entries(None if p is None else pages_tree_id(p))
+            for p in commit.parents or [None]
+        ]
+
+        names = set.intersection(*(
+            _diff_pages_trees(old_entries, new_entries)
+            for old_entries in parents_entries
+        ))
+
+        for name in names:
+
+            if name not in new_entries:
+                continue
+
+            path = get_page_path(_from_bytes(current_names.get(name, name)))
+
+            if paths is not None and path not in paths:
+                continue
+
+            if page_rst_id(new_entries[name]) is None:
+                continue
+
+            revisions.setdefault(path, []).append(
+                PageRevision(commit, get_page_path(_from_bytes(name)))
+            )
+
+        if len(parents_entries) == 1:
+
+            old_entries, = parents_entries
+
+            added = [n for n in names if n not in old_entries]
+            removed = dict(
+                (page_rst_id(old_entries[n]), n)
+                for n in names
+                if n not in new_entries
+            )
+            removed.pop(None, None)
+
+            for new_name in added if removed else ():
+                old_name = removed.get(page_rst_id(new_entries[new_name]))
+                if old_name is not None:
+                    current_names[old_name] = current_names.get(
+                        new_name,
+                        new_name,
+                    )
+
+    return revisions
+
+
+def _tree_entries(
+        repository: BaseRepo,
+        tree_id: Optional[bytes],
+) -> Dict[bytes, bytes]:
+
+    if tree_id is None:
+        return {}
+
+    return dict((e.path, e.sha) for e in repository[tree_id].iteritems())
+
+
+def _diff_pages_trees(
+        old_entries: Dict[bytes, bytes],
+        new_entries: Dict[bytes, bytes],
+) -> Set[bytes]:
+    return set(
+        name for name in old_entries.keys() | new_entries.keys()
+        if old_entries.get(name) != new_entries.get(name)
+    )
+
+
+def get_page_path(page_tree_name: str, prefix=PAGES_TREE) -> str:
+    return posixpath.join(prefix, page_tree_name, PAGE_RST)
+
+
 def find_pages(
         repository: BaseRepo,
         pages_tree: Tree,
         prefix=PAGES_TREE,
+        names: Optional[Container[str]]=None,
 ) -> Iterable[PageRef]:
 
+    page_entries = [
+        e for e in pages_tree.iteritems()
+        if names is None or _from_bytes(e.path) in names
+    ]
+
+    preload_objects(repository, (e.sha for e in page_entries))
+
     page_trees = (
         (_from_bytes(e.path), repository[e.sha])
-        for e in pages_tree.iteritems()
+        for e in page_entries
     )
 
     page_trees_with_rst_entries = (
@@ -108,6 +320,49 @@ def find_pages(
     )
 
 
+def preload_pages(repository: BaseRepo, page_tree_ids: Iterable[bytes]) -> int:
+    """
+    Reads the page trees `page_tree_ids`, their ``page.rst`` blobs and their
+    attachment trees and metadata blobs into the object cache of
+    `repository` with :func:`~.objects.preload_objects`, one level of trees
+    at a time, and returns how many objects were read.
+    """
+
+    # without a cache to keep them in, reading ahead is wasted
+    if getattr(repository, 'object_cache', None) is None:
+        return 0
+
+    page_tree_ids = list(page_tree_ids)
+
+    loaded = preload_objects(repository, page_tree_ids)
+
+    page_entries = [
+        e
+        for tree_id in page_tree_ids
+        for e in repository[tree_id].iteritems()
+        if e.path in (PAGE_RST_BYTES, ATTACHMENTS_TREE)
+    ]
+
+    loaded += preload_objects(repository, (e.sha for e in page_entries))
+
+    attachment_tree_ids = [
+        t.sha
+        for e in page_entries if e.path == ATTACHMENTS_TREE
+        for t in repository[e.sha].iteritems()
+    ]
+
+    loaded += preload_objects(repository, attachment_tree_ids)
+
+    loaded += preload_objects(repository, (
+        e.sha
+        for tree_id in attachment_tree_ids
+        for e in repository[tree_id].iteritems()
+        if e.path == ATTACHMENT_METADATA_RST
+    ))
+
+    return loaded
+
+
 def load_pages_with_attachments(
         repository: BaseRepo,
         page_trees_with_rst,
@@ -158,6 +413,11 @@ def load_page_attachments(
             repository.__getitem__,
             metadata_blob_id,
         )
+        size_callable = functools.partial(
+            get_object_size,
+            repository,
+            data_blob_id,
+        )
 
         return PageAttachment(
             attachment_tree.id,
@@ -165,6 +425,7 @@ def load_page_attachments(
             metadata_blob_id,
             data_callable,
             metadata_callable,
+            size_callable,
         )
 
     attachments = next(
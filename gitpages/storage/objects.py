@@ -0,0 +1,498 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from dulwich.objects import ShaFile, hex_to_filename
+from dulwich.object_store import BaseObjectStore
+from dulwich.pack import OFS_DELTA, REF_DELTA, Pack
+from dulwich.repo import BaseRepo
+
+
+_READ_SIZE = 64
+_SIZES_LIMIT = 1 << 16
+
+CHUNK_SIZE = 1 << 16
+
+# object ids are content addresses, so an object's size never changes and
+# can be remembered regardless of which repository it was read from
+_sizes: 'OrderedDict[bytes, int]' = OrderedDict()
+_sizes_lock = threading.Lock()
+
+
+class ObjectCache(object):
+    """
+    Keeps the most recently used parsed git objects, up to `max_bytes` of
+    their data in total. Objects larger than `max_object_bytes`, such as
+    big attachments, are not kept so that one of them can't push out
+    everything else.
+
+    Cached objects are shared by everyone reading them and must not be
+    modified.
+    """
+
+    def __init__(
+            self,
+            max_bytes: int=32 << 20,
+            max_object_bytes: int=1 << 20,
+    ):
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+
+        self._objects: 'OrderedDict[bytes, Tuple[ShaFile, int]]' = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, sha: bytes) -> Optional[ShaFile]:
+
+        with self._lock:
+            try:
+                obj, _size = self._objects[sha]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._objects.move_to_end(sha)
+            self.hits += 1
+            return obj
+
+    def __contains__(self, sha: bytes) -> bool:
+
+        with self._lock:
+            return sha in self._objects
+
+    def add(self, sha: bytes, obj: ShaFile):
+
+        size = obj.raw_length()
+
+        if size > self.max_object_bytes:
+            return
+
+        with self._lock:
+
+            if sha in self._objects:
+                return
+
+            self._objects[sha] = (obj, size)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _sha, (_obj, evicted_size) = self._objects.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            objects=len(self._objects),
+            bytes=self.size,
+        )
+
+
+class CachedObjectStore(object):
+    """
+    Reads objects from `store` through `cache`. Everything else is passed
+    on to `store`.
+    """
+
+    def __init__(self, store: BaseObjectStore, cache: ObjectCache):
+        self.store = store
+        self.cache = cache
+
+    def __getitem__(self, sha: bytes) -> ShaFile:
+
+        obj = self.cache.get(sha)
+
+        if obj is None:
+            obj = self.store[sha]
+            self.cache.add(sha, obj)
+
+        return obj
+
+    def __contains__(self, sha: bytes) -> bool:
+        return sha in self.store
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+class CachedRepo(object):
+    """
+    Stands in for `repo`, reading its objects through `cache`.
+    """
+
+    def __init__(self, repo: BaseRepo, cache: ObjectCache):
+        self.repo = repo
+        self.object_cache = cache
+        self.object_store = CachedObjectStore(repo.object_store, cache)
+
+    def __getitem__(self, name: bytes) -> ShaFile:
+
+        # object ids, leaving refs to the repository
+        if len(name) in (20, 40):
+            try:
+                return self.object_store[name]
+            except KeyError:
+                pass
+
+        return self.repo[name]
+
+    def get_object(self, sha: bytes) -> ShaFile:
+        return self.object_store[sha]
+
+    def __getattr__(self, name):
+        return getattr(self.repo, name)
+
+
+def iter_objects(
+        repository: BaseRepo,
+        shas: Iterable[bytes],
+) -> Iterator[ShaFile]:
+    """
+    Yields the objects `shas`, each once. Packed objects are read pack by
+    pack in the order they are stored, so that the pack files are read
+    forward rather than seeked around in and delta bases shared by nearby
+    objects are still in the delta cache of their pack when they are
+    needed again. Other objects follow in the order given.
+    """
+
+    store = repository.object_store
+    packs = list(_packs(store))
+
+    located = []
+    unpacked = []
+
+    for sha in OrderedDict.fromkeys(shas):
+        for number, pack in enumerate(packs):
+            try:
+                offset = pack.index.object_offset(sha)
+            except KeyError:
+                continue
+            located.append((number, offset, sha))
+            break
+        else:
+            unpacked.append(sha)
+
+    located.sort()
+
+    for number, _offset, sha in located:
+        yield packs[number][sha]
+
+    for sha in unpacked:
+        yield store[sha]
+
+
+def preload_objects(repository: BaseRepo, shas: Iterable[bytes]) -> int:
+    """
+    Reads those of `shas` that are not cached yet into the object cache of
+    `repository`, a :class:`CachedRepo`, with :func:`iter_objects` and
+    returns how many were read. Without an object cache, nothing is read.
+    """
+
+    cache = getattr(repository, 'object_cache', None)
+
+    if cache is None:
+        return 0
+
+    loaded = 0
+
+    for obj in iter_objects(
+            repository.repo,
+            (sha for sha in shas if sha not in cache),
+    ):
+        cache.add(obj.id, obj)
+        loaded += 1
+
+    return loaded
+
+
+def get_object_size(repository: BaseRepo, sha: bytes) -> int:
+    """
+    Returns the uncompressed size of the object `sha` without loading its
+    data.
+
+    For packed objects the size is read from the pack entry header, or from
+    the delta header for deltified entries, and for loose objects from the
+    object header, so only a few bytes are ever inflated. Object stores that
+    are neither fall back to loading the object. Sizes are remembered by
+    object id.
+    """
+
+    with _sizes_lock:
+        try:
+            _sizes.move_to_end(sha)
+        except KeyError:
+            pass
+        else:
+            return _sizes[sha]
+
+    size = _read_object_size(repository.object_store, sha)
+
+    with _sizes_lock:
+        _sizes[sha] = size
+        if len(_sizes) > _SIZES_LIMIT:
+            _sizes.popitem(last=False)
+
+    return size
+
+
+def _read_object_size(store: BaseObjectStore, sha: bytes) -> int:
+
+    for pack in _packs(store):
+        try:
+            offset = pack.index.object_offset(sha)
+        except KeyError:
+            continue
+        return _packed_object_size(pack.data.path, offset)
+
+    loose_path = _loose_object_path(store, sha)
+
+    if loose_path is not None and os.path.exists(loose_path):
+        return _loose_object_size(loose_path)
+
+    return store[sha].raw_length()
+
+
+def iter_object_data(
+        repository: BaseRepo,
+        sha: bytes,
+        start: int=0,
+        end: Optional[int]=None,
+        chunk_size: int=CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Yields the data of the object `sha` from offset `start` up to `end`, in
+    chunks of at most `chunk_size` bytes.
+
+    Packed objects that are not deltified and loose objects are inflated
+    straight from their files one chunk at a time, so the memory used does
+    not depend on the size of the object. The data before `start` is
+    inflated and dropped since a zlib stream can't be seeked. Deltified
+    objects and object stores that are neither are loaded whole.
+    """
+
+    store = repository.object_store
+    chunks = None
+
+    for pack in _packs(store):
+        try:
+            offset = pack.index.object_offset(sha)
+        except KeyError:
+            continue
+        chunks = _iter_packed_object(pack.data.path, offset, chunk_size)
+        break
+    else:
+        loose_path = _loose_object_path(store, sha)
+        if loose_path is not None and os.path.exists(loose_path):
+            chunks = _iter_loose_object(loose_path, chunk_size)
+
+    if chunks is None:
+        chunks = iter(store[sha].as_raw_chunks())
+
+    return _slice_chunks(chunks, start, end)
+
+
+def _iter_packed_object(
+        path: str,
+        offset: int,
+        chunk_size: int,
+) -> Optional[Iterator[bytes]]:
+
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        type_num, _size, position = _read_entry_header(f.read(32))
+
+    if type_num in (OFS_DELTA, REF_DELTA):
+        return None
+
+    return _inflate(path, offset + position, chunk_size)
+
+
+def _iter_loose_object(path: str, chunk_size: int) -> Iterator[bytes]:
+
+    chunks = _inflate(path, 0, chunk_size)
+    header = b''
+
+    # the data follows a header of the type and size ending in a null byte
+    for chunk in chunks:
+        header += chunk
+        if b'\0' in header:
+            break
+
+    _header, data = header.split(b'\0', 1)
+
+    if data:
+        yield data
+
+    yield from chunks
+
+
+def _inflate(path: str, offset: int, chunk_size: int) -> Iterator[bytes]:
+
+    with open(path, 'rb') as f:
+
+        f.seek(offset)
+        decompressor = zlib.decompressobj()
+
+        while not decompressor.eof:
+
+            compressed = decompressor.unconsumed_tail or f.read(chunk_size)
+
+            if not compressed:
+                raise ValueError('truncated object at %d in %s' % (offset, path))
+
+            chunk = decompressor.decompress(compressed, chunk_size)
+
+            if chunk:
+                yield chunk
+
+
+def _slice_chunks(
+        chunks: Iterator[bytes],
+        start: int,
+        end: Optional[int],
+) -> Iterator[bytes]:
+
+    position = 0
+
+    try:
+        for chunk in chunks:
+
+            chunk_end = position + len(chunk)
+
+            if chunk_end > start:
+                yield chunk[
+                    max(0, start - position):
+                    len(chunk) if end is None else max(0, end - position)
+                ]
+
+            position = chunk_end
+
+            if end is not None and position >= end:
+                break
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _packs(store: BaseObjectStore) -> Iterable[Pack]:
+    try:
+        return store.packs
+    except NotImplementedError:
+        return ()
+
+
+def _loose_object_path(store: BaseObjectStore, sha: bytes) -> Optional[str]:
+
+    path = getattr(store, 'path', None)
+
+    if path is None:
+        return None
+
+    return hex_to_filename(os.fspath(path), sha.decode('ascii'))
+
+
+def _loose_object_size(path: str) -> int:
+
+    decompressor = zlib.decompressobj()
+    header = b''
+
+    with open(path, 'rb') as f:
+        while b'\0' not in header:
+            chunk = f.read(_READ_SIZE)
+            if not chunk:
+                raise ValueError('truncated loose object %s' % path)
+            header += decompressor.decompress(chunk)
+
+    _type_name, size = header.split(b'\0', 1)[0].split(b' ', 1)
+
+    return int(size)
+
+
+def _packed_object_size(path: str, offset: int) -> int:
+
+    with open(path, 'rb') as f:
+
+        f.seek(offset)
+        entry_header = f.read(32)
+
+        type_num, size, position = _read_entry_header(entry_header)
+
+        if type_num not in (OFS_DELTA, REF_DELTA):
+            return size
+
+        # the size in the entry header is the size of the delta; the size
+        # of the object it produces follows the base size at the start of
+        # the delta data
+        f.seek(offset + position)
+
+        decompressor = zlib.decompressobj()
+        delta_header = b''
+
+        while True:
+            chunk = f.read(_READ_SIZE)
+            if not chunk:
+                raise ValueError('truncated delta at %d in %s' % (offset, path))
+            delta_header += decompressor.decompress(chunk)
+            try:
+                _base_size, position = _read_varint(delta_header, 0)
+                target_size, _position = _read_varint(delta_header, position)
+            except IndexError:
+                continue
+            return target_size
+
+
+def _read_entry_header(data: bytes) -> Tuple[int, int, int]:
+    """
+    Decodes the type, size and length of the pack entry header at the start
+    of `data`, including the reference to the delta base if there is one.
+    """
+
+    byte = data[0]
+    type_num = (byte >> 4) & 0x07
+    size = byte & 0x0f
+    shift = 4
+    position = 1
+
+    while byte & 0x80:
+        byte = data[position]
+        position += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+
+    if type_num == OFS_DELTA:
+        while data[position] & 0x80:
+            position += 1
+        position += 1
+    elif type_num == REF_DELTA:
+        position += 20
+
+    return type_num, size, position
+
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+
+    value = 0
+    shift = 0
+
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
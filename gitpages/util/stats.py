@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+class BuildStats(object):
+    """
+    Accumulates the time spent in and the number of passes through each
+    named stage of an index build, along with plain counters.
+
+    Timing a stage costs two calls to :func:`time.perf_counter`, so a build
+    can be instrumented unconditionally.
+    """
+
+    def __init__(self):
+        self.timers: Dict[str, List] = {}
+        self.counters: Dict[str, int] = {}
+
+    @contextmanager
+    def timer(self, name: str):
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float, calls: int=1):
+
+        timer = self.timers.get(name)
+
+        if timer is None:
+            timer = self.timers[name] = [0.0, 0]
+
+        timer[0] += seconds
+        timer[1] += calls
+
+    def count(self, name: str, n: int=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other: Dict):
+        """
+        Adds the timers and counters of `other`, as returned by
+        :meth:`as_dict`, to these.
+        """
+
+        for name, timer in other['timers'].items():
+            self.add_time(name, timer['seconds'], timer['calls'])
+
+        for name, n in other['counters'].items():
+            self.count(name, n)
+
+    def as_dict(self) -> Dict:
+        return dict(
+            timers=dict(
+                (name, dict(seconds=seconds, calls=calls))
+                for name, (seconds, calls) in self.timers.items()
+            ),
+            counters=dict(self.counters),
+        )
+
+    def format_table(self) -> List[str]:
+
+        width = max(
+            [len(name) for name in self.timers] +
+            [len(name) for name in self.counters] +
+            [len('stage')]
+        )
+
+        lines = [
+            '%-*s %12s %10s %12s' % (width, 'stage', 'seconds', 'calls',
+                                     'ms/call'),
+        ]
+
+        for name, (seconds, calls) in self.timers.items():
+            lines.append('%-*s %12.3f %10d %12.3f' % (
+                width,
+                name,
+                seconds,
+                calls,
+                1000 * seconds / calls if calls else 0.0,
+            ))
+
+        if self.counters:
+            lines.append('')
+            lines.append('%-*s %12s' % (width, 'counter', 'value'))
+            for name, n in self.counters.items():
+                lines.append('%-*s %12d' % (width, name, n))
+
+        return lines
+
+
+class NullBuildStats(BuildStats):
+    """
+    Stands in for :class:`BuildStats` when nothing is collected.
+    """
+
+    @contextmanager
+    def timer(self, name: str):
+        yield
+
+    def add_time(self, name: str, seconds: float, calls: int=1):
+        pass
+
+    def count(self, name: str, n: int=1):
+        pass
+
+
+NULL_STATS = NullBuildStats()
+
+
+class TimedWriter(object):
+    """
+    Wraps an index writer to time and count the documents added through it.
+    """
+
+    def __init__(self, writer, stats: BuildStats):
+        self._writer = writer
+        self._stats = stats
+
+    def add_document(self, **fields):
+
+        with self._stats.timer('add document'):
+            self._writer.add_document(**fields)
+
+        self._stats.count('documents')
+
+    def __getattr__(self, name):
+        return getattr(self._writer, name)
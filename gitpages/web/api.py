@@ -1,26 +1,46 @@
 # -*- coding: utf-8 -*-
 
+import heapq
 import logging
 import re
 from datetime import datetime, timedelta
-from functools import partial
+from functools import lru_cache, partial
+from hashlib import sha1
 from typing import (
         Any,
         Callable,
         Dict,
         Iterable,
+        Iterator,
+        List,
         Mapping,
         NamedTuple,
         Optional,
         Tuple,
 )
 
+from cachelib import BaseCache
 from flask import url_for
-from whoosh.query import Term, DateRange, And, Or, NestedChildren, Every
+from whoosh.fields import Schema
+from whoosh.highlight import HtmlFormatter, PinpointFragmenter
+from whoosh.qparser import FieldsPlugin, MultifieldParser, WildcardPlugin
+from whoosh.query import (
+        And,
+        ConstantScoreQuery,
+        DateRange,
+        Every,
+        NestedChildren,
+        NullQuery,
+        Or,
+        Term,
+)
+from whoosh.searching import ResultsPage
 
 from dulwich.objects import Blob
 
 from .exceptions import PageNotFound, AttachmentNotFound
+from ..schema import has_keys
+from ..storage.objects import iter_object_data
 
 
 _log = logging.getLogger(__name__)
@@ -29,7 +49,38 @@ _content_disposition_expression = re.compile(
 )
 
 DocutilsParts = Mapping[str, Any]
-LazyDocutilsParts = Callable[[], DocutilsParts]
+
+# the format of the date of a listing cursor token, which is the date as
+# indexed, without its time zone
+_CURSOR_DATE_FORMAT = '%Y%m%d%H%M%S%f'
+_cursor_token_expression = re.compile(r'^([0-9]{20})-([0-9a-f]{40})$')
+
+# the revision fields kept in the history stored with each page
+HISTORY_FIELDS = (
+    'revision_commit_id',
+    'revision_tree_id',
+    'revision_status',
+    'revision_author_time',
+    'revision_commit_time',
+    'revision_message',
+)
+
+
+class RenderedPage(NamedTuple):
+    """
+    The parts of the docutils rendering of a page that are served, which is
+    all that the index keeps of it.
+    """
+
+    title: str
+    body: str
+
+    @classmethod
+    def from_parts(cls, parts: DocutilsParts) -> 'RenderedPage':
+        return cls(title=parts['title'], body=parts['body'])
+
+
+LazyRenderedPage = Callable[[], RenderedPage]
 
 LazyBlob = Callable[[], Blob]
 
@@ -70,7 +121,7 @@ class PageInfo(NamedTuple):
 class Page(NamedTuple):
 
     info: PageInfo
-    doc: LazyDocutilsParts
+    doc: LazyRenderedPage
 
     def to_url(self, _external=False):
         return self.info.to_url(_external=_external)
@@ -79,12 +130,136 @@ class Page(NamedTuple):
         return self.info.to_url_tree(tree_id, _external=_external)
 
 
+class PageSummary(NamedTuple):
+    """
+    What a page view shows besides the page itself, as precomputed by the
+    indexer for one set of statuses.
+    """
+
+    page_prev: Optional[PageInfo]
+    page_next: Optional[PageInfo]
+    recent_pages: List[PageInfo]
+    history: List[Dict]
+    revision_count: int
+
+    @property
+    def latest_revision(self) -> Optional[Dict]:
+        return self.history[0] if self.history else None
+
+
+class ListingCursor(NamedTuple):
+    """
+    The place of a page in a listing, which lists pages from the newest to
+    the oldest and those of the same date by descending blob id. A listing
+    continues after a cursor by picking the pages dated before it rather
+    than by skipping over the pages of every previous listing page.
+    """
+
+    date: datetime
+    blob_id: str
+
+    @classmethod
+    def from_info(cls, info: PageInfo) -> 'ListingCursor':
+        return cls(_wall_time(info.date), info.blob_id)
+
+    def to_token(self) -> str:
+        return '%s-%s' % (
+            self.date.strftime(_CURSOR_DATE_FORMAT),
+            self.blob_id,
+        )
+
+    @classmethod
+    def from_token(cls, token: str) -> 'ListingCursor':
+        """
+        Returns the cursor that `token` stands for, or raises ValueError
+        when it is not a token made by :meth:`to_token`.
+        """
+
+        match = _cursor_token_expression.match(token)
+
+        if match is None:
+            raise ValueError('invalid listing cursor %r' % token)
+
+        date, blob_id = match.groups()
+
+        return cls(datetime.strptime(date, _CURSOR_DATE_FORMAT), blob_id)
+
+
+class ListingPage(NamedTuple):
+
+    pages: List[Page]
+    # the cursor that the pages were listed after, None for the newest ones
+    after: Optional[ListingCursor]
+    # the cursor to list the following pages after, None on the last page
+    next: Optional[ListingCursor]
+    # the counts index templates were given before listings had cursors
+    results_page: 'ListingResultsPage'
+
+
+class ListingResultsPage(object):
+    """
+    Tells the number of a listing page, and how many pages and results the
+    listing has, like the whoosh results page that index templates used to
+    be given.
+
+    Unlike the listing page itself, these take going through every page of
+    the listing, so they are only counted once one of them is read.
+    """
+
+    def __init__(self, count: Callable[[], Tuple[int, int]], pagelen: int):
+        # returns the number of pages in the listing and of those before it
+        self._count = count
+        self._counts: Optional[Tuple[int, int]] = None
+        self.pagelen = pagelen
+
+    def _counted(self) -> Tuple[int, int]:
+
+        if self._counts is None:
+            self._counts = self._count()
+
+        return self._counts
+
+    @property
+    def total(self) -> int:
+        return self._counted()[0]
+
+    @property
+    def offset(self) -> int:
+        return self._counted()[1]
+
+    @property
+    def pagenum(self) -> int:
+        return self.offset // self.pagelen + 1
+
+    @property
+    def pagecount(self) -> int:
+        return -(-self.total // self.pagelen)
+
+    def is_last_page(self) -> bool:
+        return self.pagecount == 0 or self.pagenum >= self.pagecount
+
+    def __len__(self) -> int:
+        return self.total
+
+
+class SearchHit(NamedTuple):
+
+    info: PageInfo
+    score: float
+    # HTML fragments of the page text around the matched terms
+    highlights: str
+
+    def to_url(self, _external=False):
+        return self.info.to_url(_external=_external)
+
+
 class PageAttachmentMetadata(NamedTuple):
 
     attachment_id: str
     content_type: str
     content_disposition: str
     content_length: int
+    data_blob_id: str
 
     def to_url(self, attachment=True, _external=False):
         return url_for(
@@ -110,6 +285,9 @@ class PageAttachment(NamedTuple):
 
     metadata: PageAttachmentMetadata
     data: LazyBlob
+    # yields the data from a start offset up to an end offset a chunk at a
+    # time, see gitpages.storage.objects.iter_object_data
+    stream: Callable[..., Iterator[bytes]]
 
     @property
     def filename(self) -> str:
@@ -124,25 +302,122 @@ class PageAttachment(NamedTuple):
 
 def statuses_query(status_field_prefix, statuses):
     field_name = status_field_prefix + '_status'
-    return Or([Term(field_name, s) for s in statuses])
+    # sorted so that the query, and any cache key made from it, does not
+    # depend on the iteration order of a set of statuses
+    return Or([Term(field_name, s) for s in sorted(statuses)])
 
 
-def _to_bytes(s):
-    return s.encode('ascii')
+def statuses_key(statuses: Iterable[str]) -> str:
+    return u','.join(sorted(set(statuses)))
+
+
+def history_entry(revision) -> Dict:
+    """
+    Returns what the history of a page, as given to templates, keeps of the
+    stored fields of `revision`.
+    """
+
+    return dict((name, revision[name]) for name in HISTORY_FIELDS)
 
 
-def _get_attachement_data_blob_id(result):
-    return _to_bytes(result['attachment_data_blob_id'])
+def _wall_time(date: datetime) -> datetime:
+    # the index drops the time zones of dates, so they are sorted and
+    # compared by their wall time
+    return date.replace(tzinfo=None)
+
+
+def listing_key(page) -> Tuple[datetime, str]:
+    """
+    Returns what the stored fields `page` are ordered by in listings, which
+    list the greatest first.
+    """
+
+    # pages of the same date are told apart by their blob ids, so that a
+    # listing cursor has a single place in a listing
+    return _wall_time(page['page_date']), page['page_blob_id']
+
+
+def search_parser(
+        schema: Schema,
+        field_boosts: Mapping[str, float],
+) -> MultifieldParser:
+    """
+    Returns a parser of search queries over the fields of `field_boosts`,
+    weighted by them.
+
+    Queries can't name other fields, and wildcards are left out since each
+    one expands to every matching term in the index.
+    """
+
+    parser = MultifieldParser(
+        list(field_boosts),
+        schema,
+        fieldboosts=dict(field_boosts),
+    )
+    parser.remove_plugin_class(FieldsPlugin)
+    parser.remove_plugin_class(WildcardPlugin)
+
+    return parser
+
+
+def _to_bytes(s):
+    return s.encode('ascii')
 
 
 class GitPages(object):
 
     _max_timedelta = timedelta(days=1)
     _default_statuses = frozenset(('published',))
+    _default_field_boosts = {'page_title': 4.0, 'page_text': 1.0}
+
+    def __init__(
+            self,
+            repo,
+            searcher,
+            result_cache=None,
+            generation=None,
+            attachment_map=None,
+    ):
+        """
+        When a `result_cache` is given, search results are looked up in and
+        added to it under `generation`, which must change whenever the index
+        behind `searcher` does.
+
+        When an `attachment_map` of the index behind `searcher` is given,
+        attachments are looked up in it instead of searched for, see
+        :func:`gitpages.web.attachments.write_attachment_map`.
+        """
 
-    def __init__(self, repo, searcher):
         self._repo = repo
         self._searcher = searcher
+        self._result_cache = result_cache
+        self._generation = generation
+        self._attachment_map = attachment_map
+        # indexes laid out as tables link documents by keys instead of
+        # nesting them in groups, see DateRevisionTables
+        self._keys = has_keys(searcher.schema)
+
+    def _search(self, query, **options):
+        return self._cached_search('search', query, options)
+
+    def _search_page(self, query, pagenum, pagelen=10, **options):
+
+        options.update(pagenum=pagenum, pagelen=pagelen)
+
+        return self._cached_search('search_page', query, options)
+
+    def _cached_search(self, method, query, options):
+
+        if self._result_cache is None:
+            return getattr(self._searcher, method)(query, **options)
+
+        return self._result_cache.search(
+            self._searcher,
+            self._generation,
+            method,
+            query,
+            **options
+        )
 
     @classmethod
     def _load_page_info(cls, page: dict) -> PageInfo:
@@ -172,21 +447,39 @@ class GitPages(object):
             revision_date=revision['revision_date'],
         )
 
+    @classmethod
+    def _load_page_summary(cls, result) -> PageSummary:
+
+        def page_info(page):
+            return None if page is None else cls._load_page_info(page)
+
+        return PageSummary(
+            page_prev=page_info(result.get('summary_page_prev')),
+            page_next=page_info(result.get('summary_page_next')),
+            recent_pages=[
+                cls._load_page_info(p) for p in result['summary_recent_pages']
+            ],
+            history=result['summary_history'],
+            revision_count=result['summary_revision_count'],
+        )
+
     @classmethod
     def _load_page(cls, result) -> Page:
         return Page(
             info=cls._load_page_info(result),
-            doc=lambda: result['page_rendered'],
+            doc=lambda: RenderedPage._make(result['page_rendered']),
         )
 
-    @classmethod
-    def _load_page_revision(cls, page_result, page_revision_result) -> Page:
+    def _load_page_revision(self, page_result, page_revision_result) -> Page:
         return Page(
-            info=cls._load_page_revision_info(
+            info=self._load_page_revision_info(
                 page_result,
                 page_revision_result,
             ),
-            doc=lambda: page_revision_result['revision_rendered'],
+            doc=partial(
+                self.rendered,
+                page_revision_result['revision_blob_id'],
+            ),
         )
 
     @classmethod
@@ -197,9 +490,18 @@ class GitPages(object):
             content_type=result['attachment_content_type'],
             content_disposition=result['attachment_content_disposition'],
             content_length=result['attachment_content_length'],
+            data_blob_id=result['attachment_data_blob_id'],
         )
 
-        attachment_data_blob_id = _get_attachement_data_blob_id(result)
+        return cls._load_attachment_data(repo, metadata)
+
+    @staticmethod
+    def _load_attachment_data(
+            repo,
+            metadata: PageAttachmentMetadata,
+    ) -> PageAttachment:
+
+        attachment_data_blob_id = _to_bytes(metadata.data_blob_id)
 
         data = partial(
             repo.__getitem__,
@@ -209,11 +511,12 @@ class GitPages(object):
         return PageAttachment(
             metadata=metadata,
             data=data,
+            stream=partial(iter_object_data, repo, attachment_data_blob_id),
         )
 
     def page_by_path(self, path) -> Page:
 
-        results = self._searcher.search(
+        results = self._search(
             Term('kind', 'page') & Term('page_path', path),
             limit=1,
         )
@@ -247,7 +550,7 @@ class GitPages(object):
             )
         )
 
-        results = self._searcher.search(query)
+        results = self._search(query)
 
         if results.is_empty():
             _log.debug('results is empty')
@@ -258,16 +561,13 @@ class GitPages(object):
         if tree_id is None:
             return self._load_page(page_result)
 
-        pq = Term('kind', 'page')
-        cq = Term('page_path', page_result['page_path']) & statuses_clause
-
         q = And([
-            NestedChildren(pq, cq),
+            self._page_documents(page_result['page_path'], statuses_clause),
             Term('revision_tree_id', tree_id),
             statuses_query('revision', statuses),
         ])
 
-        historic_results = self._searcher.search(q)
+        historic_results = self._search(q)
 
         page_revision_result = next(iter(historic_results))
 
@@ -276,6 +576,80 @@ class GitPages(object):
             page_revision_result,
         )
 
+    def _page_documents(self, path: str, statuses_clause):
+        """
+        Returns a query for the documents that belong to the page at `path`
+        as long as the page matches `statuses_clause`.
+        """
+
+        page = Term('kind', 'page') & Term('page_path', path) & statuses_clause
+
+        if not self._keys:
+            return NestedChildren(Term('kind', 'page'), page)
+
+        if self._search(page, limit=1).is_empty():
+            return NullQuery
+
+        return Term('owner_path', path)
+
+    @staticmethod
+    def _attachment_owner_query(page_kind: str, owner):
+
+        q = Term('attachment_page_path', owner[page_kind + '_path'])
+
+        if page_kind == 'revision':
+            q = q & Term('attachment_tree_id', owner['revision_tree_id'])
+
+        return q
+
+    def rendered(self, blob_id: str) -> RenderedPage:
+        """
+        Returns the rendering of the page blob `blob_id`, which the index
+        keeps once for each blob, either with the page whose current blob it
+        is or in a ``rendered`` document.
+        """
+
+        results = self._search(
+            Or([
+                Term('kind', 'rendered') & Term('rendered_blob_id', blob_id),
+                Term('kind', 'page') & Term('page_blob_id', blob_id),
+            ]),
+            limit=1,
+        )
+
+        if results.is_empty():
+            raise PageNotFound(blob_id)
+
+        result = next(iter(results))
+
+        return RenderedPage._make(
+            result['rendered_page'] if result['kind'] == 'rendered'
+            else result['page_rendered']
+        )
+
+    def page_summary(
+            self,
+            path: str,
+            statuses=_default_statuses,
+    ) -> Optional[PageSummary]:
+        """
+        Returns the neighbors, recent pages and history of the page at
+        `path` as seen with `statuses`, or None when the index holds no
+        summary for that combination.
+        """
+
+        results = self._search(
+            Term('kind', 'page-summary') &
+            Term('summary_path', path) &
+            Term('summary_statuses', statuses_key(statuses)),
+            limit=1,
+        )
+
+        if results.is_empty():
+            return None
+
+        return self._load_page_summary(next(iter(results)))
+
     def history(
         self,
         page,
@@ -289,16 +663,13 @@ class GitPages(object):
         statuses_clause = statuses_query('page', statuses)
         revision_statuses_clause = statuses_query('revision', statuses)
 
-        pq = Term('kind', 'page')
-        cq = Term('page_path', path) & statuses_clause
-
         q = And([
-            NestedChildren(pq, cq),
+            self._page_documents(path, statuses_clause),
             Term('kind', 'revision'),
             revision_statuses_clause,
         ])
 
-        results = self._searcher.search_page(
+        results = self._search_page(
             q,
             pagenum=page_number,
             pagelen=page_length,
@@ -313,36 +684,31 @@ class GitPages(object):
         # FIXME: make it impossible to load attachments whose latest commit's
         # page is not publicly visible
 
+        if self._attachment_map is not None:
+
+            if isinstance(attachment_id, bytes):
+                attachment_id = attachment_id.decode('ascii')
+
+            metadata = self._attachment_map.get(attachment_id)
+
+            if metadata is None:
+                raise AttachmentNotFound(attachment_id)
+
+            return self._load_attachment_data(self._repo, metadata)
+
         q = And([
             Term('kind', 'page-attachment')
             | Term('kind', 'revision-attachment'),
             Term('attachment_id', attachment_id),
         ])
 
-        results = self._searcher.search(q)
+        results = self._search(q)
 
         if results.is_empty():
             _log.debug('results is empty')
             raise AttachmentNotFound(attachment_id)
 
-        result = next(iter(results))
-
-        data_blob_id = _get_attachement_data_blob_id(result)
-
-        metadata = PageAttachmentMetadata(
-            attachment_id=result['attachment_id'],
-            content_type=result['attachment_content_type'],
-            content_disposition=result['attachment_content_disposition'],
-            content_length=result['attachment_content_length'],
-        )
-
-        return PageAttachment(
-            metadata=metadata,
-            data=partial(
-                self._repo.get_object,
-                data_blob_id,
-            ),
-        )
+        return self._load_attachment(self._repo, next(iter(results)))
 
     def attachments(
         self,
@@ -382,12 +748,22 @@ class GitPages(object):
         if tree_id is not None:
             cq = cq & Term(page_kind + '_tree_id', tree_id)
 
-        q = And([
-            NestedChildren(pq, cq),
-            Term('kind', attachment_kind),
-        ])
+        if self._keys:
+            owners = self._search(pq & cq)
+            q = And([
+                Term('kind', attachment_kind),
+                Or([
+                    self._attachment_owner_query(page_kind, owner)
+                    for owner in owners
+                ]) if len(owners) else NullQuery,
+            ])
+        else:
+            q = And([
+                NestedChildren(pq, cq),
+                Term('kind', attachment_kind),
+            ])
 
-        results = self._searcher.search(q)
+        results = self._search(q)
 
         if results.is_empty():
             return []
@@ -408,19 +784,27 @@ class GitPages(object):
             else ('revision', 'revision-attachment')
         )
 
-        pq = (
-            Term('kind', page_kind) if tree_id is None
-            else
-            Term('kind', page_kind) & Term(page_kind + '_tree_id', tree_id)
-        )
-        cq = Term(page_kind + '_path', path)
+        if self._keys:
+            q = And([
+                Term('kind', attachment_kind),
+                Term('attachment_page_path', path),
+            ])
+            if tree_id is not None:
+                q = q & Term('attachment_tree_id', tree_id)
+        else:
+            pq = (
+                Term('kind', page_kind) if tree_id is None
+                else
+                Term('kind', page_kind) & Term(page_kind + '_tree_id', tree_id)
+            )
+            cq = Term(page_kind + '_path', path)
 
-        q = And([
-            NestedChildren(pq, cq),
-            Term('kind', attachment_kind),
-        ])
+            q = And([
+                NestedChildren(pq, cq),
+                Term('kind', attachment_kind),
+            ])
 
-        results = self._searcher.search(q)
+        results = self._search(q)
 
         return (
             self._load_attachment(self._repo, r)
@@ -450,7 +834,7 @@ class GitPages(object):
             )
         )
 
-        results = self._searcher.search_page(
+        results = self._search_page(
             query,
             pagenum=page_number,
             pagelen=page_length,
@@ -486,7 +870,7 @@ class GitPages(object):
             )
         )
 
-        results = self._searcher.search_page(
+        results = self._search_page(
             query,
             pagenum=page_number,
             pagelen=page_length,
@@ -505,7 +889,7 @@ class GitPages(object):
 
         query = Term('kind', 'page') & statuses_query('page', statuses)
 
-        results = self._searcher.search_page(
+        results = self._search_page(
             query,
             page_number,
             page_length,
@@ -518,6 +902,74 @@ class GitPages(object):
             for r in results
         )
 
+    def search(
+            self,
+            query_string: str,
+            page_number: int=1,
+            page_length: int=10,
+            statuses=_default_statuses,
+            field_boosts: Optional[Mapping[str, float]]=None,
+            highlights: int=2,
+    ) -> Tuple[List[SearchHit], ResultsPage]:
+        """
+        Searches the titles and text of the pages visible with `statuses`
+        and returns one page of hits, best first, along with the page of
+        results they came from.
+
+        Matches in each field count as much as `field_boosts` says. Each hit
+        carries up to `highlights` fragments of its text with the matched
+        terms marked, built from the term offsets stored in the index.
+        """
+
+        if field_boosts is None:
+            field_boosts = self._default_field_boosts
+
+        query = search_parser(
+            self._searcher.schema,
+            field_boosts,
+        ).parse(query_string)
+
+        # a constant scoring clause rather than a filter, which whoosh leaves
+        # out when counting the results, so that it adds the same to every
+        # score
+        query = And([
+            query,
+            ConstantScoreQuery(
+                Term('kind', 'page') & statuses_query('page', statuses)
+            ),
+        ])
+
+        results = self._searcher.search_page(
+            query,
+            max(1, page_number),
+            pagelen=page_length,
+            terms=True,
+        )
+
+        results.results.fragmenter = PinpointFragmenter(
+            maxchars=200,
+            surround=40,
+            autotrim=True,
+        )
+        results.results.formatter = HtmlFormatter(
+            tagname='mark',
+            between=u' \u2026 ',
+        )
+
+        hits = [
+            SearchHit(
+                info=self._load_page_info(hit),
+                score=hit.score,
+                highlights=(
+                    hit.highlights('page_text', top=highlights)
+                    if 'page_text' in hit else u''
+                ),
+            )
+            for hit in results
+        ]
+
+        return hits, results
+
     def index(
         self,
         page_number,
@@ -530,6 +982,242 @@ class GitPages(object):
         statuses=_default_statuses,
     ) -> Tuple[Iterable[Page], Iterable[Dict]]:
 
+        query = self._index_query(
+            start_date,
+            end_date,
+            start_date_excl,
+            end_date_excl,
+            statuses,
+        )
+
+        results = self._search_page(
+            query,
+            pagenum=page_number,
+            pagelen=page_length,
+            sortedby='page_date',
+            reverse=True,
+        )
+
+        return (
+            self._load_page(r)
+            for r in results
+        ), results
+
+    def listing(
+        self,
+        after: Optional[ListingCursor]=None,
+        start_date=None,
+        end_date=None,
+        start_date_excl=False,
+        end_date_excl=False,
+        page_length=10,
+        statuses=_default_statuses,
+    ) -> ListingPage:
+        """
+        Lists the `page_length` newest pages visible with `statuses`, within
+        the dates given, that come after the cursor `after`.
+
+        Unlike :meth:`index`, which keeps every page of the previous index
+        pages in order to skip them, the pages after the cursor are picked
+        by their dates, so that listing deep into the index sorts and loads
+        no more pages than listing its first page does.
+        """
+
+        query = self._index_query(
+            start_date,
+            end_date,
+            start_date_excl,
+            end_date_excl,
+            statuses,
+        )
+
+        # one page more than asked for tells whether there are more
+        if after is None:
+            results = self._listing_results(query, page_length + 1)
+        else:
+            results = self._listed(
+                self._listing_dates(query, after),
+                page_length + 1,
+            )
+
+        pages = [self._load_page(r) for r in results[:page_length]]
+
+        return ListingPage(
+            pages=pages,
+            after=after,
+            next=(
+                ListingCursor.from_info(pages[-1].info)
+                if len(results) > page_length and pages else None
+            ),
+            results_page=ListingResultsPage(
+                partial(self._listing_counts, query, after),
+                page_length,
+            ),
+        )
+
+    def listing_cursor(
+        self,
+        page_number: int,
+        page_length=10,
+        statuses=_default_statuses,
+    ) -> Optional[ListingCursor]:
+        """
+        Returns the cursor that the `page_number`-th page of the listing of
+        every page comes after, or None when there is no such page.
+        """
+
+        if page_number <= 1:
+            return None
+
+        skipped = (page_number - 1) * page_length
+        dates = self._listing_dates(self._index_query(statuses=statuses))
+
+        if len(dates) <= skipped:
+            return None
+
+        # only the pages of the date of the last page skipped are loaded,
+        # not every one before it
+        last = heapq.nlargest(skipped, dates)[-1][0]
+        newer = sum(1 for date, _docnum in dates if date > last)
+        same_date = sorted(
+            (
+                self._searcher.stored_fields(docnum)
+                for date, docnum in dates if date == last
+            ),
+            key=listing_key,
+            reverse=True,
+        )
+
+        return ListingCursor.from_info(
+            self._load_page_info(same_date[skipped - 1 - newer])
+        )
+
+    def _listing_results(self, query, limit: int) -> List:
+        """
+        Returns the first `limit` pages matching `query` in the order of
+        listings.
+
+        The index only sorts pages by date, so the pages of the last date
+        among them, some of which may have been left out, are looked up in
+        full and put in order by their blob ids.
+        """
+
+        results = list(self._search(
+            query,
+            limit=limit,
+            sortedby='page_date',
+            reverse=True,
+        ))
+
+        if results and len(results) == limit:
+
+            last = results[-1]['page_date']
+
+            results = [
+                r for r in results
+                if _wall_time(r['page_date']) != _wall_time(last)
+            ]
+            results.extend(self._search(
+                query & DateRange('page_date', last, last),
+                limit=None,
+            ))
+
+        results.sort(key=listing_key, reverse=True)
+
+        return results[:limit]
+
+    def _listing_dates(
+            self,
+            query,
+            after: Optional[ListingCursor]=None,
+    ) -> List[Tuple[int, int]]:
+        """
+        Returns the dates of the pages matching `query` that come after the
+        cursor `after`, if given, along with their document numbers.
+
+        The dates are read from the column of page dates as the numbers it
+        keeps, which sort like the dates do. Reading the column is much
+        cheaper than a date range query, which whoosh answers by going
+        through every date indexed in the range.
+        """
+
+        column = self._searcher.reader().column_reader(
+            'page_date',
+            translate=False,
+        )
+
+        dates = [
+            (column[docnum], docnum)
+            for docnum in self._searcher.docs_for_query(query)
+        ]
+
+        if after is None:
+            return dates
+
+        cursor_date = self._searcher.schema['page_date'].to_column_value(
+            after.date
+        )
+
+        return [
+            (date, docnum) for date, docnum in dates
+            if date < cursor_date or (
+                date == cursor_date and
+                self._searcher.stored_fields(docnum)['page_blob_id']
+                < after.blob_id
+            )
+        ]
+
+    def _listing_counts(
+            self,
+            query,
+            after: Optional[ListingCursor],
+    ) -> Tuple[int, int]:
+        """
+        Returns the number of pages matching `query`, and of those that come
+        before the cursor `after`.
+        """
+
+        total = len(self._listing_dates(query))
+
+        if after is None:
+            return total, 0
+
+        return total, total - len(self._listing_dates(query, after))
+
+    def _listed(self, dates: List[Tuple[int, int]], limit: int) -> List:
+        """
+        Returns the stored fields of the first `limit` of the pages with
+        `dates`, as returned by :meth:`_listing_dates`, in the order of
+        listings.
+        """
+
+        top = heapq.nlargest(limit, dates)
+
+        # like the index, the dates alone do not tell the pages of the last
+        # date apart, so all of them are loaded
+        if len(top) == limit:
+            last = top[-1][0]
+            top = [t for t in top if t[0] != last] + [
+                t for t in dates if t[0] == last
+            ]
+
+        results = [
+            self._searcher.stored_fields(docnum)
+            for _date, docnum in top
+        ]
+        results.sort(key=listing_key, reverse=True)
+
+        return results[:limit]
+
+    @staticmethod
+    def _index_query(
+        start_date=None,
+        end_date=None,
+        start_date_excl=False,
+        end_date_excl=False,
+        statuses=_default_statuses,
+    ):
+
         status_clause = statuses_query('page', statuses)
 
         if start_date is None or end_date is None:
@@ -546,34 +1234,134 @@ class GitPages(object):
                 endexcl=bool(end_date_excl),
             )
 
-        results = self._searcher.search_page(
-            Term('kind', 'page') & query,
-            pagenum=page_number,
-            pagelen=page_length,
-            sortedby='page_date',
-            reverse=True,
-        )
-
-        return (
-            self._load_page(r)
-            for r in results
-        ), results
+        return Term('kind', 'page') & query
 
     def teardown(self):
         pass
 
 
-def render_page_content(source: str) -> DocutilsParts:
+_RENDER_SETTINGS = {
+    'initial_header_level': 3,
+    'syntax_highlight': 'short',
+    'smart_quotes': True,
+}
+
+# bump whenever GitPagesWriter output or RenderedPage changes so that cached
+# renderings made by the previous version are no longer used
+_RENDER_WRITER_VERSION = 2
+
+
+@lru_cache(maxsize=None)
+def render_version() -> str:
+    """
+    Identifies the docutils version and settings that pages are rendered
+    with.
+    """
+
+    import docutils
+
+    version = repr((
+        docutils.__version__,
+        sorted(_RENDER_SETTINGS.items()),
+        _RENDER_WRITER_VERSION,
+    ))
+
+    return sha1(version.encode('utf-8')).hexdigest()[:12]
+
+
+def render_cache_key(blob_id: bytes, kind: str='render') -> str:
+    return 'gitpages-%s/%s/%s' % (
+        kind,
+        render_version(),
+        blob_id.decode('ascii'),
+    )
+
+
+def render_page_content(
+        source: str,
+        cache: Optional[BaseCache]=None,
+        blob_id: Optional[bytes]=None,
+) -> RenderedPage:
+    """
+    Renders the reST `source` of a page.
+
+    When a `cache` is given, renderings are stored in it under the git blob
+    id of `source` (computed unless `blob_id` is passed), so that the same
+    page content is only ever rendered once.
+    """
 
-    from docutils.core import publish_parts
+    if cache is None:
+        return _render_page_content(source)
+
+    if blob_id is None:
+        blob_id = Blob.from_string(source.encode('utf-8')).id
+
+    key = render_cache_key(blob_id)
+
+    rendered = cache.get(key)
+
+    if rendered is None:
+        rendered = _render_page_content(source)
+        cache.set(key, rendered, timeout=0)
+
+    return rendered
+
+
+def _render_page_content(source: str) -> RenderedPage:
+    return render_page_doctree(read_page_content(source))
+
+
+def read_page_content(source: str):
+    """
+    Parses the reST `source` of a page to a doctree that
+    :func:`render_page_doctree` can render.
+
+    Smart quotes are left out at this stage so that titles and docinfo
+    read from the doctree keep the characters typed in the source.
+    """
+
+    from docutils.core import publish_doctree
+
+    return publish_doctree(
+        source,
+        settings_overrides=dict(_RENDER_SETTINGS, smart_quotes=False),
+    )
+
+
+def render_page_doctree(doctree) -> RenderedPage:
+    """
+    Renders a doctree returned by :func:`read_page_content` without parsing
+    the source again.
+    """
+
+    from docutils import io
+    from docutils.core import publish_programmatically
+    from docutils.readers.doctree import Reader as DoctreeReader
+    from docutils.transforms.universal import SmartQuotes
     from gitpages.web.rst import GitPagesWriter
 
-    return publish_parts(
-        source=source,
+    doctree.settings.smart_quotes = _RENDER_SETTINGS['smart_quotes']
+    doctree.transformer.add_transform(SmartQuotes)
+    doctree.transformer.apply_transforms()
+
+    _output, publisher = publish_programmatically(
+        source_class=io.DocTreeInput,
+        source=doctree,
+        source_path=None,
+        destination_class=io.StringOutput,
+        destination=None,
+        destination_path=None,
+        reader=DoctreeReader(),
+        reader_name=None,
+        parser=None,
+        parser_name=None,
         writer=GitPagesWriter(),
-        settings_overrides={
-            'initial_header_level': 3,
-            'syntax_highlight': 'short',
-            'smart_quotes': True,
-        },
+        writer_name=None,
+        settings=None,
+        settings_spec=None,
+        settings_overrides=_RENDER_SETTINGS,
+        config_section=None,
+        enable_exit_status=False,
     )
+
+    return RenderedPage.from_parts(publisher.writer.parts)
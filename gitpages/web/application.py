@@ -8,7 +8,11 @@ from flask_failsafe import failsafe
 
 from typogrify.templatetags.jinja_filters import register as register_typogrify
 
-from .converters import GitRefConverter, UuidConverter
+from .converters import (
+    GitRefConverter,
+    ListingCursorConverter,
+    UuidConverter,
+)
 
 
 @failsafe
@@ -30,6 +34,9 @@ def register_gitpages_blueprint(
 
     application.url_map.converters['git_ref'] = GitRefConverter
     application.url_map.converters['uuid'] = UuidConverter
+    application.url_map.converters['listing_cursor'] = (
+        ListingCursorConverter
+    )
 
     register_typogrify(application.jinja_env)
 
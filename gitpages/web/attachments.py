@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import re
+from typing import Dict, Optional
+
+from whoosh.filedb.filestore import Storage
+from whoosh.index import Index
+from whoosh.query import Or, Term
+
+from .api import PageAttachmentMetadata
+
+
+_log = logging.getLogger(__name__)
+
+AttachmentMap = Dict[str, PageAttachmentMetadata]
+
+# bump whenever the entries of the file change shape
+ATTACHMENT_MAP_FORMAT = 1
+
+
+def attachment_map_filename(index_name: str, generation: int) -> str:
+    return '_%s_attachments_%d.json' % (index_name, generation)
+
+
+def write_attachment_map(index: Index) -> int:
+    """
+    Writes the metadata of every attachment in `index` to a file in its
+    storage, keyed by attachment id, and returns the number of attachments.
+
+    The file is named after the generation of the index it was read from,
+    so that it is only ever used along with that generation. Those of
+    previous generations are removed.
+    """
+
+    storage = index.storage
+    kinds = Or([
+        Term('kind', 'page-attachment'),
+        Term('kind', 'revision-attachment'),
+    ])
+
+    with index.searcher() as searcher:
+
+        generation = searcher.reader().generation()
+
+        # attachments are addressed by their tree id, so the metadata of
+        # every document of the same attachment is the same
+        attachments = dict(
+            (
+                hit['attachment_id'],
+                (
+                    hit['attachment_content_type'],
+                    hit['attachment_content_disposition'],
+                    hit['attachment_content_length'],
+                    hit['attachment_data_blob_id'],
+                ),
+            )
+            for hit in searcher.search(kinds, limit=None, scored=False)
+        )
+
+    filename = attachment_map_filename(index.indexname, generation)
+    temp_filename = filename + '.tmp'
+
+    with storage.create_file(temp_filename) as f:
+        f.write(json.dumps(dict(
+            format=ATTACHMENT_MAP_FORMAT,
+            attachments=attachments,
+        )).encode('utf-8'))
+
+    storage.rename_file(temp_filename, filename)
+
+    stale = re.compile(r'^_%s_attachments_[0-9]+\.json$' % index.indexname)
+
+    for name in storage.list():
+        if name != filename and stale.match(name):
+            try:
+                storage.delete_file(name)
+            except OSError:
+                pass
+
+    _log.debug('mapped %d attachments in %s', len(attachments), filename)
+
+    return len(attachments)
+
+
+def read_attachment_map(
+        storage: Storage,
+        index_name: str,
+        generation: Optional[int],
+) -> Optional[AttachmentMap]:
+    """
+    Returns the attachment map written for `generation` of the index named
+    `index_name` in `storage`, or None when there is none.
+
+    An index that has never been committed to has no generation, and so no
+    map either.
+    """
+
+    if generation is None:
+        return None
+
+    filename = attachment_map_filename(index_name, generation)
+
+    if not storage.file_exists(filename):
+        return None
+
+    with storage.open_file(filename) as f:
+        state = json.loads(bytes(f.read()))
+
+    if state.get('format') != ATTACHMENT_MAP_FORMAT:
+        return None
+
+    return dict(
+        (
+            attachment_id,
+            PageAttachmentMetadata(attachment_id, *entry),
+        )
+        for attachment_id, entry in state['attachments'].items()
+    )
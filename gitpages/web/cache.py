@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from collections import OrderedDict
+from hashlib import sha1
+from typing import Any, Dict, List, Optional
+
+from cachelib import BaseCache
+from whoosh.query import Query
+from whoosh.searching import Searcher
+
+
+_log = logging.getLogger(__name__)
+
+
+class LRUCache(BaseCache):
+    """
+    An in-process cache that keeps the `threshold` most recently used
+    values. Values are kept as they are rather than pickled, so they must
+    not be modified once cached.
+    """
+
+    def __init__(self, threshold: int=1024, default_timeout: int=0):
+        super(LRUCache, self).__init__(default_timeout)
+        self._threshold = threshold
+        self._values: 'OrderedDict[str, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+
+        with self._lock:
+            try:
+                self._values.move_to_end(key)
+            except KeyError:
+                return None
+            return self._values[key]
+
+    def set(self, key: str, value: Any, timeout: Optional[int]=None) -> bool:
+
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self._threshold:
+                self._values.popitem(last=False)
+
+        return True
+
+    def add(self, key: str, value: Any, timeout: Optional[int]=None) -> bool:
+
+        with self._lock:
+            if key in self._values:
+                return False
+
+        return self.set(key, value, timeout)
+
+    def delete(self, key: str) -> bool:
+
+        with self._lock:
+            return self._values.pop(key, None) is not None
+
+    def has(self, key: str) -> bool:
+
+        with self._lock:
+            return key in self._values
+
+    def clear(self) -> bool:
+
+        with self._lock:
+            self._values.clear()
+
+        return True
+
+
+class CachedResults(object):
+    """
+    The stored fields of the hits of a search or of one page of a search,
+    detached from the searcher so that they can be cached. Iterating over
+    it and its length behave like whoosh's results.
+    """
+
+    def __init__(
+            self,
+            hits: List[Dict],
+            total: int,
+            pagenum: Optional[int]=None,
+            pagecount: Optional[int]=None,
+            pagelen: Optional[int]=None,
+            offset: Optional[int]=None,
+    ):
+        self.hits = hits
+        self.total = total
+        self.pagenum = pagenum
+        self.pagecount = pagecount
+        self.pagelen = pagelen
+        self.offset = offset
+
+    @classmethod
+    def from_results(cls, results) -> 'CachedResults':
+
+        hits = [hit.fields() for hit in results]
+
+        # pages of results know their place among all of them
+        if hasattr(results, 'pagenum'):
+            return cls(
+                hits,
+                results.total,
+                pagenum=results.pagenum,
+                pagecount=results.pagecount,
+                pagelen=results.pagelen,
+                offset=results.offset,
+            )
+
+        return cls(hits, len(results))
+
+    def __iter__(self):
+        return iter(self.hits)
+
+    def __len__(self) -> int:
+        return self.total
+
+    def is_empty(self) -> bool:
+        return self.total == 0
+
+    def is_last_page(self) -> bool:
+        return self.pagecount == 0 or self.pagenum == self.pagecount
+
+
+class ResultCache(object):
+    """
+    Caches search results in `backend` under the index generation they were
+    read from, so that they are superseded by a rebuild of the index rather
+    than expiring.
+    """
+
+    def __init__(self, backend: BaseCache, prefix: str='gitpages-results'):
+        self.backend = backend
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, generation: str, method: str, query: Query, options: Dict):
+
+        arguments = repr((method, query, sorted(options.items())))
+
+        return '%s/%s/%s' % (
+            self.prefix,
+            generation,
+            sha1(arguments.encode('utf-8')).hexdigest(),
+        )
+
+    def search(
+            self,
+            searcher: Searcher,
+            generation: str,
+            method: str,
+            query: Query,
+            **options
+    ) -> CachedResults:
+        """
+        Returns the results of calling `method` of `searcher` with `query`
+        and `options`, from the cache if they are in it.
+        """
+
+        key = self.key(generation, method, query, options)
+
+        results = self.backend.get(key)
+
+        if results is not None:
+            self.hits += 1
+            return results
+
+        self.misses += 1
+
+        results = CachedResults.from_results(
+            getattr(searcher, method)(query, **options)
+        )
+
+        self.backend.set(key, results, timeout=0)
+
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        return dict(hits=self.hits, misses=self.misses)
+
+
+class ResponseCache(object):
+    """
+    Caches whole responses in `backend` under the index generation they were
+    rendered from and their URL.
+    """
+
+    def __init__(self, backend: BaseCache, prefix: str='gitpages-responses'):
+        self.backend = backend
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, generation: str, url: str) -> str:
+        return '%s/%s/%s' % (
+            self.prefix,
+            generation,
+            sha1(url.encode('utf-8')).hexdigest(),
+        )
+
+    def get(self, key: str) -> Optional[Dict]:
+
+        entry = self.backend.get(key)
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return entry
+
+    def set(self, key: str, status: int, headers: List, body: bytes):
+        self.backend.set(
+            key,
+            dict(status=status, headers=headers, body=body),
+            timeout=0,
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return dict(hits=self.hits, misses=self.misses)
@@ -5,6 +5,8 @@ from uuid import UUID
 
 from werkzeug.routing import BaseConverter
 
+from .api import ListingCursor
+
 
 class GitRefConverter(BaseConverter):
 
@@ -28,3 +30,17 @@ class UuidConverter(BaseConverter):
 
     def to_url(self, value):
         return str(value)
+
+
+class ListingCursorConverter(BaseConverter):
+
+    regex = r'[0-9]{20}-[0-9a-f]{40}'
+
+    def __init__(self, url_map, *args):
+        super(ListingCursorConverter, self).__init__(url_map)
+
+    def to_python(self, value):
+        return ListingCursor.from_token(value)
+
+    def to_url(self, value):
+        return value.to_token()
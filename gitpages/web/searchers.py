@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+from whoosh.fields import Schema
+from whoosh.index import Index
+from whoosh.searching import Searcher
+
+from .attachments import AttachmentMap, read_attachment_map
+
+
+_log = logging.getLogger(__name__)
+
+
+class SearcherPool(object):
+    """
+    Keeps one handle on the index and a pool of searchers for it, shared by
+    every request handled by this process.
+
+    The index is only reopened when the generation published by the index
+    factory changes, and a pooled searcher is only refreshed when the index
+    was committed to since it was opened. Both are checked at most once every
+    `check_interval` seconds.
+    """
+
+    def __init__(
+            self,
+            index_factory: Callable[..., Index],
+            schema: Schema,
+            max_idle: int=8,
+            check_interval: float=1.0,
+    ):
+        self.index_factory = index_factory
+        self.schema = schema
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._index: Optional[Index] = None
+        self._generation = None
+        self._latest = None
+        self._checked = 0.0
+        self._idle: List[Searcher] = []
+        self._attachments_key = None
+        self._attachments: Optional[AttachmentMap] = None
+
+    @property
+    def index(self) -> Index:
+
+        with self._lock:
+            return self._current_index(self._check_due())
+
+    def acquire(self) -> Searcher:
+        """
+        Returns an up to date searcher, which should be handed back with
+        :meth:`release` when the request is done with it.
+        """
+
+        with self._lock:
+
+            check = self._check_due()
+            index = self._current_index(check)
+
+            if check:
+                self._latest = index.latest_generation()
+
+            latest = self._latest
+            searcher = self._idle.pop() if self._idle else None
+
+        if searcher is None:
+            return index.searcher()
+
+        if searcher.reader().generation() != latest:
+            _log.debug('refreshing searcher')
+            searcher = searcher.refresh()
+
+        return searcher
+
+    def release(self, searcher: Searcher):
+
+        with self._lock:
+
+            if (
+                    self._pid == os.getpid() and
+                    # searchers of a previous generation are not reused
+                    searcher._ix is self._index and
+                    len(self._idle) < self.max_idle
+            ):
+                self._idle.append(searcher)
+                return
+
+        searcher.close()
+
+    def generation_key(self, searcher: Searcher) -> str:
+        """
+        Returns a key that changes whenever the index read by `searcher` is
+        rebuilt or committed to.
+        """
+
+        return '%s.%s' % (self._generation, searcher.reader().generation())
+
+    def attachment_map(self, searcher: Searcher) -> Optional[AttachmentMap]:
+        """
+        Returns the attachment map written along with the index read by
+        `searcher`, which is only loaded once for each generation key, or
+        None when the index has none.
+        """
+
+        key = self.generation_key(searcher)
+
+        with self._lock:
+            if key == self._attachments_key:
+                return self._attachments
+
+        generation = searcher.reader().generation()
+
+        # an empty index on disk has not been committed to, so has no
+        # generation to name a map after
+        if generation is None:
+            return None
+
+        index = searcher._ix
+        attachments = read_attachment_map(
+            index.storage,
+            index.indexname,
+            generation,
+        )
+
+        # the index may be committed to before its map is written, so a
+        # missing map is looked for again on the next request
+        if attachments is not None:
+            with self._lock:
+                self._attachments_key = key
+                self._attachments = attachments
+
+        return attachments
+
+    def close(self):
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._index = None
+
+        for searcher in idle:
+            searcher.close()
+
+    def _check_due(self) -> bool:
+
+        now = time.monotonic()
+
+        if now - self._checked < self.check_interval:
+            return False
+
+        self._checked = now
+
+        return True
+
+    def _current_index(self, check: bool) -> Index:
+
+        # handles opened before forking share file offsets with the parent,
+        # so each process opens its own
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._index = None
+            self._idle = []
+
+        if self._index is not None and not check:
+            return self._index
+
+        generation = self._published_generation()
+
+        if self._index is None or generation != self._generation:
+
+            _log.debug('opening index generation %r', generation)
+
+            idle, self._idle = self._idle, []
+            for searcher in idle:
+                searcher.close()
+
+            self._index = self.index_factory(schema=self.schema)
+            self._generation = generation
+
+        return self._index
+
+    def _published_generation(self) -> Optional[int]:
+
+        current_generation = getattr(
+            self.index_factory,
+            'current_generation',
+            None,
+        )
+
+        if current_generation is None:
+            return None
+
+        return current_generation()
@@ -2,28 +2,78 @@
 
 import logging
 from collections.abc import Mapping
+from functools import partial
+from hashlib import sha1
 from datetime import datetime
 from urllib.parse import urljoin
-from typing import Any
+from uuid import uuid4
+from typing import Any, Optional
 from datetime import UTC
 
 from dateutil.relativedelta import relativedelta
 
 from flask import (
-    Blueprint, current_app, g, render_template, request, redirect, url_for
+    Blueprint, Response, current_app, g, render_template, request, redirect,
+    url_for,
 )
+from werkzeug.datastructures import ContentRange
 from werkzeug.exceptions import NotFound
 from feedwerk.atom import AtomFeed, FeedEntry
 
 from .exceptions import PageNotFound, AttachmentNotFound
-from .api import GitPages
-from ..schema import DateRevisionHybrid
+from .api import GitPages, PageSummary, history_entry, render_version
+from .cache import ResponseCache, ResultCache
+from .searchers import SearcherPool
+from ..storage.blobfiles import BlobFileCache, iter_file_data
+from ..storage.objects import CachedRepo, ObjectCache
+from ..schema import INDEX_LAYOUTS
 from ..util import compat, inlineify
 from .. import patches as _
 
 
 _log = logging.getLogger(__name__)
 
+# views whose responses only change when the index does
+_CACHEABLE_ENDPOINTS = frozenset((
+    'index_view',
+    'page_archive_view',
+    'page_archive_view_ref',
+    'daily_archive',
+    'monthly_archive',
+    'yearly_archive',
+    'atom_feed',
+    'search_view',
+))
+
+# views among those above whose responses are not kept in the response
+# cache: every query string would take an entry of its own and push out
+# those of the pages, while the result cache already keeps the searches
+_UNCACHED_RESPONSE_ENDPOINTS = frozenset((
+    'search_view',
+))
+
+# bump whenever templates change what they show of the same pages, so that
+# clients do not keep versions rendered by the previous templates
+_ETAG_VERSION = 4
+
+# set in the WSGI environ of the requests of the static exporter, whose
+# pages leave out what a static site cannot serve, such as searches
+STATIC_EXPORT_ENVIRON_KEY = 'gitpages.static_export'
+
+# requests for more byte ranges than this are answered with the whole
+# attachment rather than as many parts
+_MAX_RANGES = 16
+
+# the headers that hand the sending of a file over to the front-end server,
+# by the value of GITPAGES_SENDFILE
+_SENDFILE_HEADERS = {
+    'x-sendfile': 'X-Sendfile',
+    'x-accel-redirect': 'X-Accel-Redirect',
+}
+
+SEARCH_PAGE_LENGTH = 10
+INDEX_PAGE_LENGTH = 10
+
 
 def create_blueprint() -> Blueprint:
 
@@ -39,6 +89,7 @@ def create_blueprint() -> Blueprint:
         index_view_default_ref,
         defaults={
             'page_number': 1,
+            'after': None,
         },
     )
 
@@ -46,6 +97,24 @@ def create_blueprint() -> Blueprint:
         '/index/page/<int:page_number>/',
         'index_view',
         index_view_default_ref,
+        defaults={
+            'after': None,
+        },
+    )
+
+    gitpages_web_ui.add_url_rule(
+        '/index/after/<listing_cursor:after>/',
+        'index_view',
+        index_view_default_ref,
+        defaults={
+            'page_number': 1,
+        },
+    )
+
+    gitpages_web_ui.add_url_rule(
+        '/search/',
+        'search_view',
+        search_view,
     )
 
     gitpages_web_ui.add_url_rule(
@@ -98,6 +167,24 @@ def create_blueprint() -> Blueprint:
         ) + '/',
         'daily_archive',
         daily_archive_default,
+        defaults={
+            'page_number': 1,
+            'after': None,
+        },
+    )
+    gitpages_web_ui.add_url_rule(
+        '/' + '/'.join(
+            [
+                'archives',
+                '<int(fixed_digits=4):year>',
+                '<int(fixed_digits=2):month>',
+                '<int(fixed_digits=2):day>',
+                'after',
+                '<listing_cursor:after>',
+            ]
+        ) + '/',
+        'daily_archive',
+        daily_archive_default,
         defaults={
             'page_number': 1,
         },
@@ -113,6 +200,23 @@ def create_blueprint() -> Blueprint:
         ) + '/',
         'monthly_archive',
         monthly_archive_default,
+        defaults={
+            'page_number': 1,
+            'after': None,
+        },
+    )
+    gitpages_web_ui.add_url_rule(
+        '/' + '/'.join(
+            [
+                'archives',
+                '<int(fixed_digits=4):year>',
+                '<int(fixed_digits=2):month>',
+                'after',
+                '<listing_cursor:after>',
+            ]
+        ) + '/',
+        'monthly_archive',
+        monthly_archive_default,
         defaults={
             'page_number': 1,
         },
@@ -127,6 +231,22 @@ def create_blueprint() -> Blueprint:
         ) + '/',
         'yearly_archive',
         yearly_archive_default,
+        defaults={
+            'page_number': 1,
+            'after': None,
+        },
+    )
+    gitpages_web_ui.add_url_rule(
+        '/' + '/'.join(
+            [
+                'archives',
+                '<int(fixed_digits=4):year>',
+                'after',
+                '<listing_cursor:after>',
+            ]
+        ) + '/',
+        'yearly_archive',
+        yearly_archive_default,
         defaults={
             'page_number': 1,
         },
@@ -161,7 +281,10 @@ def create_blueprint() -> Blueprint:
         ),
     )
 
+    gitpages_web_ui.context_processor(template_context)
     gitpages_web_ui.before_request(setup_gitpages)
+    gitpages_web_ui.before_request(serve_cached_response)
+    gitpages_web_ui.after_request(finish_response)
     gitpages_web_ui.teardown_request(teardown_gitpages)
 
     return gitpages_web_ui
@@ -177,9 +300,131 @@ class GitPagesConfig:
     def timezone(self):
         return self.cfg['TIMEZONE']
 
+    @property
+    def index_factory(self):
+        return self.cfg['GITPAGES_INDEX']
+
+    @property
+    def schema(self):
+        """
+        The schema of new indexes, laid out as chosen by
+        ``GITPAGES_INDEX_LAYOUT``, which is either ``hybrid``, the default,
+        or ``tables``. Existing indexes keep the layout they were built with.
+        """
+
+        layout = self.cfg.get('GITPAGES_INDEX_LAYOUT', 'hybrid')
+
+        try:
+            return INDEX_LAYOUTS[layout]()
+        except KeyError:
+            raise ValueError('unknown GITPAGES_INDEX_LAYOUT %r' % layout)
+
     @property
     def index(self):
-        return self.cfg['GITPAGES_INDEX'](schema=DateRevisionHybrid())
+        return self.index_factory(schema=self.schema)
+
+    @property
+    def searcher_pool(self) -> SearcherPool:
+        """
+        The searcher pool of this application, created on first use.
+        """
+
+        extensions = current_app.extensions
+
+        pool = extensions.get('gitpages_searchers')
+
+        if pool is None:
+            pool = extensions.setdefault(
+                'gitpages_searchers',
+                SearcherPool(
+                    self.index_factory,
+                    self.schema,
+                    check_interval=self.cfg.get(
+                        'GITPAGES_INDEX_CHECK_INTERVAL',
+                        1.0,
+                    ),
+                ),
+            )
+
+        return pool
+
+    @property
+    def result_cache(self) -> Optional[ResultCache]:
+        """
+        Caches search results in the ``GITPAGES_RESULT_CACHE`` cachelib
+        backend, if one is configured, and counts hits and misses.
+        """
+
+        return self._cache_extension('GITPAGES_RESULT_CACHE', ResultCache)
+
+    @property
+    def response_cache(self) -> Optional[ResponseCache]:
+        """
+        Caches whole responses in the ``GITPAGES_RESPONSE_CACHE`` cachelib
+        backend, if one is configured, and counts hits and misses.
+        """
+
+        return self._cache_extension('GITPAGES_RESPONSE_CACHE', ResponseCache)
+
+    def _cache_extension(self, name, cache_class):
+
+        backend = self.cfg.get(name)
+
+        if backend is None:
+            return None
+
+        extensions = current_app.extensions
+        key = name.lower()
+
+        cache = extensions.get(key)
+
+        if cache is None or cache.backend is not backend:
+            cache = extensions[key] = cache_class(backend)
+
+        return cache
+
+    @property
+    def search_field_boosts(self) -> Optional[Mapping[str, float]]:
+        return self.cfg.get('GITPAGES_SEARCH_FIELD_BOOSTS')
+
+    @property
+    def attachment_cache(self) -> Optional[BlobFileCache]:
+        return self.cfg.get('GITPAGES_ATTACHMENT_CACHE')
+
+    @property
+    def sendfile_header(self) -> Optional[str]:
+        """
+        The header that hands attachments over to the front-end server, as
+        chosen by ``GITPAGES_SENDFILE``, which is either ``x-sendfile`` or
+        ``x-accel-redirect``.
+        """
+
+        sendfile = self.cfg.get('GITPAGES_SENDFILE')
+
+        if not sendfile:
+            return None
+
+        try:
+            return _SENDFILE_HEADERS[sendfile.lower()]
+        except KeyError:
+            raise ValueError('unknown GITPAGES_SENDFILE %r' % sendfile)
+
+    @property
+    def sendfile_prefix(self) -> str:
+        """
+        The URL prefix of the internal location that X-Accel-Redirect
+        responses point into, which must serve the attachment cache
+        directory.
+        """
+
+        return self.cfg.get(
+            'GITPAGES_SENDFILE_PREFIX',
+            '/gitpages-attachments/',
+        )
+
+    @property
+    def render_cache(self):
+        return self.cfg.get('GITPAGES_RENDER_CACHE')
 
     @property
     def allowed_statuses(self):
@@ -191,21 +436,57 @@ class GitPagesConfig:
 
     @property
     def repo(self):
-        return self.cfg['GITPAGES_REPOSITORY']
+        """
+        The configured repository, reading its objects through the object
+        cache of this application unless ``GITPAGES_OBJECT_CACHE_SIZE`` is
+        0 bytes.
+        """
+
+        repo = self.cfg['GITPAGES_REPOSITORY']
+        max_bytes = self.cfg.get('GITPAGES_OBJECT_CACHE_SIZE', 32 << 20)
+
+        if not max_bytes:
+            return repo
+
+        extensions = current_app.extensions
+
+        cached = extensions.get('gitpages_objects')
+
+        # the repository is replaced when it is reopened, but the objects
+        # cached from it still hold
+        if cached is None or cached.repo is not repo:
+            cache = (
+                ObjectCache(max_bytes)
+                if cached is None
+                else cached.object_cache
+            )
+            cached = extensions['gitpages_objects'] = CachedRepo(repo, cache)
+
+        return cached
+
+    @property
+    def object_cache(self) -> Optional[ObjectCache]:
+        return getattr(self.repo, 'object_cache', None)
 
 
 def setup_gitpages():
 
     config = GitPagesConfig()
 
+    searcher_pool = config.searcher_pool
+
     g.repo = config.repo
-    g.index = config.index
+    g.searcher = searcher_pool.acquire()
+    g.index = searcher_pool.index
     g.timezone = config.timezone
     g.utcnow = compat.utcnow()
-    g.searcher = config.index.searcher()
+    g.generation = searcher_pool.generation_key(g.searcher)
     g.gitpages = GitPages(
-        config.repo,
+        g.repo,
         g.searcher,
+        result_cache=config.result_cache,
+        generation=g.generation,
+        attachment_map=searcher_pool.attachment_map(g.searcher),
     )
     g.allowed_statuses = config.allowed_statuses
     g.default_ref = config.default_ref
@@ -215,31 +496,243 @@ def teardown_gitpages(exception=None):
 
     _log.debug('tearing down gitpages')
 
-    gitpages = getattr(g, 'gitpages', None)
-    searcher = getattr(g, 'searcher', None)
+    # teardown may run more than once for the same context
+    gitpages = g.pop('gitpages', None)
+    searcher = g.pop('searcher', None)
 
     if gitpages is not None:
         gitpages.teardown()
 
     if searcher is not None:
-        searcher.close()
+        GitPagesConfig().searcher_pool.release(searcher)
+
+
+def is_static_export() -> bool:
+    return bool(request.environ.get(STATIC_EXPORT_ENVIRON_KEY))
+
+
+def template_context():
+    return dict(static_export=is_static_export())
+
+
+def _endpoint_name() -> str:
+    return (request.endpoint or '').rsplit('.', 1)[-1]
+
+
+def _is_cacheable():
+
+    return (
+        request.method in ('GET', 'HEAD') and
+        _endpoint_name() in _CACHEABLE_ENDPOINTS
+    )
+
+
+def serve_cached_response():
+    """
+    Answers the request from the response cache when it holds a response to
+    the same URL rendered from the same index generation, so that neither
+    the index nor the templates are touched.
+    """
+
+    if not _is_cacheable():
+        return None
+
+    g.response_etag_ids = []
+
+    response_cache = GitPagesConfig().response_cache
+
+    if response_cache is None:
+        return None
+
+    # exported pages differ from those served at the same URLs
+    if is_static_export() or _endpoint_name() in _UNCACHED_RESPONSE_ENDPOINTS:
+        return None
+
+    key = response_cache.key(g.generation, request.url)
+    entry = response_cache.get(key)
+
+    if entry is None:
+        g.response_cache_key = key
+        return None
+
+    # keeps finish_response from handling this response again
+    del g.response_etag_ids
+
+    response = Response(
+        entry['body'],
+        status=entry['status'],
+        headers=entry['headers'],
+    )
+
+    return response.make_conditional(request)
+
+
+def record_etag_ids(*ids):
+    """
+    Records the ids of the blobs and trees that the response is rendered
+    from. The ETag of the response is derived from them.
+    """
+
+    etag_ids = getattr(g, 'response_etag_ids', None)
+
+    if etag_ids is None:
+        return
+
+    for i in ids:
+        if i is None:
+            etag_ids.append('')
+        elif isinstance(i, bytes):
+            etag_ids.append(compat._bytes_to_text(i))
+        else:
+            etag_ids.append(str(i))
+
+
+def not_modified():
+    """
+    Returns a 304 response when the ETag derived from the ids recorded so
+    far is one the client already has, so that the view can skip rendering.
+    """
 
+    etag_ids = getattr(g, 'response_etag_ids', None)
 
-def index_view_default_ref(page_number):
+    if not etag_ids or not request.if_none_match:
+        return None
 
-    return index_view(page_number, g.default_ref)
+    etag = _etag(etag_ids, None)
 
+    if not request.if_none_match.contains(etag):
+        return None
 
-def index_view(page_number, ref):
+    response = Response(status=304)
+    response.set_etag(etag)
 
-    results, results_page = g.gitpages.index(
-        page_number, ref, statuses=g.allowed_statuses
+    return response
+
+
+def finish_response(response):
+    """
+    Gives cacheable responses a strong ETag and a Last-Modified date, adds
+    them to the response cache and answers conditional requests with 304.
+    """
+
+    etag_ids = g.pop('response_etag_ids', None)
+    key = g.pop('response_cache_key', None)
+
+    if etag_ids is None or response.status_code != 200:
+        return response
+
+    if response.direct_passthrough:
+        return response
+
+    response.set_etag(_etag(etag_ids, response))
+    response.last_modified = _last_modified()
+
+    if key is not None:
+        GitPagesConfig().response_cache.set(
+            key,
+            response.status_code,
+            list(response.headers.items()),
+            response.get_data(),
+        )
+
+    return response.make_conditional(request)
+
+
+def _etag(etag_ids, response):
+
+    etag = sha1()
+    etag.update(('%d\n%s\n' % (
+        _ETAG_VERSION,
+        render_version(),
+    )).encode('utf-8'))
+
+    if is_static_export():
+        etag.update(b'static export\n')
+
+    if etag_ids:
+        for etag_id in etag_ids:
+            etag.update(etag_id.encode('utf-8') + b'\n')
+    else:
+        # nothing was recorded, so only the response itself identifies it
+        etag.update(response.get_data())
+
+    return etag.hexdigest()
+
+
+def _last_modified():
+
+    # the time the index was last committed to, which is the same for every
+    # process serving it
+    try:
+        modified = g.index.last_modified()
+    except OSError:
+        modified = -1
+
+    if modified <= 0:
+        return g.utcnow
+
+    return datetime.fromtimestamp(modified, UTC)
+
+
+def index_view_default_ref(page_number, after):
+
+    return index_view(page_number, g.default_ref, after)
+
+
+def index_view(page_number, ref, after):
+
+    # index pages used to be numbered, their URLs now lead to the listing
+    # after the last page of the previous one
+    if page_number > 1:
+
+        cursor = g.gitpages.listing_cursor(
+            page_number,
+            page_length=INDEX_PAGE_LENGTH,
+            statuses=g.allowed_statuses,
+        )
+
+        if cursor is None:
+            raise NotFound()
+
+        return redirect(url_for('.index_view', after=cursor))
+
+    listing = g.gitpages.listing(
+        after,
+        page_length=INDEX_PAGE_LENGTH,
+        statuses=g.allowed_statuses,
     )
 
+    return render_index(listing)
+
+
+def render_index(listing):
+
+    record_etag_ids(
+        listing.after and listing.after.to_token(),
+        listing.next and listing.next.to_token(),
+        *(page.info.blob_id for page in listing.pages)
+    )
+
+    response = not_modified()
+
+    if response is not None:
+        return response
+
+    view_args = request.view_args or {}
+
     return render_template(
         'index.html',
-        index=results,
-        results_page=results_page,
+        index=listing.pages,
+        listing=listing,
+        results_page=listing.results_page,
+        next_url=listing.next and url_for(
+            request.endpoint,
+            **dict(view_args, after=listing.next)
+        ),
+        newest_url=listing.after and url_for(
+            request.endpoint,
+            **dict(view_args, after=None)
+        ),
     )
 
 
@@ -273,62 +766,94 @@ def page_archive_view(year, month, day, slug, tree_id):
         raise NotFound()
 
 
-def daily_archive_default(year, month, day, page_number):
+def daily_archive_default(year, month, day, page_number, after):
 
     return daily_archive(
-        year, month, day, g.default_ref, page_number
+        year, month, day, g.default_ref, page_number, after
     )
 
 
-def daily_archive(year, month, day, ref, page_number):
+def daily_archive(year, month, day, ref, page_number, after):
 
     earliest = datetime(year, month, day, tzinfo=g.timezone)
     latest = earliest + relativedelta(days=1)
 
-    return date_range_index(earliest, latest, ref, page_number)
+    return date_range_index(earliest, latest, ref, page_number, after)
 
 
-def monthly_archive_default(year, month, page_number):
+def monthly_archive_default(year, month, page_number, after):
 
-    return monthly_archive(year, month, g.default_ref, page_number)
+    return monthly_archive(year, month, g.default_ref, page_number, after)
 
 
-def monthly_archive(year, month, ref, page_number):
+def monthly_archive(year, month, ref, page_number, after):
 
     earliest = datetime(year, month, 1, tzinfo=g.timezone)
     latest = earliest + relativedelta(months=1)
 
-    return date_range_index(earliest, latest, ref, page_number)
+    return date_range_index(earliest, latest, ref, page_number, after)
 
 
-def yearly_archive_default(year, page_number):
+def yearly_archive_default(year, page_number, after):
 
-    return yearly_archive(year, g.default_ref, page_number)
+    return yearly_archive(year, g.default_ref, page_number, after)
 
 
-def yearly_archive(year, ref, page_number):
+def yearly_archive(year, ref, page_number, after):
 
     earliest = datetime(year, 1, 1, tzinfo=g.timezone)
     latest = earliest + relativedelta(years=1)
 
-    return date_range_index(earliest, latest, ref, page_number)
+    return date_range_index(earliest, latest, ref, page_number, after)
 
 
-def date_range_index(earliest, latest, ref, page_number):
+def date_range_index(earliest, latest, ref, page_number, after):
 
-    results, results_page = g.gitpages.index(
-        page_number,
-        ref=ref,
+    listing = g.gitpages.listing(
+        after,
         start_date=earliest,
         end_date=latest,
         start_date_excl=False,
         end_date_excl=True,
+        page_length=INDEX_PAGE_LENGTH,
+        statuses=g.allowed_statuses,
+    )
+
+    return render_index(listing)
+
+
+def search_view():
+
+    query_string = request.args.get('q', u'').strip()
+    page_number = request.args.get('page', 1, type=int)
+
+    if not query_string:
+        return render_template('search.html', query_string=query_string)
+
+    hits, results_page = g.gitpages.search(
+        query_string,
+        page_number=page_number,
+        page_length=SEARCH_PAGE_LENGTH,
         statuses=g.allowed_statuses,
+        field_boosts=GitPagesConfig().search_field_boosts,
+    )
+
+    record_etag_ids(
+        query_string,
+        results_page.pagenum,
+        results_page.pagecount,
+        *(hit.info.blob_id for hit in hits)
     )
 
+    response = not_modified()
+
+    if response is not None:
+        return response
+
     return render_template(
-        'index.html',
-        index=results,
+        'search.html',
+        query_string=query_string,
+        hits=hits,
         results_page=results_page,
     )
 
@@ -337,25 +862,211 @@ def attachment(tree_id, inline):
 
     try:
         attachment = g.gitpages.attachment(tree_id)
-        metadata = attachment.metadata
+    except AttachmentNotFound:
+        raise NotFound()
+
+    metadata = attachment.metadata
+    length = metadata.content_length
+    etag = metadata.data_blob_id
+
+    content_disposition = (
+        inlineify(metadata.content_disposition) if inline
+        else metadata.content_disposition
+    )
+
+    headers = {
+        'Content-Disposition': content_disposition,
+        'Accept-Ranges': 'bytes',
+    }
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    config = GitPagesConfig()
+    attachment_cache = config.attachment_cache
+    stream = attachment.stream
+
+    if attachment_cache is not None:
+
+        filename = attachment_cache.add(g.repo, etag)
+        sendfile_header = config.sendfile_header
+
+        if sendfile_header is not None:
+            return _sendfile_response(
+                config,
+                sendfile_header,
+                attachment_cache.path(etag),
+                filename,
+                headers,
+                metadata.content_type,
+                length,
+                etag,
+            )
+
+        stream = partial(iter_file_data, filename)
+
+    ranges = _requested_ranges(length, etag)
+
+    if ranges is None:
+
+        response = Response(
+            _stream_chunks(stream, [(0, length)]),
+            status=200,
+            headers=headers,
+            content_type=metadata.content_type,
+            direct_passthrough=True,
+        )
+        response.content_length = length
+
+    elif not ranges:
+
+        response = Response(status=416, headers=headers)
+        response.headers['Content-Range'] = 'bytes */%d' % length
+
+    elif len(ranges) == 1:
 
-        content_disposition = (
-            inlineify(metadata.content_disposition) if inline
-            else metadata.content_disposition
+        (start, end), = ranges
+
+        response = Response(
+            _stream_chunks(stream, ranges),
+            status=206,
+            headers=headers,
+            content_type=metadata.content_type,
+            direct_passthrough=True,
+        )
+        response.content_range = ContentRange('bytes', start, end, length)
+        response.content_length = end - start
+
+    else:
+
+        boundary = uuid4().hex
+        part_headers = [
+            _multipart_header(
+                boundary,
+                metadata.content_type,
+                start,
+                end,
+                length,
+            )
+            for start, end in ranges
+        ]
+        closing = ('\r\n--%s--\r\n' % boundary).encode('ascii')
+
+        response = Response(
+            _stream_chunks(stream, ranges, part_headers, closing),
+            status=206,
+            headers=headers,
+            content_type='multipart/byteranges; boundary=' + boundary,
+            direct_passthrough=True,
+        )
+        response.content_length = (
+            sum(len(h) for h in part_headers) +
+            sum(end - start for start, end in ranges) +
+            len(closing)
         )
 
-        return (
-            attachment.data().data,
-            200,
-            {
-                'Content-Type': metadata.content_type,
-                'Content-Length': metadata.content_length,
-                'Content-Disposition': content_disposition,
-            },
+    response.set_etag(etag)
+
+    return response
+
+
+def _sendfile_response(
+        config,
+        sendfile_header,
+        path,
+        filename,
+        headers,
+        content_type,
+        length,
+        etag,
+):
+    """
+    Returns an empty response that has the front-end server send the cached
+    file of the attachment, along with any byte ranges requested of it.
+    """
+
+    response = Response(
+        None,
+        status=200,
+        headers=headers,
+        content_type=content_type,
+    )
+
+    if sendfile_header == 'X-Accel-Redirect':
+        response.headers[sendfile_header] = (
+            config.sendfile_prefix.rstrip('/') + '/' + path
         )
+    else:
+        response.headers[sendfile_header] = filename
 
-    except AttachmentNotFound:
-        raise NotFound()
+    response.content_length = length
+    response.set_etag(etag)
+
+    return response
+
+
+def _requested_ranges(length, etag):
+    """
+    Returns the satisfiable byte ranges of the request as (start, end)
+    offsets, or None when the whole attachment should be sent.
+    """
+
+    requested = request.range
+
+    if requested is None or requested.units != 'bytes':
+        return None
+
+    if_range = request.if_range
+
+    # ranges of anything but this very blob are meaningless
+    if (if_range.etag or if_range.date) and if_range.etag != etag:
+        return None
+
+    if len(requested.ranges) > _MAX_RANGES:
+        return None
+
+    ranges = []
+
+    for start, end in requested.ranges:
+
+        if start < 0:
+            start, end = max(0, length + start), length
+        else:
+            end = length if end is None else min(end, length)
+
+        if start < end:
+            ranges.append((start, end))
+
+    return ranges
+
+
+def _multipart_header(boundary, content_type, start, end, length):
+    return (
+        '\r\n--%s\r\n'
+        'Content-Type: %s\r\n'
+        'Content-Range: bytes %d-%d/%d\r\n'
+        '\r\n' % (boundary, content_type, start, end - 1, length)
+    ).encode('latin-1')
+
+
+def _stream_chunks(stream, ranges, part_headers=None, closing=b''):
+    """
+    Yields the `ranges` of the data read by `stream`, each preceded by its
+    part header if there are any. Nothing is read until the response body
+    is, so a HEAD request never opens the data.
+    """
+
+    for i, (start, end) in enumerate(ranges):
+
+        if part_headers is not None:
+            yield part_headers[i]
+
+        yield from stream(start, end)
+
+    if closing:
+        yield closing
 
 
 def atom_feed():
@@ -374,17 +1085,26 @@ def atom_feed():
         statuses=g.allowed_statuses,
     )
 
+    results = list(results)
+
+    record_etag_ids(*(page.info.blob_id for page in results))
+
+    response = not_modified()
+
+    if response is not None:
+        return response
+
     for page in results:
 
         doc = page.doc()
 
         utc_date = page.info.date.astimezone(UTC)
-        title = doc['title']
+        title = doc.title
         url = urljoin(request.url_root, page.to_url())
 
         entry = FeedEntry(
             title=title,
-            body=doc['body'],
+            body=doc.body,
             content_type='html',
             url=url,
             updated=utc_date,
@@ -421,6 +1141,51 @@ def page_by_path(path, statuses=None, template=None, context_overrides={}):
 def page_view(page, attachments=[], template=None, context_overrides={}):
 
     doc = page.doc()
+    summary = g.gitpages.page_summary(page.info.path, g.allowed_statuses)
+
+    if summary is None:
+        summary = _search_page_summary(page)
+
+    attachments = list(attachments)
+
+    record_etag_ids(
+        page.info.blob_id,
+        page.info.ref,
+        *[a.metadata.attachment_id for a in attachments] +
+        [p and p.blob_id for p in (summary.page_prev, summary.page_next)] +
+        [p.blob_id for p in summary.recent_pages] +
+        [r['revision_tree_id'] for r in summary.history]
+    )
+
+    response = not_modified()
+
+    if response is not None:
+        return response
+
+    body = doc.body
+    title = doc.title
+
+    return render_template(
+        template or 'page.html',
+        title=title,
+        body=body,
+        page=page,
+        attachments=attachments,
+        page_prev=summary.page_prev,
+        page_next=summary.page_next,
+        page_history=summary.history,
+        page_revision_count=summary.revision_count,
+        recent_pages=summary.recent_pages,
+        **context_overrides
+    )
+
+
+def _search_page_summary(page):
+    """
+    Searches for what the index has no precomputed summary of, such as the
+    neighbors of a page at a path it no longer has.
+    """
+
     older = g.gitpages.older_pages(
         page,
         ref=page.info.ref,
@@ -436,11 +1201,12 @@ def page_view(page, attachments=[], template=None, context_overrides={}):
         statuses=g.allowed_statuses,
     )
 
-    recent_pages = g.gitpages.recent_pages(
+    # a list, since the ETag and the sidebar both go through it
+    recent_pages = list(g.gitpages.recent_pages(
         page_number=1,
         page_length=10,
         statuses=g.allowed_statuses,
-    )
+    ))
 
     history = g.gitpages.history(
         page,
@@ -448,18 +1214,12 @@ def page_view(page, attachments=[], template=None, context_overrides={}):
         statuses=g.allowed_statuses,
     )
 
-    body = doc['body']
-    title = doc['title']
-
-    return render_template(
-        template or 'page.html',
-        title=title,
-        body=body,
-        page=page,
-        attachments=attachments,
+    return PageSummary(
         page_prev=next(iter(older), None),
         page_next=next(iter(newer), None),
-        page_history=history,
         recent_pages=recent_pages,
-        **context_overrides
+        # the same entries that summaries hold, so that templates are given
+        # one kind of history whether or not the page had a summary
+        history=[history_entry(revision) for revision in history],
+        revision_count=history.total,
     )
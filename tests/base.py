@@ -79,14 +79,35 @@ def _add_attachment(store, attachments_tree, filename, metadata, data):
 
     attachments_tree.add(
         filename,
-        0o100755,
+        0o040000,
         attachment_tree.id,
     )
     return attachments_tree
 
 
+def _add_commit(store, tree, message, parents=(), commit_time=1174773719):
+
+    c = Commit()
+    c.tree = tree.id
+    c.parents = list(parents)
+    c.message = message
+    c.committer = b'test committer <test@committer>'
+    c.author = b'test author <test@author>'
+    c.commit_time = commit_time
+    c.author_time = commit_time
+    c.commit_timezone = 0
+    c.author_timezone = 0
+
+    store.add_object(c)
+
+    return c
+
+
 class GitPagesTestcase(unittest.TestCase):
 
+    # the schema, and so the layout, of the index built from the repository
+    schema_class = DateRevisionHybrid
+
     def setUp(self):
         self.setup()
 
@@ -103,7 +124,7 @@ class GitPagesTestcase(unittest.TestCase):
 
         self.teardown()
 
-        index = RamStorage().create_index(DateRevisionHybrid())
+        index = RamStorage().create_index(self.schema_class())
 
         repo = MemoryRepo()
         store = repo.object_store
@@ -135,34 +156,24 @@ class GitPagesTestcase(unittest.TestCase):
             _PAGE_RST, 0o100644, sample_page_with_attachments_rst_blob.id
         )
         sample_page_with_attachments_tree.add(
-            b'attachment', 0o100755, attach_tree.id
+            b'attachment', 0o040000, attach_tree.id
         )
         store.add_object(sample_page_with_attachments_tree)
 
         pages_tree = Tree()
-        pages_tree.add(b'sample-page', 0o100755, sample_page_tree.id)
+        pages_tree.add(b'sample-page', 0o040000, sample_page_tree.id)
         pages_tree.add(
             b'sample-page-with-attachments',
-            0o100755,
+            0o040000,
             sample_page_with_attachments_tree.id,
         )
         store.add_object(pages_tree)
 
         root_tree = Tree()
-        root_tree.add(b'page', 0o100755, pages_tree.id)
+        root_tree.add(b'page', 0o040000, pages_tree.id)
         store.add_object(root_tree)
 
-        c = Commit()
-        c.tree = root_tree.id
-        c.message = b'initial commit'
-        c.committer = b'test committer <test@committer>'
-        c.author = b'test author <test@author>'
-        c.commit_time = 1174773719
-        c.author_time = 1174773719
-        c.commit_timezone = 0
-        c.author_timezone = 0
-
-        store.add_object(c)
+        c = _add_commit(store, root_tree, b'initial commit')
 
         repo.refs[b'refs/heads/master'] = c.id
         repo.refs[b'HEAD'] = c.id
@@ -180,6 +191,7 @@ class GitPagesTestcase(unittest.TestCase):
         self.api = GitPages(repo, searcher)
 
         self.repo = repo
+        self.commit = c
         self.root_tree = root_tree
         self.pages_tree = pages_tree
         self.sample_page_tree = sample_page_tree
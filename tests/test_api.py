@@ -5,6 +5,9 @@ from pytest import raises
 from gitpages.web.exceptions import PageNotFound, AttachmentNotFound
 
 from .base import GitPagesTestcase, _ATTACH_1
+from gitpages.web.api import GitPages, ListingCursor
+from gitpages.web.attachments import read_attachment_map
+from gitpages.schema import DateRevisionTables
 from gitpages.util.compat import _text_to_bytes
 
 from datetime import date
@@ -70,6 +73,47 @@ class APITestCase(GitPagesTestcase):
 
         self.assert_equal([], attachments)
 
+    def test_revision_attachments(self):
+
+        tree_id = self.commit.tree.decode()
+
+        attachments = list(self.api.attachments(
+            date(2012, 12, 12),
+            self.PAGE_WITH_ATTACHMENTS,
+            tree_id,
+        ))
+        by_path = list(self.api.attachments_by_path(
+            self.PAGE_WITH_ATTACHMENTS_PATH,
+            tree_id,
+        ))
+
+        self.assert_equal(
+            [_text_to_bytes(a.filename) for a in attachments],
+            [_ATTACH_1],
+        )
+        self.assert_equal(
+            [a.metadata for a in by_path],
+            [a.metadata for a in attachments],
+        )
+
+    def test_page_revision_and_history(self):
+
+        tree_id = self.commit.tree.decode()
+
+        page = self.api.page(date(2011, 11, 11), self.PAGE, tree_id)
+        history = self.api.history(page, 1)
+
+        self.assert_equal(page.info.ref, tree_id)
+        self.assert_equal(page.doc().title, u'Sample Page')
+        self.assert_equal(
+            [r['revision_tree_id'] for r in history],
+            [tree_id],
+        )
+        self.assert_equal(
+            len(self.api.history(page, 1, statuses=[u'draft'])),
+            0,
+        )
+
     def test_attachment_not_found(self):
 
         fake_tree_id = b'1' * 40
@@ -77,6 +121,37 @@ class APITestCase(GitPagesTestcase):
         with raises(AttachmentNotFound):
             self.api.attachment(fake_tree_id)
 
+    def test_attachment_from_map(self):
+
+        attachment_map = read_attachment_map(
+            self.index.storage,
+            self.index.indexname,
+            self.searcher.reader().generation(),
+        )
+        api = GitPages(
+            self.repo,
+            self.searcher,
+            attachment_map=attachment_map,
+        )
+
+        attachment = next(self.api.attachments(
+            date(2012, 12, 12),
+            self.PAGE_WITH_ATTACHMENTS,
+        ))
+        attachment_id = attachment.metadata.attachment_id
+
+        mapped = api.attachment(attachment_id)
+
+        self.assert_equal(mapped.metadata, attachment.metadata)
+        self.assert_equal(mapped.data().data, attachment.data().data)
+        self.assert_equal(
+            api.attachment(attachment_id.encode('ascii')).metadata,
+            attachment.metadata,
+        )
+
+        with raises(AttachmentNotFound):
+            api.attachment(b'1' * 40)
+
     def test_index(self):
 
         pages, results = self.api.index(1, 'HEAD')
@@ -87,3 +162,104 @@ class APITestCase(GitPagesTestcase):
         self.assert_equal(len(pages_list), 2)
         self.assert_equal(page.info.title, u'Sample Page With Attachments')
         self.assert_equal(page_with_attachments.info.title, u'Sample Page')
+
+    def test_listing(self):
+
+        first = self.api.listing(page_length=1)
+
+        self.assert_equal(
+            [p.info.title for p in first.pages],
+            [u'Sample Page With Attachments'],
+        )
+        self.assert_true(first.after is None)
+        self.assert_equal(
+            first.next,
+            ListingCursor.from_info(first.pages[0].info),
+        )
+
+        second = self.api.listing(first.next, page_length=1)
+
+        self.assert_equal(
+            [p.info.title for p in second.pages],
+            [u'Sample Page'],
+        )
+        self.assert_true(second.next is None)
+
+        self.assert_equal(
+            self.api.listing_cursor(2, page_length=1),
+            first.next,
+        )
+        self.assert_true(self.api.listing_cursor(3, page_length=1) is None)
+
+    def test_listing_results_page(self):
+
+        first = self.api.listing(page_length=1)
+        second = self.api.listing(first.next, page_length=1)
+
+        self.assert_equal(
+            [
+                (r.pagenum, r.pagecount, r.offset, len(r), r.is_last_page())
+                for r in (first.results_page, second.results_page)
+            ],
+            [(1, 2, 0, 2, False), (2, 2, 1, 2, True)],
+        )
+
+    def test_listing_cursor_token(self):
+
+        cursor = self.api.listing(page_length=1).next
+        token = cursor.to_token()
+
+        parsed = ListingCursor.from_token(token)
+
+        self.assert_equal(parsed.blob_id, cursor.blob_id)
+        self.assert_equal(
+            self.api.listing(parsed, page_length=1).pages[0].info.title,
+            u'Sample Page',
+        )
+
+        with raises(ValueError):
+            ListingCursor.from_token(u'2011-' + cursor.blob_id)
+
+    def test_search(self):
+
+        hits, results = self.api.search(u'inline literal')
+
+        self.assert_equal(results.total, 1)
+        self.assert_equal([h.info.path for h in hits], [self.PAGE_PATH])
+        self.assert_true(
+            u'<mark class="match term0">inline</mark>' in hits[0].highlights
+        )
+
+    def test_search_ranks_titles_first(self):
+
+        hits, _results = self.api.search(
+            u'attachments',
+            field_boosts={'page_title': 1.0},
+        )
+
+        self.assert_equal(
+            [h.info.path for h in hits],
+            [self.PAGE_WITH_ATTACHMENTS_PATH],
+        )
+        self.assert_equal(hits[0].highlights, u'')
+
+    def test_search_excludes_other_statuses(self):
+
+        hits, results = self.api.search(u'sample', statuses=[u'draft'])
+
+        self.assert_equal(hits, [])
+        self.assert_equal(results.total, 0)
+
+    def test_page_rendering_keeps_only_served_parts(self):
+
+        page = self.api.page_by_path(self.PAGE_PATH)
+        doc = page.doc()
+
+        self.assert_equal(doc.title, u'Sample Page')
+        self.assert_true(u'This is a sample page.' in doc.body)
+        self.assert_equal(doc._fields, ('title', 'body'))
+
+
+class TablesAPITestCase(APITestCase):
+
+    schema_class = DateRevisionTables
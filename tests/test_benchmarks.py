@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+from benchmarks import bench_indexer, bench_layout
+
+
+def test_when__indexer_benchmark_runs__then__it_reports_every_stage(capsys):
+
+    bench_indexer.main([
+        '--pages', '4',
+        '--commits', '8',
+        '--attachments', '1',
+    ])
+
+    output = capsys.readouterr().out
+
+    for stage in ('find pages', 'history', 'render', 'write'):
+        assert stage in output
+
+
+def test_when__layout_benchmark_runs__then__it_compares_both_layouts(capsys):
+
+    bench_layout.main([
+        '--pages', '4',
+        '--commits', '8',
+        '--sample', '2',
+        '--repeat', '1',
+    ])
+
+    output = capsys.readouterr().out
+
+    assert 'hybrid' in output
+    assert 'tables' in output
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+
+from cachelib import SimpleCache
+from dateutil.tz import tzoffset
+
+from gitpages.web.api import GitPages
+from gitpages.web.cache import LRUCache, ResultCache
+
+from .base import GitPagesTestcase
+
+
+def test_when__lru_cache_is_full__then__least_recently_used_is_evicted():
+
+    cache = LRUCache(threshold=2)
+
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+class ResultCacheTestCase(GitPagesTestcase):
+
+    _date = datetime(2011, 11, 11, tzinfo=tzoffset(None, -8 * 3600))
+
+    def _api(self, result_cache, generation='1'):
+        return GitPages(
+            self.repo,
+            self.searcher,
+            result_cache=result_cache,
+            generation=generation,
+        )
+
+    def _check_cached_page(self, backend):
+
+        result_cache = ResultCache(backend)
+
+        first = self._api(result_cache).page(self._date, u'sample-page')
+        second = self._api(result_cache).page(self._date, u'sample-page')
+        uncached = self.api.page(self._date, u'sample-page')
+
+        self.assert_equal(result_cache.stats(), dict(hits=1, misses=1))
+        self.assert_equal(second.info, uncached.info)
+        self.assert_equal(second.doc(), first.doc())
+        self.assert_equal(second.doc(), uncached.doc())
+
+    def test_when__cached_in_process__then__page_is_read_once(self):
+        self._check_cached_page(LRUCache())
+
+    def test_when__cached_by_cachelib__then__page_is_read_once(self):
+        self._check_cached_page(SimpleCache(default_timeout=0))
+
+    def test_when__generation_changes__then__results_are_read_again(self):
+
+        result_cache = ResultCache(LRUCache())
+
+        self._api(result_cache, generation='1').index(1, None)
+        self._api(result_cache, generation='2').index(1, None)
+
+        self.assert_equal(result_cache.stats(), dict(hits=0, misses=2))
+
+    def test_when__index_is_cached__then__results_page_is_kept(self):
+
+        result_cache = ResultCache(LRUCache())
+
+        self._api(result_cache).index(1, None, page_length=1)
+        pages, results_page = self._api(result_cache).index(
+            1,
+            None,
+            page_length=1,
+        )
+        _pages, uncached = self.api.index(1, None, page_length=1)
+
+        self.assert_equal(
+            [p.info for p in pages],
+            [p.info for p in _pages],
+        )
+        self.assert_equal(
+            (results_page.pagenum, results_page.pagecount, len(results_page)),
+            (uncached.pagenum, uncached.pagecount, len(uncached)),
+        )
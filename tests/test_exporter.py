@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+
+from gitpages import exporter
+from gitpages.web import ui
+
+from dulwich.objects import Blob, Tree
+from whoosh.filedb.filestore import RamStorage
+
+from gitpages.indexer import build_hybrid_index
+from .base import (
+    GitPagesTestcase,
+    _PAGE_RST,
+    _SAMPLE_PAGE_RST,
+    _add_attachment,
+    _add_commit,
+)
+from gitpages.schema import DateRevisionTables
+from .test_ui import create_test_app
+
+
+class ExportStaticTestCase(GitPagesTestcase):
+
+    _page_path = 'archives/2011/11/11/sample-page/index.html'
+
+    def _export(self, **kwargs):
+        return exporter.export_static(self.app, self.destination, **kwargs)
+
+    def setup(self):
+
+        super(ExportStaticTestCase, self).setup()
+
+        self.app = create_test_app(self.index, self.repo)
+        self.destination = tempfile.mkdtemp()
+
+    def teardown(self):
+
+        destination = getattr(self, 'destination', None)
+
+        if destination is not None:
+            shutil.rmtree(destination)
+
+        super(ExportStaticTestCase, self).teardown()
+
+    def test_when__exported__then__pages_and_attachments_are_written(self):
+
+        self._export()
+
+        with open(os.path.join(self.destination, self._page_path)) as f:
+            self.assert_true(u'Sample Page' in f.read())
+
+        with open(os.path.join(
+                self.destination,
+                exporter.MANIFEST_FILENAME,
+        )) as f:
+            manifest = json.load(f)['urls']
+
+        attachments = [
+            url for url in manifest if url.startswith('/attachment/')
+        ]
+        self.assert_equal(len(attachments), 1)
+
+        attachment_path = os.path.join(self.destination, attachments[0][1:])
+
+        with open(attachment_path, 'rb') as f:
+            self.assert_equal(f.read(), b'attach.1 data\n')
+
+    def test_when__listing_has_older_pages__then__they_are_written(self):
+
+        page_length = ui.INDEX_PAGE_LENGTH
+        ui.INDEX_PAGE_LENGTH = 1
+
+        try:
+            self._export()
+        finally:
+            ui.INDEX_PAGE_LENGTH = page_length
+
+        with open(os.path.join(
+                self.destination,
+                exporter.MANIFEST_FILENAME,
+        )) as f:
+            manifest = json.load(f)['urls']
+
+        older, = [url for url in manifest if url.startswith('/index/after/')]
+
+        with open(os.path.join(self.destination, 'index.html')) as f:
+            self.assert_true(older in f.read())
+
+        path = exporter.url_to_path(older)
+
+        with open(os.path.join(self.destination, path)) as f:
+            self.assert_true(u'/archives/2011/11/11/sample-page/' in f.read())
+
+    def test_when__exported__then__search_form_is_left_out(self):
+
+        self._export()
+
+        with open(os.path.join(self.destination, 'index.html')) as f:
+            self.assert_true(u'class="search"' not in f.read())
+
+        with self.app.test_client() as ctx:
+            self.assert_true(b'class="search"' in ctx.get('/').data)
+
+    def test_when__revision_is_hidden__then__its_attachments_are_not_written(
+            self,
+    ):
+
+        store = self.repo.object_store
+
+        # a draft revision of the sample page with an attachment of its own,
+        # which the page no longer has once it is published again
+        draft_blob = Blob.from_string(_SAMPLE_PAGE_RST.replace(
+            b':status: published',
+            b':status: draft',
+        ))
+        store.add_object(draft_blob)
+
+        attachments_tree = _add_attachment(
+            store,
+            Tree(),
+            b'attach.2',
+            b':content-type: text/plain\n',
+            b'attach.2 data\n',
+        )
+        store.add_object(attachments_tree)
+        hidden_attachment_id = attachments_tree[b'attach.2'][1]
+
+        draft_page_tree = Tree()
+        draft_page_tree.add(_PAGE_RST, 0o100644, draft_blob.id)
+        draft_page_tree.add(b'attachment', 0o040000, attachments_tree.id)
+        store.add_object(draft_page_tree)
+
+        draft_pages_tree = self.pages_tree.copy()
+        draft_pages_tree.add(b'sample-page', 0o040000, draft_page_tree.id)
+        store.add_object(draft_pages_tree)
+
+        draft_root_tree = Tree()
+        draft_root_tree.add(b'page', 0o040000, draft_pages_tree.id)
+        store.add_object(draft_root_tree)
+
+        draft = _add_commit(
+            store,
+            draft_root_tree,
+            b'draft',
+            parents=[self.commit.id],
+            commit_time=self.commit.commit_time + 1,
+        )
+        published = _add_commit(
+            store,
+            self.root_tree,
+            b'published again',
+            parents=[draft.id],
+            commit_time=self.commit.commit_time + 2,
+        )
+        self.repo.refs[b'refs/heads/master'] = published.id
+        self.repo.refs[b'HEAD'] = published.id
+
+        index = RamStorage().create_index(self.schema_class())
+        build_hybrid_index(index=index, repo=self.repo, ref=b'HEAD')
+        self.addCleanup(index.close)
+
+        self.app = create_test_app(index, self.repo)
+        self.app.config['GITPAGES_ALLOWED_STATUSES'] = [u'published']
+
+        urls = [url.url for url in exporter.find_urls(self.app)]
+        attachments = [url for url in urls if url.startswith('/attachment/')]
+
+        self.assert_equal(len(attachments), 1)
+        self.assert_true(
+            hidden_attachment_id.decode('ascii') not in attachments[0]
+        )
+        self.assert_true(
+            draft_page_tree.id.decode('ascii') not in u' '.join(urls)
+        )
+
+    def test_when__exported_again__then__unchanged_urls_are_not_written(self):
+
+        first = self._export()
+        second = self._export()
+
+        self.assert_equal(second.written, 0)
+        self.assert_equal(second.unchanged, first.written)
+
+    def test_when__exported_with_jobs__then__files_match_serial_export(self):
+
+        self._export()
+        serial = self._read_files()
+
+        self._export(jobs=2, incremental=False)
+
+        self.assert_equal(self._read_files(), serial)
+
+    def _read_files(self):
+
+        files = {}
+
+        for root, _dirs, names in os.walk(self.destination):
+            for name in names:
+                path = os.path.join(root, name)
+                with open(path, 'rb') as f:
+                    files[path] = f.read()
+
+        return files
+
+
+class TablesExportStaticTestCase(ExportStaticTestCase):
+
+    schema_class = DateRevisionTables
@@ -1,11 +1,20 @@
+from datetime import date
+
 from gitpages import indexer
+from gitpages.web import api
+from gitpages.web.attachments import read_attachment_map
 
+from cachelib import SimpleCache
+from dulwich.objects import Blob, Tree
 from whoosh.index import Index
 from whoosh.fields import Schema
 
 import pytest
 import six
 
+from .base import GitPagesTestcase, _SAMPLE_PAGE_RST, _add_commit
+from gitpages.schema import DateRevisionTables
+
 
 def test_when__directory_is_valid__then__makedirs_quiet_succeeds():
     indexer.makedirs_quiet('.')
@@ -35,3 +44,562 @@ def test_when__directory_is_invalid__then__get_index_raises_oserror():
 
     with pytest.raises(OSError):
         indexer.get_index('', 'index', Schema())
+
+
+def test_when__render_cache_is_given__then__each_blob_is_parsed_once(
+        monkeypatch,
+):
+
+    parsed = []
+    read_page_content = api.read_page_content
+
+    def counting_read_page_content(source):
+        parsed.append(source)
+        return read_page_content(source)
+
+    monkeypatch.setattr(api, 'read_page_content', counting_read_page_content)
+
+    cache = SimpleCache()
+    blob = Blob.from_string(_SAMPLE_PAGE_RST)
+
+    first = indexer.parse_page(blob, cache)
+    second = indexer.parse_page(blob, cache)
+    rendered = api.render_page_content(
+        _SAMPLE_PAGE_RST.decode('utf-8'),
+        cache,
+    )
+
+    assert first == second
+    assert first.rendered == rendered
+    assert len(parsed) == 1
+
+
+def test_when__build_has_many_blobs__then__each_is_parsed_once(
+        monkeypatch,
+):
+
+    parsed = []
+
+    def counting_parse_page(blob, stats=None):
+        parsed.append(blob.id)
+        return indexer.ParsedPage(u'', {}, u'', u'')
+
+    monkeypatch.setattr(indexer, '_parse_page', counting_parse_page)
+
+    blobs = [Blob.from_string(b'page %d\n' % i) for i in range(400)]
+    page_jobs = [
+        indexer.PageJob(
+            path=u'page/%d' % i,
+            page_blob_id=blob.id,
+            page_tree_id=blob.id,
+            revisions=[],
+        )
+        for i, blob in enumerate(blobs)
+    ]
+
+    cache = indexer._build_render_cache(page_jobs)
+
+    for blob in blobs + blobs[:50]:
+        indexer.parse_page(blob, cache)
+
+    assert len(parsed) == len(blobs)
+
+
+def test_when__page_is_parsed__then__rendering_matches_publish_parts():
+
+    from docutils.core import publish_parts
+    from gitpages.web.rst import GitPagesWriter
+
+    source = _SAMPLE_PAGE_RST.decode('utf-8').replace(
+        u'This is a sample page.',
+        u'This is "quoted", isn\'t it?',
+    )
+
+    title, docinfo, text, rendered = indexer.parse_page(Blob.from_string(
+        source.encode('utf-8')
+    ))
+
+    expected = publish_parts(
+        source=source,
+        writer=GitPagesWriter(),
+        settings_overrides=api._RENDER_SETTINGS,
+    )
+
+    assert title == u'Sample Page'
+    assert docinfo['status'] == u'published'
+    assert rendered == api.RenderedPage.from_parts(expected)
+    assert text.startswith(u'This is "quoted", isn\'t it?')
+    assert u'Sample Page' not in text
+    assert u'Fakesworthy' not in text
+
+
+def test_when__no_generation_exists__then__index_generations__is_empty(
+        tmpdir,
+):
+
+    generations = indexer.IndexGenerations(six.text_type(tmpdir.realpath()))
+
+    index = generations(schema=Schema())
+
+    assert isinstance(index, Index)
+    assert index.doc_count() == 0
+    # only builds publish generations
+    assert generations.current_generation() is None
+    assert generations.generations() == []
+
+
+def test_when__generations_are_created__then__each_gets_its_own(tmpdir):
+
+    generations = indexer.IndexGenerations(six.text_type(tmpdir.realpath()))
+
+    first, first_index = generations.create(Schema())
+    second, second_index = generations.create(Schema())
+
+    first_index.close()
+    second_index.close()
+
+    assert (first, second) == (1, 2)
+    assert generations.current_generation() is None
+
+
+def test_when__generation_is_published__then__it_is_served_and_old_cleaned(
+        tmpdir,
+):
+
+    generations = indexer.IndexGenerations(
+        six.text_type(tmpdir.realpath()),
+        keep=2,
+    )
+
+    generation, index = generations.create(Schema())
+    index.close()
+    generations.publish(generation)
+
+    for _ in range(3):
+        generation, index = generations.create(Schema())
+        index.close()
+        assert generations.current_generation() != generation
+        generations.publish(generation)
+        generations.clean()
+
+    assert generations.current_generation() == 4
+    assert generations.generations() == [3, 4]
+
+
+class IncrementalBuildTestCase(GitPagesTestcase):
+
+    def _commit_pages_tree(self, pages_tree, message):
+
+        store = self.repo.object_store
+        store.add_object(pages_tree)
+
+        root_tree = Tree()
+        root_tree.add(b'page', 0o040000, pages_tree.id)
+        store.add_object(root_tree)
+
+        c = _add_commit(
+            store,
+            root_tree,
+            message,
+            parents=[self.commit.id],
+            commit_time=self.commit.commit_time + 60,
+        )
+
+        self.repo.refs[b'HEAD'] = c.id
+
+        return c
+
+    def _rebuild(self):
+
+        self.searcher.close()
+
+        indexer.build_hybrid_index(
+            index=self.index,
+            repo=self.repo,
+            ref=b'HEAD',
+            incremental=True,
+        )
+
+        self.searcher = self.index.searcher()
+
+        return self.searcher
+
+    def _documents(self, searcher, kind):
+        return list(searcher.documents(kind=kind))
+
+    def test_when__built__then__indexed_commit__is_recorded(self):
+
+        self.assert_equal(
+            indexer.get_indexed_commit(self.index, self.repo),
+            self.commit.id,
+        )
+
+    def test_when__page_changes__then__only_that_page_is_rewritten(self):
+
+        store = self.repo.object_store
+
+        blob = Blob.from_string(
+            _SAMPLE_PAGE_RST.replace(b'Sample Page', b'Edited Page')
+        )
+        store.add_object(blob)
+
+        page_tree = Tree()
+        page_tree.add(b'page.rst', 0o100644, blob.id)
+        store.add_object(page_tree)
+
+        pages_tree = Tree()
+        for entry in self.pages_tree.iteritems():
+            pages_tree.add(entry.path, entry.mode, entry.sha)
+        pages_tree.add(b'sample-page', 0o040000, page_tree.id)
+
+        c = self._commit_pages_tree(pages_tree, b'change sample page')
+
+        before = self._documents(self.searcher, 'revision')
+
+        searcher = self._rebuild()
+
+        pages = self._documents(searcher, 'page')
+        revisions = self._documents(searcher, 'revision')
+
+        self.assert_equal(
+            sorted(p['page_title'] for p in pages),
+            [u'Edited Page', u'Sample Page With Attachments'],
+        )
+        self.assert_equal(len(revisions), len(before) + 1)
+        self.assert_equal(
+            len(self._documents(searcher, 'page-attachment')),
+            1,
+        )
+        self.assert_equal(
+            indexer.get_indexed_commit(self.index, self.repo),
+            c.id,
+        )
+
+    def test_when__page_is_removed__then__its_documents_are_deleted(self):
+
+        pages_tree = Tree()
+        for entry in self.pages_tree.iteritems():
+            if entry.path != b'sample-page-with-attachments':
+                pages_tree.add(entry.path, entry.mode, entry.sha)
+
+        self._commit_pages_tree(pages_tree, b'remove page')
+
+        searcher = self._rebuild()
+
+        pages = self._documents(searcher, 'page')
+
+        self.assert_equal([p['page_title'] for p in pages], [u'Sample Page'])
+        self.assert_equal(
+            self._documents(searcher, 'page-attachment'),
+            [],
+        )
+
+    def test_when__page_is_removed__then__attachment_map__is_rewritten(self):
+
+        def attachment_map(searcher):
+            return read_attachment_map(
+                self.index.storage,
+                self.index.indexname,
+                searcher.reader().generation(),
+            )
+
+        first = attachment_map(self.searcher)
+
+        self.assert_equal(
+            sorted(first),
+            sorted(
+                a['attachment_id']
+                for a in self._documents(self.searcher, 'page-attachment')
+            ),
+        )
+
+        pages_tree = Tree()
+        for entry in self.pages_tree.iteritems():
+            if entry.path != b'sample-page-with-attachments':
+                pages_tree.add(entry.path, entry.mode, entry.sha)
+
+        self._commit_pages_tree(pages_tree, b'remove page')
+
+        old_generation = self.searcher.reader().generation()
+        searcher = self._rebuild()
+
+        self.assert_equal(attachment_map(searcher), {})
+        # only the map of the current generation is kept
+        self.assert_true(
+            read_attachment_map(
+                self.index.storage,
+                self.index.indexname,
+                old_generation,
+            ) is None
+        )
+
+    def test_when__page_is_renamed__then__its_history_follows(self):
+
+        pages_tree = Tree()
+        for entry in self.pages_tree.iteritems():
+            name = (
+                b'renamed-page' if entry.path == b'sample-page'
+                else entry.path
+            )
+            pages_tree.add(name, entry.mode, entry.sha)
+
+        c = self._commit_pages_tree(pages_tree, b'rename page')
+
+        searcher = self._rebuild()
+
+        revisions = [
+            r for r in self._documents(searcher, 'revision')
+            if r['revision_title'] == u'Sample Page'
+        ]
+
+        self.assert_equal(
+            sorted(
+                (r['revision_commit_id'], r['revision_path'])
+                for r in revisions
+            ),
+            sorted([
+                (c.id.decode(), u'page/renamed-page/page.rst'),
+                (self.commit.id.decode(), u'page/sample-page/page.rst'),
+            ]),
+        )
+
+
+    def test_when__revisions_share_a_blob__then__it_is_stored_once(self):
+
+        store = self.repo.object_store
+
+        def commit_page(blob, extra=False):
+
+            page_tree = Tree()
+            page_tree.add(b'page.rst', 0o100644, blob.id)
+            if extra:
+                page_tree.add(b'notes.txt', 0o100644, blob.id)
+            store.add_object(page_tree)
+
+            pages_tree = Tree()
+            for entry in self.pages_tree.iteritems():
+                pages_tree.add(entry.path, entry.mode, entry.sha)
+            pages_tree.add(b'sample-page', 0o040000, page_tree.id)
+
+            self.commit = self._commit_pages_tree(pages_tree, b'change')
+
+            return self.commit
+
+        first = self.commit
+        second = commit_page(self.sample_page_rst_blob, extra=True)
+
+        blob = Blob.from_string(
+            _SAMPLE_PAGE_RST.replace(b'Sample Page', b'Edited Page')
+        )
+        store.add_object(blob)
+        third = commit_page(blob)
+
+        searcher = self._rebuild()
+        gitpages = api.GitPages(self.repo, searcher)
+
+        renderings = self._documents(searcher, 'rendered')
+
+        self.assert_equal(
+            [r['rendered_blob_id'] for r in renderings],
+            [self.sample_page_rst_blob.id.decode()],
+        )
+
+        def title(commit):
+            return gitpages.page(
+                date(2011, 11, 11),
+                u'edited-page',
+                commit.tree.decode(),
+            ).doc().title
+
+        self.assert_equal(title(first), u'Sample Page')
+        self.assert_equal(title(second), u'Sample Page')
+        self.assert_equal(title(third), u'Edited Page')
+
+
+class ParallelBuildTestCase(GitPagesTestcase):
+
+    def test_when__built_with_jobs__then__documents_match_serial_build(self):
+
+        from whoosh.filedb.filestore import RamStorage
+        from gitpages.schema import DateRevisionHybrid
+
+        index = RamStorage().create_index(DateRevisionHybrid())
+
+        indexer.build_hybrid_index(
+            index=index,
+            repo=self.repo,
+            ref=b'HEAD',
+            jobs=2,
+        )
+
+        with index.searcher() as searcher:
+            parallel = list(searcher.all_stored_fields())
+
+        serial = list(self.searcher.all_stored_fields())
+
+        self.assert_equal(parallel, serial)
+
+
+class SortableColumnsTestCase(GitPagesTestcase):
+
+    def test_when__built__then__listings_sort_by_columns(self):
+
+        reader = self.searcher.reader()
+
+        self.assert_true(reader.has_column('page_date'))
+        self.assert_true(reader.has_column('revision_commit_time'))
+
+    def test_when__index_predates_columns__then__rebuild_adds_them(self):
+
+        from whoosh.fields import DATETIME
+        from whoosh.filedb.filestore import RamStorage
+        from gitpages.schema import DateRevisionHybrid
+
+        schema = DateRevisionHybrid()
+        schema.remove('page_date')
+        schema.add('page_date', DATETIME(stored=True))
+
+        index = RamStorage().create_index(schema)
+
+        with index.writer() as writer:
+            writer.add_document(kind=u'page', page_title=u'Stale Page')
+
+        # the index records no commit, so the build starts over
+        indexer.build_hybrid_index(
+            index=index,
+            repo=self.repo,
+            incremental=True,
+        )
+
+        with index.searcher() as searcher:
+            self.assert_true(searcher.reader().has_column('page_date'))
+            self.assert_equal(
+                [p['page_title'] for p in searcher.documents(kind='page')],
+                [p['page_title'] for p in self.searcher.documents(kind='page')],
+            )
+
+
+class BuildStatsTestCase(GitPagesTestcase):
+
+    def _build(self, jobs):
+
+        from whoosh.filedb.filestore import RamStorage
+        from gitpages.schema import DateRevisionHybrid
+        from gitpages.util.stats import BuildStats
+
+        stats = BuildStats()
+
+        indexer.build_hybrid_index(
+            index=RamStorage().create_index(DateRevisionHybrid()),
+            repo=self.repo,
+            ref=b'HEAD',
+            jobs=jobs,
+            stats=stats,
+        )
+
+        return stats
+
+    def test_when__built__then__stats__count_documents_written(self):
+
+        stats = self._build(jobs=1)
+        documents = len([
+            d for d in self.searcher.all_stored_fields()
+            if d['kind'] != 'page-summary'
+        ])
+
+        self.assert_equal(stats.counters['documents'], documents)
+        self.assert_equal(stats.counters['pages'], 2)
+        self.assert_true(stats.counters['revisions'] >= 2)
+        self.assert_equal(
+            stats.counters['render cache hits'] +
+            stats.counters['render cache misses'],
+            stats.counters['pages'] + stats.counters['revisions'],
+        )
+        for stage in ('history walk', 'parse rst', 'render', 'commit'):
+            self.assert_true(stats.timers[stage][1] > 0)
+        # the trees of a page are read again for each of its revisions
+        self.assert_true(stats.counters['object cache hits'] > 0)
+        self.assert_true(stats.counters['object cache misses'] > 0)
+        # the page trees are read ahead when the pages are found
+        self.assert_true(stats.counters['preloaded objects'] > 0)
+        self.assert_true(stats.timers['preload'][1] > 0)
+
+    def test_when__built_with_jobs__then__worker_stats__are_merged(self):
+
+        serial = self._build(jobs=1)
+        parallel = self._build(jobs=2)
+
+        self.assert_equal(parallel.counters, serial.counters)
+
+
+class PageSummaryTestCase(GitPagesTestcase):
+
+    _path = u'page/sample-page/page.rst'
+
+    def test_when__built__then__page_summary__matches_searches(self):
+
+        page = self.api.page_by_path(self._path)
+        summary = self.api.page_summary(self._path)
+
+        older = list(self.api.older_pages(page, 1, None, page_length=1))
+        newer = list(self.api.newer_pages(page, 1, None, page_length=1))
+        recent = list(self.api.recent_pages(1, 10))
+        history = self.api.history(page, 1)
+
+        self.assert_equal(summary.page_prev, next(iter(older), None))
+        self.assert_equal(summary.page_next, next(iter(newer), None))
+        self.assert_equal(summary.recent_pages, recent)
+        self.assert_equal(summary.revision_count, len(history))
+        self.assert_equal(
+            [r['revision_tree_id'] for r in summary.history],
+            [r['revision_tree_id'] for r in history],
+        )
+        self.assert_equal(
+            summary.latest_revision['revision_commit_id'],
+            self.commit.id.decode(),
+        )
+
+    def test_when__statuses_were_not_summarized__then__page_summary__is_none(
+            self,
+    ):
+
+        self.assert_equal(
+            self.api.page_summary(self._path, statuses=[u'draft']),
+            None,
+        )
+
+
+class TablesIncrementalBuildTestCase(IncrementalBuildTestCase):
+
+    schema_class = DateRevisionTables
+
+    def test_when__built__then__documents_are_linked_by_keys(self):
+
+        kinds = set(d['kind'] for d in self.searcher.all_stored_fields())
+
+        def owned(path, kind):
+            return [
+                d['kind']
+                for d in self.searcher.documents(owner_path=path, kind=kind)
+            ]
+
+        self.assert_equal(
+            [k for k in kinds if k.endswith('-dummy-child')],
+            [],
+        )
+        self.assert_equal(
+            owned(u'page/sample-page/page.rst', u'revision'),
+            [u'revision'],
+        )
+        self.assert_equal(
+            owned(
+                u'page/sample-page-with-attachments/page.rst',
+                u'page-attachment',
+            ),
+            [u'page-attachment'],
+        )
+
+
+class TablesPageSummaryTestCase(PageSummaryTestCase):
+
+    schema_class = DateRevisionTables
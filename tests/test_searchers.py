@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+from whoosh.fields import ID, Schema
+from whoosh.filedb.filestore import RamStorage
+
+import six
+
+from gitpages.indexer import IndexGenerations
+from gitpages.web.searchers import SearcherPool
+
+
+_SCHEMA = Schema(name=ID(stored=True))
+
+
+def _add(index, name):
+    with index.writer() as writer:
+        writer.add_document(name=name)
+
+
+def _names(searcher):
+    return sorted(d['name'] for d in searcher.all_stored_fields())
+
+
+def test_when__searcher_is_released__then__it_is_reused():
+
+    index = RamStorage().create_index(_SCHEMA)
+    _add(index, u'a')
+
+    pool = SearcherPool(lambda schema: index, _SCHEMA, check_interval=0)
+
+    searcher = pool.acquire()
+    pool.release(searcher)
+
+    assert pool.acquire() is searcher
+
+
+def test_when__index_is_committed__then__searcher_is_refreshed():
+
+    index = RamStorage().create_index(_SCHEMA)
+    _add(index, u'a')
+
+    pool = SearcherPool(lambda schema: index, _SCHEMA, check_interval=0)
+
+    pool.release(pool.acquire())
+    _add(index, u'b')
+
+    assert _names(pool.acquire()) == [u'a', u'b']
+
+
+def test_when__generation_is_published__then__index_is_reopened(tmpdir):
+
+    generations = IndexGenerations(six.text_type(tmpdir.realpath()))
+
+    generation, index = generations.create(_SCHEMA)
+    _add(index, u'old')
+    generations.publish(generation)
+
+    pool = SearcherPool(generations, _SCHEMA, check_interval=0)
+
+    old = pool.acquire()
+
+    generation, index = generations.create(_SCHEMA)
+    _add(index, u'new')
+    generations.publish(generation)
+
+    new = pool.acquire()
+    pool.release(old)
+
+    assert _names(new) == [u'new']
+    assert old.is_closed
+
+
+def test_when__attachment_map_is_written__then__it_is_loaded_once():
+
+    from gitpages.schema import DateRevisionHybrid
+    from gitpages.web.attachments import write_attachment_map
+
+    schema = DateRevisionHybrid()
+    index = RamStorage().create_index(schema)
+
+    with index.writer() as writer:
+        writer.add_document(
+            kind=u'page-attachment',
+            attachment_id=u'a' * 40,
+            attachment_content_type=u'text/plain',
+            attachment_content_disposition=u'attachment; filename=a',
+            attachment_content_length=1,
+            attachment_data_blob_id=u'b' * 40,
+        )
+
+    pool = SearcherPool(lambda schema: index, schema, check_interval=0)
+
+    searcher = pool.acquire()
+
+    # the index was committed to but its map was not written yet
+    assert pool.attachment_map(searcher) is None
+
+    write_attachment_map(index)
+
+    attachment_map = pool.attachment_map(searcher)
+
+    assert attachment_map[u'a' * 40].data_blob_id == u'b' * 40
+    assert pool.attachment_map(searcher) is attachment_map
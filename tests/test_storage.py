@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+
+from dulwich.objects import Blob
+from dulwich.pack import deltify_pack_objects
+from dulwich.repo import MemoryRepo, Repo
+
+import pytest
+import six
+
+from gitpages.storage import blobfiles, objects
+
+
+@pytest.fixture
+def disk_repo(tmpdir):
+
+    repo = Repo.init(six.text_type(tmpdir.join('repo')), mkdir=True)
+    yield repo
+    repo.close()
+
+
+def test_when__object_is_loose__then__get_object_size__reads_header(
+        disk_repo,
+):
+
+    blob = Blob.from_string(b'loose object data\n' * 100)
+    disk_repo.object_store.add_object(blob)
+
+    assert objects.get_object_size(disk_repo, blob.id) == blob.raw_length()
+
+
+def test_when__object_is_packed__then__get_object_size__reads_header(
+        disk_repo,
+):
+
+    base = Blob.from_string(b'packed object data\n' * 5000)
+    delta = Blob.from_string(b'packed object data\n' * 5000 + b'changed\n')
+
+    disk_repo.object_store.add_pack_data(
+        2,
+        deltify_pack_objects(iter([(base, b'data'), (delta, b'data')])),
+    )
+
+    assert objects.get_object_size(disk_repo, base.id) == base.raw_length()
+    assert objects.get_object_size(disk_repo, delta.id) == delta.raw_length()
+
+
+def test_when__repo_is_in_memory__then__get_object_size__loads_object():
+
+    repo = MemoryRepo()
+    blob = Blob.from_string(b'in memory object data\n')
+    repo.object_store.add_object(blob)
+
+    assert objects.get_object_size(repo, blob.id) == blob.raw_length()
+
+
+def test_when__sizes_are_read_by_threads__then__size_cache_stays_sound(
+        monkeypatch,
+):
+
+    import threading
+
+    from collections import OrderedDict
+
+    # sizes read by other tests would be over the limit from the start
+    monkeypatch.setattr(objects, '_sizes', OrderedDict())
+    monkeypatch.setattr(objects, '_SIZES_LIMIT', 8)
+
+    repo = MemoryRepo()
+    blobs = [Blob.from_string(b'%d\n' % i * (i + 1)) for i in range(64)]
+    for blob in blobs:
+        repo.object_store.add_object(blob)
+
+    errors = []
+
+    def read_sizes():
+        try:
+            for _ in range(50):
+                for blob in blobs:
+                    assert objects.get_object_size(repo, blob.id) == (
+                        blob.raw_length()
+                    )
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read_sizes) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(objects._sizes) <= 8
+
+
+def _read(repo, sha, *args, **kwargs):
+    return b''.join(objects.iter_object_data(repo, sha, *args, **kwargs))
+
+
+def test_when__object_is_loose__then__iter_object_data__streams_it(
+        disk_repo,
+):
+
+    data = b''.join(b'%06d\n' % i for i in range(10000))
+    blob = Blob.from_string(data)
+    disk_repo.object_store.add_object(blob)
+
+    assert _read(disk_repo, blob.id, chunk_size=1000) == data
+    assert _read(disk_repo, blob.id, 12345, 23456, chunk_size=1000) == (
+        data[12345:23456]
+    )
+
+
+def test_when__object_is_packed__then__iter_object_data__streams_it(
+        disk_repo,
+):
+
+    base_data = b''.join(b'%06d\n' % i for i in range(10000))
+    base = Blob.from_string(base_data)
+    delta = Blob.from_string(base_data + b'changed\n')
+
+    disk_repo.object_store.add_pack_data(
+        2,
+        deltify_pack_objects(iter([(base, b'data'), (delta, b'data')])),
+    )
+
+    assert _read(disk_repo, base.id, chunk_size=1000) == base_data
+    assert _read(disk_repo, base.id, 100, 50000, chunk_size=1000) == (
+        base_data[100:50000]
+    )
+    assert _read(disk_repo, delta.id, 69990) == delta.data[69990:]
+
+
+def test_when__repo_is_in_memory__then__iter_object_data__loads_object():
+
+    repo = MemoryRepo()
+    blob = Blob.from_string(b'in memory object data\n')
+    repo.object_store.add_object(blob)
+
+    assert _read(repo, blob.id, 3, 9) == blob.data[3:9]
+
+
+def test_when__blob_is_added__then__blob_file_cache__holds_its_data(
+        tmpdir,
+):
+
+    repo = MemoryRepo()
+    blob = Blob.from_string(b'cached blob data\n' * 100)
+    repo.object_store.add_object(blob)
+
+    blob_id = blob.id.decode('ascii')
+    cache = blobfiles.BlobFileCache(six.text_type(tmpdir))
+
+    assert cache.get(blob_id) is None
+
+    filename = cache.add(repo, blob_id)
+
+    assert cache.get(blob_id) == filename
+    assert filename == str(tmpdir.join(blob_id[:2], blob_id[2:]))
+    assert b''.join(blobfiles.iter_file_data(filename, 5, 20)) == (
+        blob.data[5:20]
+    )
+
+
+def test_when__max_size_is_exceeded__then__least_recently_used_are_evicted(
+        tmpdir,
+):
+
+    import os
+
+    repo = MemoryRepo()
+    blobs = [Blob.from_string(b'%d' % i * 100) for i in range(4)]
+    for blob in blobs:
+        repo.object_store.add_object(blob)
+
+    blob_ids = [b.id.decode('ascii') for b in blobs]
+    cache = blobfiles.BlobFileCache(six.text_type(tmpdir), max_size=300)
+
+    for i, blob_id in enumerate(blob_ids[:3]):
+        filename = cache.add(repo, blob_id)
+        os.utime(filename, (i, i))
+
+    # the oldest is used again, so the second oldest goes first
+    cache.get(blob_ids[0])
+    cache.add(repo, blob_ids[3])
+
+    cached = [cache.get(blob_id) is not None for blob_id in blob_ids]
+
+    assert cached == [True, False, False, True]
+
+
+def test_when__max_bytes_is_exceeded__then__object_cache__evicts_lru():
+
+    blobs = [Blob.from_string(b'%d' % i * 100) for i in range(3)]
+    cache = objects.ObjectCache(max_bytes=250)
+
+    cache.add(blobs[0].id, blobs[0])
+    cache.add(blobs[1].id, blobs[1])
+    assert cache.get(blobs[0].id) is blobs[0]
+
+    cache.add(blobs[2].id, blobs[2])
+
+    assert cache.get(blobs[1].id) is None
+    assert cache.get(blobs[0].id) is blobs[0]
+    assert cache.get(blobs[2].id) is blobs[2]
+    assert cache.stats() == dict(
+        hits=3,
+        misses=1,
+        evictions=1,
+        objects=2,
+        bytes=200,
+    )
+
+
+def test_when__object_is_too_large__then__object_cache__skips_it():
+
+    blob = Blob.from_string(b'large object data\n' * 100)
+    cache = objects.ObjectCache(max_object_bytes=100)
+
+    cache.add(blob.id, blob)
+
+    assert cache.get(blob.id) is None
+    assert cache.size == 0
+
+
+def test_when__repo_is_cached__then__objects_are_read_once():
+
+    repo = MemoryRepo()
+    blob = Blob.from_string(b'cached object data\n')
+    repo.object_store.add_object(blob)
+
+    cached = objects.CachedRepo(repo, objects.ObjectCache())
+
+    assert cached[blob.id].data == blob.data
+    assert cached.object_store[blob.id] is cached[blob.id]
+    assert cached.get_object(blob.id) is cached[blob.id]
+    assert cached.object_cache.stats()['misses'] == 1
+    assert cached.object_cache.stats()['hits'] == 4
+    assert blob.id in cached.object_store
+    assert _read(cached, blob.id) == blob.data
+
+
+def test_when__objects_are_packed__then__iter_objects__reads_in_pack_order(
+        disk_repo,
+):
+
+    blobs = [Blob.from_string(b'packed object %d\n' % i) for i in range(5)]
+    loose = Blob.from_string(b'loose object data\n')
+
+    disk_repo.object_store.add_objects([(b, None) for b in blobs])
+    disk_repo.object_store.add_object(loose)
+
+    pack, = disk_repo.object_store.packs
+    in_pack_order = sorted(
+        (b.id for b in blobs),
+        key=pack.index.object_offset,
+    )
+
+    read = list(objects.iter_objects(
+        disk_repo,
+        [loose.id] + [b.id for b in reversed(blobs)] + [blobs[0].id],
+    ))
+
+    assert [o.id for o in read] == in_pack_order + [loose.id]
+    assert read[-1].data == loose.data
+
+
+def test_when__repo_is_cached__then__preload_objects__fills_the_cache():
+
+    repo = MemoryRepo()
+    blobs = [Blob.from_string(b'object %d\n' % i) for i in range(3)]
+    for blob in blobs:
+        repo.object_store.add_object(blob)
+
+    cached = objects.CachedRepo(repo, objects.ObjectCache())
+    cached[blobs[0].id]
+
+    assert objects.preload_objects(cached, [b.id for b in blobs]) == 2
+    assert all(b.id in cached.object_cache for b in blobs)
+    assert objects.preload_objects(repo, [b.id for b in blobs]) == 0
@@ -1,37 +1,50 @@
 # -*- coding: utf-8 -*-
 
+import re
+
 import cachelib
 from datetime import UTC
 
+from gitpages.web import ui
 from gitpages.web.application import create
 
-from .base import GitPagesTestcase
+from .base import GitPagesTestcase, _ATTACH_1_DATA
+
+
+def create_test_app(index, repo):
+
+    def get_ram_index(*args, **kwargs):
+        return index
+
+    app = create()
+    app.testing = True
+
+    app.config.update(
+        TIMEZONE=UTC,
+        SITE_TITLE=u'GitPages',
+        GITPAGES_REPOSITORY=repo,
+        GITPAGES_DEFAULT_REF='refs/heads/master',
+        GITPAGES_ALLOWED_STATUSES=[u'published', u'draft'],
+        GITPAGES_INDEX=get_ram_index,
+        CACHE=cachelib.NullCache(),
+        DEBUG=True,
+    )
+
+    return app
 
 
 class UITest(GitPagesTestcase):
 
+    PAGE_URL = b'/archives/2011/11/11/sample-page/'
+    PAGE_WITH_ATTACHMENTS_URL = (
+        b'/archives/2012/12/12/sample-page-with-attachments/'
+    )
+
     def setup(self):
 
         super(UITest, self).setup()
 
-        def get_ram_index(*args, **kwargs):
-            return self.index
-
-        app = create()
-        app.testing = True
-
-        app.config.update(
-            TIMEZONE=UTC,
-            SITE_TITLE=u'GitPages',
-            GITPAGES_REPOSITORY=self.repo,
-            GITPAGES_DEFAULT_REF='refs/heads/master',
-            GITPAGES_ALLOWED_STATUSES=[u'published', u'draft'],
-            GITPAGES_INDEX=get_ram_index,
-            CACHE=cachelib.NullCache(),
-            DEBUG=True,
-        )
-
-        self.app = app
+        self.app = create_test_app(self.index, self.repo)
 
     def teardown(self):
         pass
@@ -49,3 +62,323 @@ class UITest(GitPagesTestcase):
 
             response = ctx.get('/archives/2011/11/11/sample-page/')
             self.assert_equal(response.status_code, 200)
+
+    def test_when__page_has_no_summary__then__recent_pages_are_shown(self):
+
+        # the index only summarizes pages for the published status, so pages
+        # shown with drafts as well are summarized by searching
+        with self.app.test_client() as ctx:
+
+            response = ctx.get('/archives/2011/11/11/sample-page/')
+
+            self.assert_equal(response.status_code, 200)
+            self.assert_true(b'Recent Entries' in response.data)
+            self.assert_true(self.PAGE_WITH_ATTACHMENTS_URL in response.data)
+
+    def test_when__page_has_no_summary__then__history_matches_summary(self):
+
+        from flask import g
+
+        self.app.config['GITPAGES_ALLOWED_STATUSES'] = [u'published']
+
+        with self.app.test_request_context():
+
+            ui.setup_gitpages()
+
+            try:
+                page = g.gitpages.page_by_path(u'page/sample-page/page.rst')
+                summary = g.gitpages.page_summary(
+                    page.info.path,
+                    g.allowed_statuses,
+                )
+                searched = ui._search_page_summary(page)
+            finally:
+                ui.teardown_gitpages()
+
+        self.assert_true(summary.history)
+        self.assert_equal(searched.history, summary.history)
+        self.assert_equal(searched.revision_count, summary.revision_count)
+
+    def test_search(self):
+
+        with self.app.test_client() as ctx:
+
+            response = ctx.get('/search/?q=attachments')
+            self.assert_equal(response.status_code, 200)
+            self.assert_true(
+                b'/archives/2012/12/12/sample-page-with-attachments/'
+                in response.data
+            )
+            self.assert_true(
+                b'/archives/2011/11/11/sample-page/' not in response.data
+            )
+
+    def test_when__search_has_no_hits__then__zero_results_are_shown(self):
+
+        with self.app.test_client() as ctx:
+
+            response = ctx.get('/search/?q=zzzznomatch')
+            self.assert_equal(response.status_code, 200)
+            self.assert_true(b'search-summary' in response.data)
+            self.assert_true(re.search(br'\b0\s+results\b', response.data))
+
+            response = ctx.get('/search/')
+            self.assert_equal(response.status_code, 200)
+            self.assert_true(b'search-summary' not in response.data)
+
+    def test_index(self):
+
+        with self.app.test_client() as ctx:
+
+            response = ctx.get('/')
+            self.assert_equal(response.status_code, 200)
+            self.assert_true(self.PAGE_WITH_ATTACHMENTS_URL in response.data)
+            self.assert_true(self.PAGE_URL in response.data)
+            self.assert_true(b'/after/' not in response.data)
+
+            response = ctx.get('/archives/2012/')
+            self.assert_equal(response.status_code, 200)
+            self.assert_true(self.PAGE_WITH_ATTACHMENTS_URL in response.data)
+            self.assert_true(self.PAGE_URL not in response.data)
+
+    def test_index_after(self):
+
+        page_length = ui.INDEX_PAGE_LENGTH
+        ui.INDEX_PAGE_LENGTH = 1
+
+        try:
+
+            with self.app.test_client() as ctx:
+
+                response = ctx.get('/')
+                self.assert_true(b'/index/after/' in response.data)
+                self.assert_true(self.PAGE_URL not in response.data)
+
+                next_url = response.data.split(b'href="/index/after/')[1]
+                next_url = b'/index/after/' + next_url.split(b'"')[0]
+                cursor = next_url.split(b'/')[-2].decode('ascii')
+
+                response = ctx.get(next_url.decode('ascii'))
+                self.assert_equal(response.status_code, 200)
+                self.assert_true(self.PAGE_URL in response.data)
+                self.assert_true(b'/index/after/' not in response.data)
+
+                response = ctx.get('/index/page/2/')
+                self.assert_equal(response.status_code, 302)
+                self.assert_true(
+                    response.headers['Location'].endswith(
+                        next_url.decode('ascii')
+                    )
+                )
+
+                response = ctx.get('/index/page/3/')
+                self.assert_equal(response.status_code, 404)
+
+                response = ctx.get('/index/after/not-a-cursor/')
+                self.assert_equal(response.status_code, 404)
+
+                response = ctx.get('/archives/2011/after/%s/' % cursor)
+                self.assert_equal(response.status_code, 200)
+                self.assert_true(self.PAGE_URL in response.data)
+                self.assert_true(b'href="/archives/2011/"' in response.data)
+
+        finally:
+            ui.INDEX_PAGE_LENGTH = page_length
+
+    def test_when__etag_matches__then__page_is_not_modified(self):
+
+        with self.app.test_client() as ctx:
+
+            response = ctx.get('/archives/2011/11/11/sample-page/')
+            etag = response.headers['ETag']
+
+            response = ctx.get(
+                '/archives/2011/11/11/sample-page/',
+                headers={'If-None-Match': etag},
+            )
+            self.assert_equal(response.status_code, 304)
+
+    def test_when__response_is_cached__then__it_is_served_from_cache(self):
+
+        from gitpages.web.cache import LRUCache
+
+        self.app.config['GITPAGES_RESPONSE_CACHE'] = LRUCache()
+
+        with self.app.test_client() as ctx:
+
+            first = ctx.get('/archives/2011/11/11/sample-page/')
+            second = ctx.get('/archives/2011/11/11/sample-page/')
+
+            self.assert_equal(second.status_code, 200)
+            self.assert_equal(second.data, first.data)
+            self.assert_equal(
+                second.headers['ETag'],
+                first.headers['ETag'],
+            )
+
+        self.assert_equal(
+            self.app.extensions['gitpages_response_cache'].stats(),
+            dict(hits=1, misses=1),
+        )
+
+
+    def test_when__search_is_made__then__response_is_not_cached(self):
+
+        from gitpages.web.cache import LRUCache
+
+        self.app.config['GITPAGES_RESPONSE_CACHE'] = LRUCache()
+
+        with self.app.test_client() as ctx:
+
+            first = ctx.get('/search/?q=attachments')
+            second = ctx.get('/search/?q=attachments')
+
+            self.assert_equal(second.status_code, 200)
+            self.assert_equal(
+                second.headers['ETag'],
+                first.headers['ETag'],
+            )
+
+        self.assert_equal(
+            self.app.extensions['gitpages_response_cache'].stats(),
+            dict(hits=0, misses=0),
+        )
+
+
+class AttachmentTest(GitPagesTestcase):
+
+    def setup(self):
+
+        super(AttachmentTest, self).setup()
+
+        self.app = create_test_app(self.index, self.repo)
+
+        attachment, = self.api.attachments_by_path(
+            u'page/sample-page-with-attachments/page.rst'
+        )
+
+        self.metadata = attachment.metadata
+        self.url = '/attachment/%s' % self.metadata.attachment_id
+
+    def test_attachment(self):
+
+        with self.app.test_client() as ctx:
+
+            response = ctx.get(self.url)
+
+            self.assert_equal(response.status_code, 200)
+            self.assert_equal(response.data, _ATTACH_1_DATA)
+            self.assert_equal(response.headers['Accept-Ranges'], 'bytes')
+            self.assert_equal(
+                response.headers['ETag'],
+                '"%s"' % self.metadata.data_blob_id,
+            )
+
+            response = ctx.get(
+                self.url,
+                headers={'If-None-Match': response.headers['ETag']},
+            )
+
+            self.assert_equal(response.status_code, 304)
+
+    def test_attachment_range(self):
+
+        with self.app.test_client() as ctx:
+
+            response = ctx.get(self.url, headers={'Range': 'bytes=2-7'})
+
+            self.assert_equal(response.status_code, 206)
+            self.assert_equal(response.data, _ATTACH_1_DATA[2:8])
+            self.assert_equal(
+                response.headers['Content-Range'],
+                'bytes 2-7/%d' % len(_ATTACH_1_DATA),
+            )
+
+            response = ctx.get(self.url, headers={'Range': 'bytes=-5'})
+
+            self.assert_equal(response.status_code, 206)
+            self.assert_equal(response.data, _ATTACH_1_DATA[-5:])
+
+            response = ctx.get(self.url, headers={'Range': 'bytes=100-'})
+
+            self.assert_equal(response.status_code, 416)
+
+    def test_attachment_ranges(self):
+
+        with self.app.test_client() as ctx:
+
+            response = ctx.get(self.url, headers={'Range': 'bytes=0-1, 9-'})
+
+            self.assert_equal(response.status_code, 206)
+            self.assert_equal(response.mimetype, 'multipart/byteranges')
+            self.assert_equal(
+                int(response.headers['Content-Length']),
+                len(response.data),
+            )
+
+            boundary = response.mimetype_params['boundary'].encode('ascii')
+            parts = response.data.split(b'--' + boundary)
+
+            self.assert_equal(len(parts), 4)
+            self.assert_true(parts[1].endswith(b'\r\n\r\nat\r\n'))
+            self.assert_true(parts[2].endswith(b'\r\n\r\ndata\n\r\n'))
+            self.assert_equal(parts[3], b'--\r\n')
+
+    def test_when__attachment_cache_is_set__then__file_is_sent_by_server(self):
+
+        import shutil
+        import tempfile
+
+        from gitpages.storage.blobfiles import BlobFileCache
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        self.app.config.update(
+            GITPAGES_ATTACHMENT_CACHE=BlobFileCache(directory),
+            GITPAGES_SENDFILE='x-accel-redirect',
+        )
+
+        blob_id = self.metadata.data_blob_id
+
+        with self.app.test_client() as ctx:
+
+            response = ctx.get(self.url)
+
+            self.assert_equal(response.status_code, 200)
+            self.assert_equal(response.data, b'')
+            self.assert_equal(
+                response.headers['X-Accel-Redirect'],
+                '/gitpages-attachments/%s/%s' % (blob_id[:2], blob_id[2:]),
+            )
+
+            self.app.config['GITPAGES_SENDFILE'] = None
+
+            response = ctx.get(self.url, headers={'Range': 'bytes=2-7'})
+
+            self.assert_equal(response.status_code, 206)
+            self.assert_equal(response.data, _ATTACH_1_DATA[2:8])
+
+    def test_when__index_on_disk_is_empty__then__attachment_is_not_found(self):
+
+        import shutil
+        import tempfile
+
+        from gitpages.indexer import get_index
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        # an index that was never committed to has no generation
+        index = get_index(directory, 'index', self.schema_class())
+        self.addCleanup(index.close)
+
+        app = create_test_app(index, self.repo)
+
+        with app.test_client() as ctx:
+
+            response = ctx.get(self.url)
+            self.assert_equal(response.status_code, 404)
+
+            response = ctx.get('/')
+            self.assert_equal(response.status_code, 200)